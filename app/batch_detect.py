@@ -0,0 +1,217 @@
+# batch_detect.py
+"""
+Detect hàng loạt không cần giao diện (chạy trên server không có màn hình).
+
+Nhận thư mục, glob hoặc file zip ảnh; decode ảnh song song bằng DecodePool
+(image_utils) thành 1 stream theo thứ tự, chạy model theo batch và ghi kết quả
+ra JSON Lines (mỗi ảnh 1 dòng): đường dẫn, box, class, confidence, food key và
+giá từng món. `--max-side` bật decode thu nhỏ JPEG (box vẫn theo pixel ảnh gốc).
+
+Cách dùng:
+    python batch_detect.py /data/camera/2026-01-30
+    python batch_detect.py "archive/**/*.jpg" --batch-size 16 --workers 4 -o out.jsonl
+    python batch_detect.py night.zip --conf 0.4 --model best.pt
+    python batch_detect.py /data/upload --max-side 1280 --workers 8
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import zipfile
+
+import config
+from image_utils import DecodePool
+from log_utils import setup_logging
+from food_core import CartManager, FoodTable, YOLOModelManager, extract_detections, load_food_data, normalize_food_key
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_sources(inputs):
+    """
+    Liệt kê ảnh từ các đầu vào (thư mục, glob, zip, file ảnh).
+
+    Yields:
+        (path, reader): reader() trả về bytes của ảnh
+    """
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if _is_image(name):
+                        path = os.path.join(root, name)
+                        yield path, _file_reader(path)
+        elif os.path.isfile(item) and zipfile.is_zipfile(item):
+            with zipfile.ZipFile(item) as zf:
+                for name in sorted(zf.namelist()):
+                    if _is_image(name):
+                        # Đọc bytes trên thread chính (ZipFile không an toàn đa luồng), decode ở worker
+                        data = zf.read(name)
+                        yield f"{item}!{name}", (lambda d=data: d)
+        elif os.path.isfile(item):
+            yield item, _file_reader(item)
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                print(f"⚠️ Không tìm thấy ảnh: {item}", file=sys.stderr)
+            for path in matches:
+                if os.path.isfile(path) and _is_image(path):
+                    yield path, _file_reader(path)
+
+
+def _file_reader(path):
+    def read():
+        with open(path, "rb") as f:
+            return f.read()
+    return read
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_decoded_batches(sources, batch_size, workers, max_side=None):
+    """
+    Decode ảnh song song và gom thành batch: pool luôn decode trước ~2 batch
+    trong lúc batch hiện tại đang chạy model (không nạp hết vào bộ nhớ).
+
+    Yields:
+        list (path, image hoặc None, lỗi, factor) của 1 batch
+    """
+    with DecodePool(workers, max_side) as pool:
+        yield from _batched(pool.imap(sources, prefetch=max(batch_size * 2, workers * 2)), batch_size)
+
+
+class BatchDetector:
+    """Chạy detection theo batch và dựng bản ghi JSON cho từng ảnh"""
+
+    def __init__(self, model_manager, food_data, confidence=config.DEFAULT_CONFIDENCE, imgsz=None):
+        self.model_manager = model_manager
+        self.food_data = food_data
+        self.confidence = confidence
+        self.imgsz = imgsz
+        self._normalize = lambda name: normalize_food_key(name, food_data)
+        self.food_table = FoodTable(food_data, model_manager.get_class_names(), self._normalize)
+
+    def detect(self, decoded):
+        """
+        Args:
+            decoded: List (path, image, error, factor) của 1 batch
+
+        Returns:
+            list: Bản ghi kết quả theo thứ tự ảnh
+        """
+        records = [{"path": path, "error": err} for path, img, err, _ in decoded]
+        valid = [i for i, (path, img, err, _) in enumerate(decoded) if img is not None]
+        if not valid:
+            return records
+        results = self.model_manager.detect_batch(
+            [decoded[i][1] for i in valid], confidence=self.confidence, imgsz=self.imgsz
+        )
+        for n, i in enumerate(valid):
+            path, img, _, factor = decoded[i]
+            if results is None:
+                records[i] = {"path": path, "error": "detection failed"}
+            else:
+                records[i] = self._make_record(path, img, results[n], factor)
+        return records
+
+    def _make_record(self, path, img, result, factor=1):
+        detections = extract_detections(result)
+        table = self.food_table
+        for det in detections:
+            if factor != 1:
+                # Ảnh được decode thu nhỏ: đưa box về pixel của ảnh gốc
+                det["box"] = [round(v * factor, 1) for v in det["box"]]
+            cls_id = det["class_id"]
+            in_table = 0 <= cls_id < table.num_classes
+            det["food_key"] = table.food_keys[cls_id] if in_table else det["name"]
+            det["price"] = int(table.price[cls_id]) if in_table else 0
+
+        cart = CartManager.build_cart_from_detections(detections, self.food_data, self._normalize, table)
+        lines = [
+            {
+                "key": item["key"],
+                "name": item["name_vi"],
+                "qty": item["quantity"],
+                "price": item["price"],
+                "line_total": item["price"] * item["quantity"],
+            }
+            for item in cart.values()
+        ]
+        h, w = (side * factor for side in img.shape[:2])
+        return {
+            "path": path,
+            "width": w,
+            "height": h,
+            "detections": detections,
+            "lines": lines,
+            "total_price": sum(line["line_total"] for line in lines),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect món ăn hàng loạt (headless), xuất JSON Lines")
+    parser.add_argument("inputs", nargs="+", help="Thư mục, glob (vd 'imgs/**/*.jpg'), file zip hoặc file ảnh")
+    parser.add_argument("-o", "--output", default="-", help="File .jsonl đầu ra ('-' = stdout)")
+    parser.add_argument("--model", default=config.MODEL_PATH, help="Đường dẫn model .pt")
+    parser.add_argument("--food-data", default=config.FOOD_DATA_FILE, help="File food_36.json")
+    parser.add_argument("--conf", type=float, default=config.DEFAULT_CONFIDENCE, help="Ngưỡng confidence")
+    parser.add_argument("--imgsz", type=int, default=None, help="Kích thước ảnh đầu vào model")
+    parser.add_argument("--batch-size", type=int, default=8, help="Số ảnh mỗi lần gọi model")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Số thread decode ảnh (mặc định số CPU)")
+    parser.add_argument("--max-side", type=int, default=None,
+                        help="Decode JPEG thu nhỏ (1/2..1/8) nhưng cạnh dài vẫn >= giá trị này")
+    args = parser.parse_args(argv)
+
+    # Log ra stderr để stdout chỉ có JSON
+    setup_logging(log_file="")
+    food_data = load_food_data(args.food_data)
+    model_manager = YOLOModelManager(args.model)
+    if not model_manager.is_loaded():
+        print(f"❌ Không load được model: {args.model}", file=sys.stderr)
+        return 2
+
+    detector = BatchDetector(model_manager, food_data, confidence=args.conf, imgsz=args.imgsz)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    images = errors = objects = 0
+    start = time.perf_counter()
+    try:
+        batches = iter_decoded_batches(iter_sources(args.inputs), max(1, args.batch_size), max(1, args.workers),
+                                       args.max_side)
+        for decoded in batches:
+            for record in detector.detect(decoded):
+                images += 1
+                if "error" in record:
+                    errors += 1
+                else:
+                    objects += len(record["detections"])
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    rate = images / elapsed if elapsed > 0 else 0.0
+    print(f"✅ {images} ảnh, {objects} món, {errors} lỗi trong {elapsed:.1f}s ({rate:.1f} ảnh/s)", file=sys.stderr)
+    return 0 if errors == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
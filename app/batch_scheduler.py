@@ -0,0 +1,272 @@
+# batch_scheduler.py
+"""
+Gom các request detection đến gần nhau thành batch.
+
+Request được đưa vào hàng đợi và nhận lại 1 Future. Thread của scheduler
+lấy request đầu tiên, chờ thêm tối đa window_ms (hoặc tới max_batch) rồi
+chạy cả batch 1 lần và trả kết quả về từng Future. Có thống kê độ đầy
+batch (fill ratio), thời gian chờ trong hàng đợi và thời gian chạy batch.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import config
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+class BatchStats:
+    """Thống kê của scheduler (cửa sổ các batch gần nhất cho percentile)"""
+
+    def __init__(self, max_batch, window=1024):
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.full_batches = 0
+        self.errors = 0
+        self._sizes = deque(maxlen=window)
+        self._queue_ms = deque(maxlen=window)
+        self._exec_ms = deque(maxlen=window)
+
+    def record(self, size, queue_ms_list, exec_ms, failed=False):
+        with self._lock:
+            self.requests += size
+            self.batches += 1
+            if size >= self.max_batch:
+                self.full_batches += 1
+            if failed:
+                self.errors += 1
+            self._sizes.append(size)
+            self._queue_ms.extend(queue_ms_list)
+            self._exec_ms.append(exec_ms)
+
+    def snapshot(self):
+        """Dict thống kê: avg_batch, fill_ratio, queue_ms_p50/p95/max, exec_ms_p50/p95"""
+        with self._lock:
+            sizes = list(self._sizes)
+            queue_ms = sorted(self._queue_ms)
+            exec_ms = sorted(self._exec_ms)
+            result = {
+                "requests": self.requests,
+                "batches": self.batches,
+                "full_batches": self.full_batches,
+                "errors": self.errors,
+                "max_batch": self.max_batch,
+            }
+        if sizes:
+            avg = sum(sizes) / len(sizes)
+            result["avg_batch"] = round(avg, 2)
+            result["fill_ratio"] = round(avg / self.max_batch, 3)
+        if queue_ms:
+            result["queue_ms_p50"] = round(_percentile(queue_ms, 0.5), 3)
+            result["queue_ms_p95"] = round(_percentile(queue_ms, 0.95), 3)
+            result["queue_ms_max"] = round(queue_ms[-1], 3)
+        if exec_ms:
+            result["exec_ms_p50"] = round(_percentile(exec_ms, 0.5), 3)
+            result["exec_ms_p95"] = round(_percentile(exec_ms, 0.95), 3)
+        return result
+
+
+class BatchScheduler:
+    """Scheduler chung: run_batch(list item) -> list kết quả cùng thứ tự"""
+
+    def __init__(self, run_batch, window_ms=10, max_batch=8, name="batch-scheduler"):
+        """
+        Args:
+            run_batch: Hàm chạy 1 batch, nhận list item và trả về list kết quả
+            window_ms: Thời gian chờ thêm request sau request đầu tiên của batch
+            max_batch: Số request tối đa mỗi batch
+            name: Tên thread
+        """
+        self.run_batch = run_batch
+        self.window_ms = window_ms
+        self.max_batch = max(1, int(max_batch))
+        self.stats = BatchStats(self.max_batch)
+        self._queue = queue.Queue()
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """
+        Đưa 1 item vào hàng đợi (an toàn khi gọi từ nhiều thread).
+
+        Returns:
+            Future: kết quả của item; sau khi xong có thêm thuộc tính
+            batch_size, queue_ms, exec_ms
+        """
+        if not self._running:
+            raise RuntimeError("BatchScheduler đã dừng")
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def pending(self):
+        """Số request đang chờ trong hàng đợi"""
+        return self._queue.qsize()
+
+    def snapshot(self):
+        return self.stats.snapshot()
+
+    def stop(self, timeout=2.0):
+        """Dừng scheduler; request còn trong hàng đợi bị hủy"""
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)
+        self._thread.join(timeout)
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None:
+                entry[1].cancel()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.window_ms / 1000.0
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                self._running = False
+                break
+            batch.append(entry)
+        return batch
+
+    def _loop(self):
+        while self._running:
+            batch = self._collect()
+            # Bỏ các request đã bị hủy trước khi chạy
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if batch:
+                self._run(batch)
+
+    def _run(self, batch):
+        started = time.perf_counter()
+        queue_ms = [(started - enqueued) * 1000 for _, _, enqueued in batch]
+        try:
+            results = self.run_batch([item for item, _, _ in batch])
+            if results is None or len(results) != len(batch):
+                raise RuntimeError("run_batch trả về sai số lượng kết quả")
+            error = None
+        except Exception as e:
+            results, error = None, e
+        exec_ms = (time.perf_counter() - started) * 1000
+        self.stats.record(len(batch), queue_ms, exec_ms, failed=error is not None)
+
+        for i, (_, future, _) in enumerate(batch):
+            future.batch_size = len(batch)
+            future.queue_ms = queue_ms[i]
+            future.exec_ms = exec_ms
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[i])
+
+
+def _record_stage_timings(results, batch_ms):
+    """
+    Ghi thời gian preprocess/inference/postprocess mỗi ảnh từ result.speed của ultralytics;
+    backend không có speed (remote) thì tính cả batch vào inference
+    """
+    metrics = get_metrics()
+    if not metrics.enabled or not results:
+        return
+    for result in results:
+        speed = getattr(result, "speed", None)
+        if not speed:
+            metrics.observe("inference", batch_ms / len(results))
+            continue
+        for stage in ("preprocess", "inference", "postprocess"):
+            if speed.get(stage) is not None:
+                metrics.observe(stage, speed[stage])
+
+
+class DetectionScheduler:
+    """
+    Scheduler đặt trước model_manager (YOLOModelManager hoặc RemoteDetector).
+    Request cùng ngưỡng confidence trong 1 batch được chạy bằng 1 lần detect_batch.
+    """
+
+    def __init__(self, model_manager, window_ms=None, max_batch=None, name="detect-scheduler"):
+        self.model_manager = model_manager
+        self.scheduler = BatchScheduler(
+            self._run_batch,
+            window_ms=config.DETECT_BATCH_WINDOW_MS if window_ms is None else window_ms,
+            max_batch=config.DETECT_MAX_BATCH if max_batch is None else max_batch,
+            name=name,
+        )
+
+    @property
+    def window_ms(self):
+        return self.scheduler.window_ms
+
+    @property
+    def max_batch(self):
+        return self.scheduler.max_batch
+
+    def _run_batch(self, items):
+        results = [None] * len(items)
+        groups = {}
+        for i, (image, confidence) in enumerate(items):
+            groups.setdefault(confidence, []).append(i)
+        for confidence, indices in groups.items():
+            started = time.perf_counter()
+            batch_results = self.model_manager.detect_batch([items[i][0] for i in indices], confidence)
+            if batch_results is None:
+                raise RuntimeError("Lỗi detection batch")
+            _record_stage_timings(batch_results, (time.perf_counter() - started) * 1000)
+            for i, result in zip(indices, batch_results):
+                results[i] = result
+        metrics = get_metrics()
+        metrics.set_gauge("detect_queue_depth", self.scheduler.pending())
+        pool = getattr(self.model_manager, "input_pool", None)
+        if pool is not None:
+            # Số lần pool cấp phát buffer của nó (không phải mọi cấp phát trong lần gọi model)
+            metrics.set_gauge("input_buffer_allocations", pool.allocations)
+            metrics.set_gauge("input_buffer_frames", pool.frames)
+        return results
+
+    def submit(self, image, confidence=config.DEFAULT_CONFIDENCE):
+        """Gửi 1 ảnh, trả về Future của kết quả YOLO"""
+        future = self.scheduler.submit((image, confidence))
+        get_metrics().set_gauge("detect_queue_depth", self.scheduler.pending())
+        return future
+
+    def detect(self, image, confidence=config.DEFAULT_CONFIDENCE, timeout=None):
+        """Như model_manager.detect: chờ kết quả, trả về None nếu lỗi"""
+        try:
+            return self.submit(image, confidence).result(timeout)
+        except Exception as e:
+            logger.error("❌ Lỗi detection: %s", e)
+            return None
+
+    def pending(self):
+        """Số ảnh đang chờ detect"""
+        return self.scheduler.pending()
+
+    def snapshot(self):
+        return self.scheduler.snapshot()
+
+    def stop(self, timeout=2.0):
+        self.scheduler.stop(timeout)
@@ -0,0 +1,435 @@
+# bench_inference.py
+"""
+Benchmark inference ngoài giao diện trên bộ ảnh cố định.
+
+Chạy model (YOLOModelManager local hoặc RemoteDetector) qua các tổ hợp
+batch size x số thread x kích thước đầu vào, đo ảnh/giây, latency
+p50/p95/p99 mỗi lần gọi, peak RSS, thời gian từng giai đoạn
+(decode, preprocess, forward, NMS, annotate) và bộ nhớ cấp phát mỗi batch
+(tracemalloc, 1 lượt riêng sau lượt đo thời gian). Kết quả ghi ra JSON để so
+sánh giữa các commit. Chạy được trên máy chỉ có CPU, không cần mạng.
+
+Bộ ảnh: thư mục/glob/zip ảnh thật (--images) hoặc ảnh tổng hợp sinh từ
+seed cố định (mặc định). Hash của bộ ảnh được ghi vào kết quả; chỉ so
+sánh các lần chạy có cùng hash.
+
+Cách dùng:
+    python bench_inference.py                                  # 32 ảnh tổng hợp, seed 0
+    python bench_inference.py --images ../val_images --batch-sizes 1,8 --threads 1,4 --imgsz 320,640
+    python bench_inference.py --backend remote --server http://192.168.1.10:8770
+    python bench_inference.py -o after.json --compare before.json
+    python bench_inference.py --zero-copy --imgsz 640 -o zero_copy.json    # InputBufferPool
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+try:
+    import resource  # Không có trên Windows
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+import config
+from batch_detect import iter_sources
+from food_core import YOLOModelManager
+from log_utils import setup_logging
+
+BENCH_RESULTS_DIR = "bench_results"
+STAGES = ("decode", "preprocess", "forward", "nms", "annotate")
+# Tên giai đoạn trong result.speed của ultralytics (ms / ảnh)
+_SPEED_KEYS = {"preprocess": "preprocess", "forward": "inference", "nms": "postprocess"}
+
+
+def synthetic_corpus(count=32, width=1280, height=960, seed=0, quality=90):
+    """
+    Sinh bộ ảnh JPEG giả lập (khay đồ ăn: nền + các đĩa màu), giống nhau với cùng seed
+
+    Returns:
+        list: [(name, jpeg_bytes), ...]
+    """
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for i in range(count):
+        img = np.empty((height, width, 3), dtype=np.uint8)
+        img[:] = rng.integers(90, 200, size=3, dtype=np.uint8)
+        noise = rng.integers(0, 24, size=(height // 8, width // 8, 3), dtype=np.uint8)
+        img += cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR)
+        for _ in range(int(rng.integers(2, 7))):
+            center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            radius = int(rng.integers(min(width, height) // 12, min(width, height) // 5))
+            color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+            cv2.circle(img, center, radius, (235, 235, 235), -1)
+            cv2.circle(img, center, int(radius * 0.8), color, -1)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        corpus.append((f"synthetic_{seed}_{i:04d}.jpg", buf.tobytes()))
+    return corpus
+
+
+def load_corpus(inputs, limit=None):
+    """Đọc bytes ảnh từ thư mục/glob/zip (thứ tự cố định theo tên)"""
+    corpus = []
+    for path, reader in iter_sources(inputs):
+        corpus.append((path, reader()))
+        if limit and len(corpus) >= limit:
+            break
+    return corpus
+
+
+def corpus_hash(corpus):
+    digest = hashlib.sha1()
+    for _, data in corpus:
+        digest.update(data)
+    return digest.hexdigest()[:16]
+
+
+def peak_rss_mb():
+    """Peak RSS của process (MB), None nếu không đo được"""
+    if not HAS_RESOURCE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def set_threads(n):
+    """Đặt số thread cho torch (intra-op) và OpenCV; trả về số thread torch thực tế"""
+    cv2.setNumThreads(n)
+    try:
+        import torch
+    except ImportError:
+        return None
+    torch.set_num_threads(n)
+    return torch.get_num_threads()
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _versions():
+    versions = {"python": platform.python_version(), "numpy": np.__version__, "opencv": cv2.__version__}
+    for name in ("torch", "ultralytics"):
+        module = sys.modules.get(name)
+        if module is not None:
+            versions[name] = getattr(module, "__version__", None)
+    return versions
+
+
+def trace_allocations(model_manager, batches, confidence, imgsz):
+    """
+    Đo bộ nhớ cấp phát thật của mỗi lần detect_batch bằng tracemalloc
+
+    tracemalloc thấy mảng numpy và object Python (ảnh letterbox, mảng batch,
+    kết quả...) nhưng không thấy bộ cấp phát riêng của torch. Chạy riêng
+    sau lượt đo thời gian vì tracemalloc làm chậm.
+
+    Returns:
+        dict: peak_kb (đỉnh cấp phát trong lần gọi) p50/max, retained_kb (còn giữ sau lần gọi) p50
+    """
+    peaks, retained = [], []
+    for batch in batches:
+        decoded = [cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) for _, data in batch]
+        tracemalloc.start()
+        try:
+            results = model_manager.detect_batch(decoded, confidence, imgsz=imgsz)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        if results is None:
+            raise RuntimeError(f"detect_batch lỗi (imgsz={imgsz})")
+        peaks.append(peak / 1024)
+        retained.append(current / 1024)
+        del results
+    peaks.sort()
+    retained.sort()
+    return {
+        "batches": len(peaks),
+        "peak_kb_p50": round(_percentile(peaks, 0.50), 1),
+        "peak_kb_max": round(peaks[-1], 1),
+        "retained_kb_p50": round(_percentile(retained, 0.50), 1),
+    }
+
+
+def run_config(model_manager, corpus, batch_size, imgsz, confidence, repeats=3, warmup=1, annotate=True,
+               trace_alloc=True):
+    """
+    Chạy 1 tổ hợp (batch size, imgsz) trên cả bộ ảnh
+
+    Returns:
+        dict: images_per_sec, latency_ms p50/p95/p99 (mỗi lần gọi model), stage_ms (trung bình / ảnh),
+        alloc (bộ nhớ cấp phát mỗi batch, nếu trace_alloc)
+    """
+    batches = [corpus[i:i + batch_size] for i in range(0, len(corpus), batch_size)]
+    latencies = []
+    stage_totals = dict.fromkeys(STAGES, 0.0)
+    stage_counts = dict.fromkeys(STAGES, 0)
+    images = 0
+    detections = 0
+    elapsed = 0.0
+
+    pool = getattr(model_manager, "input_pool", None)
+    pool_batches = pool.batches if pool is not None else 0
+    for rep in range(warmup + repeats):
+        measured = rep >= warmup
+        for batch in batches:
+            started = time.perf_counter()
+            decoded = [cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) for _, data in batch]
+            decode_s = time.perf_counter() - started
+
+            t0 = time.perf_counter()
+            results = model_manager.detect_batch(decoded, confidence, imgsz=imgsz)
+            call_s = time.perf_counter() - t0
+            if results is None:
+                raise RuntimeError(f"detect_batch lỗi (batch={batch_size}, imgsz={imgsz})")
+
+            annotate_s = 0.0
+            if annotate:
+                t0 = time.perf_counter()
+                for result in results:
+                    result.plot()
+                annotate_s = time.perf_counter() - t0
+            total_s = time.perf_counter() - started
+            if not measured:
+                continue
+
+            elapsed += total_s
+            latencies.append(call_s * 1000)
+            images += len(batch)
+            detections += sum(len(result.boxes) for result in results)
+            stage_totals["decode"] += decode_s * 1000
+            stage_counts["decode"] += len(batch)
+            if annotate:
+                stage_totals["annotate"] += annotate_s * 1000
+                stage_counts["annotate"] += len(batch)
+            speeds = [getattr(result, "speed", None) for result in results]
+            if all(speeds):
+                for stage, key in _SPEED_KEYS.items():
+                    values = [s[key] for s in speeds if s.get(key) is not None]
+                    stage_totals[stage] += sum(values)
+                    stage_counts[stage] += len(values)
+            else:
+                # Backend không tách giai đoạn (ví dụ remote): cả lần gọi tính vào forward
+                stage_totals["forward"] += call_s * 1000
+                stage_counts["forward"] += len(batch)
+
+    latencies.sort()
+    entry = {
+        "batch_size": batch_size,
+        "imgsz": imgsz,
+        "images": images,
+        "detections": detections,
+        "images_per_sec": round(images / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 0.50), 3),
+            "p95": round(_percentile(latencies, 0.95), 3),
+            "p99": round(_percentile(latencies, 0.99), 3),
+            "max": round(latencies[-1], 3),
+        },
+        "stage_ms": {stage: round(stage_totals[stage] / stage_counts[stage], 3)
+                     for stage in stage_totals if stage_counts.get(stage)},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if trace_alloc:
+        entry["alloc"] = trace_allocations(model_manager, batches, confidence, imgsz)
+    if pool is not None and pool.batches > pool_batches:
+        # Chỉ khi tổ hợp này thật sự đi qua buffer cấp sẵn (imgsz khác buffer thì chạy đường thường)
+        entry["input_pool"] = pool.stats()
+    return entry
+
+
+def run_benchmark(model_manager, corpus, batch_sizes, threads, imgsizes, confidence,
+                  repeats=3, warmup=1, annotate=True, trace_alloc=True, log=None):
+    """Chạy toàn bộ lưới tổ hợp, trả về list kết quả"""
+    results = []
+    for n_threads in threads:
+        torch_threads = set_threads(n_threads) if n_threads else None
+        for imgsz in imgsizes:
+            for batch_size in batch_sizes:
+                entry = run_config(model_manager, corpus, batch_size, imgsz, confidence,
+                                   repeats=repeats, warmup=warmup, annotate=annotate, trace_alloc=trace_alloc)
+                entry["threads"] = n_threads
+                entry["torch_threads"] = torch_threads
+                results.append(entry)
+                if log:
+                    log(entry)
+    return results
+
+
+def _config_key(entry):
+    return entry.get("threads"), entry.get("imgsz"), entry.get("batch_size")
+
+
+def compare(previous, current):
+    """In so sánh ảnh/giây và p95 với file kết quả trước"""
+    if previous.get("corpus", {}).get("hash") != current["corpus"]["hash"]:
+        print("⚠️ Bộ ảnh khác nhau, so sánh không chính xác", file=sys.stderr)
+    old = {_config_key(e): e for e in previous.get("results", [])}
+    print(f"\n📊 So sánh với {previous.get('commit')} ({previous.get('created_at')}):", file=sys.stderr)
+    for entry in current["results"]:
+        before = old.get(_config_key(entry))
+        if not before or not before.get("images_per_sec") or not entry.get("images_per_sec"):
+            continue
+        ratio = entry["images_per_sec"] / before["images_per_sec"]
+        print(f"   threads={entry['threads']} imgsz={entry['imgsz']} batch={entry['batch_size']}: "
+              f"{before['images_per_sec']:.1f} → {entry['images_per_sec']:.1f} ảnh/s ({ratio:.2f}x), "
+              f"p95 {before['latency_ms']['p95']:.1f} → {entry['latency_ms']['p95']:.1f} ms",
+              file=sys.stderr)
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _imgsz_list(value):
+    return [None if v.strip() in ("", "0", "default") else int(v) for v in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark inference YOLO trên bộ ảnh cố định")
+    parser.add_argument("--images", nargs="*", help="Thư mục, glob hoặc zip ảnh (mặc định: ảnh tổng hợp)")
+    parser.add_argument("--limit", type=int, default=None, help="Số ảnh tối đa lấy từ --images")
+    parser.add_argument("--synthetic", type=int, default=32, help="Số ảnh tổng hợp")
+    parser.add_argument("--synthetic-size", default="1280x960", help="Kích thước ảnh tổng hợp WxH")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=("local", "remote"), default="local")
+    parser.add_argument("--model", default=config.MODEL_PATH, help="Model .pt cho backend local")
+    parser.add_argument("--server", default=config.INFERENCE_SERVER_URL, help="URL cho backend remote")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 4, 8])
+    parser.add_argument("--threads", type=_int_list, default=[os.cpu_count() or 1],
+                        help="Số thread torch/OpenCV, ví dụ 1,2,4")
+    parser.add_argument("--imgsz", type=_imgsz_list, default=[None],
+                        help="Kích thước đầu vào model, ví dụ 320,640 (0 = mặc định; chỉ backend local)")
+    parser.add_argument("--conf", type=float, default=config.DEFAULT_CONFIDENCE)
+    parser.add_argument("--repeats", type=int, default=3, help="Số lần lặp bộ ảnh được đo")
+    parser.add_argument("--warmup", type=int, default=1, help="Số lần lặp khởi động (không đo)")
+    parser.add_argument("--no-annotate", action="store_true", help="Bỏ giai đoạn result.plot()")
+    parser.add_argument("--no-trace-alloc", action="store_true", help="Bỏ lượt đo cấp phát bằng tracemalloc")
+    parser.add_argument("--zero-copy", action="store_true",
+                        help="Tiền xử lý vào buffer cấp sẵn (InputBufferPool, imgsz đầu tiên hoặc 640); "
+                             "kiểm tra box khớp đường thường trên 3 ảnh đầu trước khi đo")
+    parser.add_argument("-o", "--output", help="File JSON kết quả (mặc định bench_results/inference_<commit>.json)")
+    parser.add_argument("--compare", help="File JSON kết quả trước đó để so sánh")
+    args = parser.parse_args(argv)
+    if args.backend == "remote" and args.zero_copy:
+        # Buffer cấp sẵn nằm trong YOLOModelManager local; server tự tiền xử lý
+        parser.error("--zero-copy chỉ dùng với --backend local")
+    if args.backend == "remote" and any(args.imgsz):
+        # Server luôn chạy kích thước mặc định của nó: mỗi --imgsz chỉ đo lại cùng 1 cấu hình
+        parser.error("--imgsz không áp dụng cho --backend remote (server dùng kích thước mặc định)")
+
+    if args.images:
+        corpus = load_corpus(args.images, args.limit)
+        corpus_info = {"source": args.images}
+    else:
+        width, height = (int(v) for v in args.synthetic_size.lower().split("x"))
+        corpus = synthetic_corpus(args.synthetic, width, height, args.seed)
+        corpus_info = {"source": "synthetic", "seed": args.seed, "size": [width, height]}
+    if not corpus:
+        print("❌ Không có ảnh để benchmark", file=sys.stderr)
+        return 2
+    corpus_info.update({"images": len(corpus), "hash": corpus_hash(corpus),
+                        "bytes": sum(len(data) for _, data in corpus)})
+
+    # Log của model/ultralytics ra stderr để stdout chỉ còn bảng kết quả
+    setup_logging(log_file="")
+    rss_before = peak_rss_mb()
+    t0 = time.perf_counter()
+    if args.backend == "remote":
+        if not args.server:
+            print("❌ Cần --server cho backend remote", file=sys.stderr)
+            return 2
+        from remote_detector import RemoteDetector
+        model_manager = RemoteDetector(args.server, show_errors=False)
+    else:
+        model_manager = YOLOModelManager(args.model, preallocate=args.zero_copy,
+                                         imgsz=args.imgsz[0] or 640, max_batch=max(args.batch_sizes))
+    load_ms = (time.perf_counter() - t0) * 1000
+    if not model_manager.is_loaded():
+        print(f"❌ Không load được model: {model_manager.model_path}", file=sys.stderr)
+        return 2
+
+    print(f"🏁 {len(corpus)} ảnh ({corpus_info['hash']}), backend {args.backend}, "
+          f"model load {load_ms:.0f} ms", file=sys.stderr)
+
+    zero_copy_check = None
+    if args.zero_copy:
+        # Đường buffer cấp sẵn phải cho cùng box với đường thường trước khi đo tốc độ
+        zero_copy_check = [dict(model_manager.verify_preallocated(
+            cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR), args.conf), image=name)
+            for name, data in corpus[:3]]
+        for check in zero_copy_check:
+            print(f"{'✅' if check['ok'] else '❌'} zero-copy {check['image']}: {check['boxes']}/"
+                  f"{check['reference_boxes']} box, IoU min {check['min_iou']}", file=sys.stderr)
+        if not all(check["ok"] for check in zero_copy_check):
+            print("❌ --zero-copy cho kết quả khác đường thường", file=sys.stderr)
+            return 1
+    print(f"{'threads':>7} {'imgsz':>6} {'batch':>5} {'img/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'rss MB':>7}  stages ms/ảnh")
+
+    def log(entry):
+        stages = " ".join(f"{k}={v:.1f}" for k, v in entry["stage_ms"].items())
+        if "alloc" in entry:
+            stages += f"  alloc/batch={entry['alloc']['peak_kb_p50']:.0f} kB"
+        lat = entry["latency_ms"]
+        print(f"{entry['threads']:>7} {str(entry['imgsz'] or '-'):>6} {entry['batch_size']:>5} "
+              f"{entry['images_per_sec'] or 0:>8.1f} {lat['p50']:>8.1f} {lat['p95']:>8.1f} "
+              f"{lat['p99']:>8.1f} {entry['peak_rss_mb'] or 0:>7.0f}  {stages}", flush=True)
+
+    results = run_benchmark(model_manager, corpus, args.batch_sizes, args.threads, args.imgsz, args.conf,
+                            repeats=args.repeats, warmup=args.warmup, annotate=not args.no_annotate,
+                            trace_alloc=not args.no_trace_alloc, log=log)
+
+    commit = _git_commit()
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "host": {"platform": platform.platform(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "versions": _versions(),
+        "backend": args.backend,
+        "zero_copy": args.zero_copy,
+        "zero_copy_check": zero_copy_check,
+        "model": str(model_manager.model_path),
+        "model_load_ms": round(load_ms, 1),
+        "rss_before_load_mb": rss_before,
+        "confidence": args.conf,
+        "repeats": args.repeats,
+        "warmup": args.warmup,
+        "corpus": corpus_info,
+        "results": results,
+    }
+    output = args.output or os.path.join(BENCH_RESULTS_DIR, f"inference_{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+# bench_ui.py
+"""
+Benchmark đường đi trên giao diện: detect -> giỏ hàng -> màn hình kết quả.
+
+Dựng MainWindow thật (root bị ẩn) với model giả lập trả về detection
+tổng hợp, rồi lặp lại detect_with_loading tới khi màn hình kết quả hiện
+xong. Đo thời gian từng giai đoạn: model, extract_detections,
+ghi lịch sử, panel lịch sử, build_cart_from_detections, dựng màn hình kết
+quả (display_result_screen), layout, cùng chi phí dựng lại (force=True)
+và hiện lại (dùng cache) màn hình kết quả.
+
+Cần display: trên server không có màn hình chạy qua `xvfb-run`, hoặc cài
+pyvirtualdisplay để script tự bật display ảo. Lịch sử được ghi ra thư mục
+tạm, không đụng tới detection_history.json.
+
+Cách dùng:
+    python bench_ui.py                                  # 10 lần, 4 ảnh x 6 món
+    python bench_ui.py --runs 30 --images 8 --detections 12 --infer-ms 40 -o ui.json
+    xvfb-run -a python bench_ui.py
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+try:
+    from pyvirtualdisplay import Display
+    HAS_VIRTUAL_DISPLAY = True
+except ImportError:
+    HAS_VIRTUAL_DISPLAY = False
+
+import config
+from bench_inference import peak_rss_mb, synthetic_corpus
+from food_core import load_food_data
+from log_utils import setup_logging
+from remote_detector import RemoteResult
+
+# Thứ tự in bảng kết quả
+STAGES = ("model", "extract", "history_save", "history_panel", "cart",
+          "result_screen", "layout", "to_detection_done", "end_to_end",
+          "result_rebuild", "result_reshow")
+
+
+class StageTimer:
+    """Gom thời gian (ms) theo giai đoạn, an toàn khi gọi từ nhiều thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, stage, ms):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(ms)
+
+    def wrap(self, func, stage):
+        """Bọc func để mỗi lần gọi được tính vào stage"""
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, (time.perf_counter() - t0) * 1000)
+        return timed
+
+    def summary(self):
+        result = {}
+        for stage, values in self.samples.items():
+            values = sorted(values)
+            result[stage] = {
+                "count": len(values),
+                "mean": round(sum(values) / len(values), 3),
+                "p50": round(values[len(values) // 2], 3),
+                "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+                "max": round(values[-1], 3),
+            }
+        return result
+
+
+class SyntheticModelManager:
+    """
+    Model giả lập cùng interface với YOLOModelManager: trả về detection
+    tổng hợp (cố định theo seed) trên các class của food_data.
+    """
+
+    def __init__(self, food_data, detections_per_image=6, infer_ms=0.0, seed=0):
+        self.model_path = "synthetic"
+        self.load_error = None
+        self.names = {i: key for i, key in enumerate(food_data)}
+        self.detections_per_image = detections_per_image
+        self.infer_ms = infer_ms
+        self._rng = np.random.default_rng(seed)
+        self._rng_lock = threading.Lock()
+
+    def load_model(self):
+        return True
+
+    def is_loaded(self):
+        return True
+
+    def get_class_names(self):
+        return dict(self.names)
+
+    def _detections(self, image):
+        h, w = image.shape[:2]
+        with self._rng_lock:
+            classes = self._rng.integers(0, len(self.names), size=self.detections_per_image)
+            confs = self._rng.uniform(0.35, 0.99, size=self.detections_per_image)
+            corners = self._rng.uniform(0, 0.7, size=(self.detections_per_image, 2))
+            sizes = self._rng.uniform(0.1, 0.3, size=(self.detections_per_image, 2))
+        return [{
+            "class_id": int(cls_id),
+            "confidence": float(conf),
+            "box": [float(x * w), float(y * h), float((x + bw) * w), float((y + bh) * h)],
+        } for cls_id, conf, (x, y), (bw, bh) in zip(classes, confs, corners, sizes)]
+
+    def detect_batch(self, images, confidence=config.DEFAULT_CONFIDENCE, imgsz=None):
+        if not images:
+            return None
+        if self.infer_ms:
+            time.sleep(self.infer_ms * len(images) / 1000.0)
+        results = [RemoteResult(img, self._detections(img), self.names) for img in images]
+        for result in results:
+            result.boxes = [box for box in result.boxes if float(box.conf[0]) >= confidence]
+        return results
+
+    def detect(self, image, confidence=config.DEFAULT_CONFIDENCE):
+        results = self.detect_batch([image], confidence)
+        return results[0] if results else None
+
+
+def instrument(app, timer, state):
+    """Bọc các bước của MainWindow bằng timer (gán lên instance, không sửa class)"""
+    import main_window
+
+    main_window.extract_detections = timer.wrap(main_window.extract_detections, "extract")
+    app.model_manager.detect_batch = timer.wrap(app.model_manager.detect_batch, "model")
+    app.history_manager.add_records = timer.wrap(app.history_manager.add_records, "history_save")
+    app.update_history_display = timer.wrap(app.update_history_display, "history_panel")
+
+    build_cart = timer.wrap(app.build_cart_from_detections, "cart")
+
+    def build_cart_and_mark():
+        state["detection_done"] = time.perf_counter()
+        build_cart()
+    app.build_cart_from_detections = build_cart_and_mark
+
+    display = app.display_result_screen
+    app.display_result_screen = timer.wrap(display, "result_screen")
+    state["display_result_screen"] = display
+
+    show_result = app.show_result_screen
+
+    def show_result_and_mark():
+        show_result()
+        t0 = time.perf_counter()
+        app.root.update_idletasks()
+        timer.add("layout", (time.perf_counter() - t0) * 1000)
+        state["shown"] = time.perf_counter()
+    app.show_result_screen = show_result_and_mark
+
+
+def run_once(app, timer, state, images, timeout=30.0):
+    """1 lượt: detect_with_loading -> màn hình kết quả; trả về False nếu quá timeout"""
+    app.uploaded_images.clear()
+    for i, img in enumerate(images):
+        app.uploaded_images.add(f"bench_{i}.jpg", img)
+    state["shown"] = state["detection_done"] = None
+
+    started = time.perf_counter()
+    app.detect_with_loading(list(app.uploaded_images))
+    deadline = started + timeout
+    while state["shown"] is None:
+        if time.perf_counter() > deadline:
+            return False
+        app.root.update()
+        time.sleep(0.001)
+    if state["detection_done"]:
+        timer.add("to_detection_done", (state["detection_done"] - started) * 1000)
+    timer.add("end_to_end", (state["shown"] - started) * 1000)
+
+    # Chi phí dựng lại toàn bộ màn hình kết quả và hiện lại từ cache
+    display = state["display_result_screen"]
+    timer.wrap(display, "result_rebuild")(force=True)
+    app.root.update_idletasks()
+    timer.wrap(display, "result_reshow")()
+
+    app._end_session()
+    app.root.update()
+    return True
+
+
+def _start_display():
+    """Bật display ảo nếu cần; trả về đối tượng Display (None nếu không dùng)"""
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+        if not HAS_VIRTUAL_DISPLAY:
+            raise RuntimeError("Không có DISPLAY: chạy qua `xvfb-run -a python bench_ui.py` "
+                               "hoặc `pip install pyvirtualdisplay`")
+        display = Display(visible=False, size=(config.WINDOW_WIDTH, config.WINDOW_HEIGHT))
+        display.start()
+        return display
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark detect -> giỏ hàng -> màn hình kết quả")
+    parser.add_argument("--runs", type=int, default=10, help="Số lượt đo")
+    parser.add_argument("--warmup", type=int, default=2, help="Số lượt khởi động (không đo)")
+    parser.add_argument("--images", type=int, default=4, help="Số ảnh mỗi lượt")
+    parser.add_argument("--detections", type=int, default=6, help="Số món mỗi ảnh")
+    parser.add_argument("--image-size", default="1280x960", help="Kích thước ảnh WxH")
+    parser.add_argument("--infer-ms", type=float, default=0.0, help="Giả lập thời gian model mỗi ảnh (ms)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--food-data", default=config.FOOD_DATA_FILE, help="File food_36.json")
+    parser.add_argument("-o", "--output", help="Ghi kết quả JSON")
+    args = parser.parse_args(argv)
+
+    setup_logging(log_file="")
+    display = _start_display()
+    from tkinter import Tk
+    from history_utils import HistoryManager
+    from main_window import MainWindow
+
+    width, height = (int(v) for v in args.image_size.lower().split("x"))
+    images = [cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+              for _, data in synthetic_corpus(args.images, width, height, args.seed)]
+
+    timer = StageTimer()
+    food_data = load_food_data(args.food_data)
+    if not food_data:
+        print(f"❌ Không có dữ liệu món ăn: {args.food_data}", file=sys.stderr)
+        return 2
+    model_manager = SyntheticModelManager(food_data, args.detections, args.infer_ms, args.seed)
+    state = {}
+    tmp_dir = tempfile.mkdtemp(prefix="bench_ui_")
+
+    root = Tk()
+    root.withdraw()
+    t0 = time.perf_counter()
+    app = MainWindow(root, model_manager=model_manager)
+    init_ms = (time.perf_counter() - t0) * 1000
+    app.history_manager = HistoryManager(os.path.join(tmp_dir, "history.json"),
+                                         os.path.join(tmp_dir, "detections.jsonl"))
+    instrument(app, timer, state)
+    root.update()
+
+    try:
+        for i in range(args.warmup + args.runs):
+            if i == args.warmup:
+                timer.samples.clear()
+            if not run_once(app, timer, state, images):
+                print("❌ Quá thời gian chờ màn hình kết quả", file=sys.stderr)
+                return 1
+    finally:
+        app.on_close()
+        if display is not None:
+            display.stop()
+
+    summary = timer.summary()
+    print(f"🖥️ MainWindow.__init__: {init_ms:.1f} ms | {args.runs} lượt x {args.images} ảnh x "
+          f"{args.detections} món (end_to_end gồm cả 500 ms chờ chuyển màn hình)")
+    print(f"{'stage':<18} {'count':>6} {'mean':>9} {'p50':>9} {'p95':>9} {'max':>9}  (ms)")
+    for stage in STAGES:
+        s = summary.get(stage)
+        if s:
+            print(f"{stage:<18} {s['count']:>6} {s['mean']:>9.2f} {s['p50']:>9.2f} "
+                  f"{s['p95']:>9.2f} {s['max']:>9.2f}")
+
+    if args.output:
+        report = {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "runs": args.runs,
+            "images": args.images,
+            "detections_per_image": args.detections,
+            "image_size": [width, height],
+            "infer_ms": args.infer_ms,
+            "main_window_init_ms": round(init_ms, 1),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": summary,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,15 @@
 """
-Quản lý giỏ hàng và logic điều chỉnh số lượng theo workflow self-service
+Quản lý giỏ hàng và logic điều chỉnh số lượng theo workflow self-service.
+Logic giỏ hàng nằm ở food_core.cart; module này thêm phần hỏi/cảnh báo bằng Tk.
 """
-from tkinter import messagebox
+import logging
 
+from food_core.cart import CartManager as CoreCartManager
 
-class CartManager:
+logger = logging.getLogger(__name__)
+
+
+class CartManager(CoreCartManager):
     """Quản lý giỏ hàng với các ràng buộc theo workflow"""
     
     @staticmethod
@@ -13,150 +18,12 @@ class CartManager:
         Chuẩn hóa tên class từ model để khớp với key trong food_data
         Ví dụ: 'Banh-canh' -> 'Banh_canh'
         """
-        variations = [
-            class_name,
-            class_name.replace('-', '_'),
-            class_name.replace('_', '-'),
-            class_name.replace(' ', '_'),
-            class_name.replace('-', ''),
-            class_name.replace('_', ''),
-        ]
-        
-        if class_name.startswith('Bun-'):
-            variations.append('Bun_' + class_name[4:].replace('-', '_'))
-        elif class_name.startswith('Banh-'):
-            variations.append('Banh_' + class_name[5:].replace('-', '_'))
-        
-        for key in variations:
-            if key in food_data:
-                print(f"✅ Normalized '{class_name}' -> '{key}'")
-                return key
-        
-        print(f"⚠️ Không normalize được '{class_name}'")
-        return class_name
-    
-    @staticmethod
-    def build_cart_from_detections(current_detections, food_data, normalize_func):
-        """
-        Gom current_detections thành giỏ hàng (cart) theo food_key.
-        Đây là bước khởi tạo CartItems từ DetectedItems (read‑only).
-        
-        Returns:
-            dict: Cart dictionary với structure {food_key: {key, name_vi, detected_qty, quantity, ...}}
-        """
-        cart = {}
-        for det in current_detections or []:
-            raw_name = det["name"]
-            conf = float(det.get("confidence", 0))
-            key = normalize_func(raw_name)
-            info = food_data.get(key, {})
-            item = cart.setdefault(
-                key,
-                {
-                    "key": key,
-                    "name_vi": info.get("name_vi", key),
-                    "detected_qty": 0,  # Số lượng mô hình phát hiện (read-only)
-                    "quantity": 0,      # Số lượng trong giỏ hàng (cart_qty)
-                    "sum_conf": 0.0,
-                    "avg_conf": 0.0,
-                    "price": info.get("price", 0),
-                    "calories": info.get("calories", 0),
-                    "excluded": False,  # Bỏ khỏi thanh toán nhưng vẫn giữ trong session
-                },
-            )
-            item["detected_qty"] += 1
-            item["quantity"] += 1
-            item["sum_conf"] += conf
-        
-        # Tính avg_conf
-        for item in cart.values():
-            if item["detected_qty"] > 0:
-                item["avg_conf"] = item["sum_conf"] / item["detected_qty"]
-            else:
-                item["avg_conf"] = 0.0
-        
-        return cart
-    
-    @staticmethod
-    def get_cart_totals(cart):
-        """
-        Trả về (total_items, total_price, total_calories) từ cart,
-        chỉ tính các món chưa bị excluded_from_payment.
-        """
-        total_items = 0
-        total_price = 0
-        total_calories = 0
-        for item in cart.values():
-            if item.get("excluded"):
-                continue
-            qty = max(0, int(item.get("quantity", 0)))
-            if qty <= 0:
-                continue
-            total_items += qty
-            total_price += item.get("price", 0) * qty
-            total_calories += item.get("calories", 0) * qty
-        return total_items, total_price, total_calories
-    
-    @staticmethod
-    def can_edit_cart(current_session):
-        """Chỉ cho chỉnh giỏ khi session đang ở trạng thái unpaid."""
-        if not current_session:
-            return True
-        return current_session.get("status") == "unpaid"
-    
-    @staticmethod
-    def change_cart_quantity(cart, key, delta, current_session):
-        """
-        Tăng/giảm quantity trong cart có kiểm soát.
-        
-        Quy tắc:
-        - Luôn đảm bảo quantity (cart_qty) >= detected_qty.
-        - Cho phép tăng tự do (người dùng muốn mua nhiều hơn model phát hiện).
-        
-        Returns:
-            bool: True nếu đã thay đổi, False nếu không thể thay đổi
-        """
-        if not CartManager.can_edit_cart(current_session):
-            return False
-        
-        item = cart.get(key)
-        if not item:
-            return False
-        
-        detected_qty = int(item.get("detected_qty", 0))
-        current_qty = int(item.get("quantity", 0))
-        new_q = current_qty + delta
-        
-        # Không cho phép giảm xuống thấp hơn detected_qty
-        if new_q < detected_qty:
-            new_q = detected_qty
-        # Đảm bảo không âm trong mọi trường hợp
-        if new_q < 0:
-            new_q = 0
-        
-        if new_q == current_qty:
-            return False  # Không có thay đổi
-        
-        item["quantity"] = new_q
-        return True
-    
-    @staticmethod
-    def toggle_exclude_item(cart, key, current_session):
-        """
-        Bật/tắt trạng thái excluded_from_payment cho một món trong cart.
-        
-        Returns:
-            bool: True nếu đã thay đổi, False nếu không thể thay đổi
-        """
-        if not CartManager.can_edit_cart(current_session):
-            return False
-        
-        item = cart.get(key)
-        if not item:
-            return False
-        
-        item["excluded"] = not item.get("excluded", False)
-        return True
+        key = CoreCartManager.normalize_food_key(class_name, food_data)
+        if key in food_data:
+            logger.debug("✅ Normalized %r -> %r", class_name, key)
+        else:
+            logger.warning("⚠️ Không normalize được %r", class_name)
+        return key
     
     @staticmethod
     def validate_cart_before_payment(cart):
@@ -169,28 +36,22 @@ class CartManager:
         Returns:
             bool: True nếu có thể thanh toán, False nếu không
         """
+        # Import tại chỗ để module dùng được khi chạy headless (không có Tk)
+        from tkinter import messagebox
+        
         if not cart:
             messagebox.showwarning("Giỏ hàng trống", "Chưa có món nào trong giỏ hàng để thanh toán.")
             return False
         
-        diffs = []
-        excluded_items = []
-        for item in cart.values():
-            name = item.get("name_vi") or item.get("key")
-            detected_qty = int(item.get("detected_qty", 0))
-            qty = int(item.get("quantity", 0))
-            if item.get("excluded"):
-                excluded_items.append(name)
-            if qty > detected_qty:
-                diffs.append(f"- {name}: model {detected_qty}, thanh toán {qty}")
-        
+        diffs, excluded_items = CartManager.cart_discrepancies(cart)
         if not diffs and not excluded_items:
             return True
         
         msg_lines = ["Trước khi thanh toán, hệ thống phát hiện:"]
         if diffs:
             msg_lines.append("\n• Các món có số lượng thanh toán lớn hơn số lượng mô hình phát hiện:")
-            msg_lines.extend(diffs)
+            for name, detected_qty, qty in diffs:
+                msg_lines.append(f"- {name}: model {detected_qty}, thanh toán {qty}")
         if excluded_items:
             msg_lines.append("\n• Các món bị bỏ khỏi thanh toán:")
             for name in excluded_items:
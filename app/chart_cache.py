@@ -0,0 +1,231 @@
+# chart_cache.py
+"""
+Cache biểu đồ dinh dưỡng (donut chart) dạng ảnh.
+
+Giá trị protein/carbs/fat của một món không bao giờ đổi, nên mỗi biểu đồ
+chỉ cần vẽ 1 lần (bằng PIL) rồi dùng lại cho mọi lần dựng màn hình kết quả.
+Ảnh được cache theo (food_key, size) trong bộ nhớ và lưu PNG xuống
+config.CHART_CACHE_DIR để dùng lại giữa các lần chạy app.
+"""
+import hashlib
+import logging
+import math
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageDraw, ImageFont, ImageTk
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+import config
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Màu các phần: Protein, Carbs, Fat
+CHART_COLORS = ['#ff6b6b', '#4ecdc4', '#ffe66d']
+CHART_LABELS = ['Protein', 'Carbs', 'Fat']
+
+# Vẽ ở độ phân giải gấp đôi rồi thu nhỏ để viền mượt như canvas
+_SUPERSAMPLE = 2
+
+_font_cache = {}
+
+
+def _load_font(size):
+    """Font đậm cho nhãn (fallback về font mặc định của PIL)"""
+    font = _font_cache.get(size)
+    if font is None:
+        for name in ("arialbd.ttf", "Arial Bold.ttf", "DejaVuSans-Bold.ttf"):
+            try:
+                font = ImageFont.truetype(name, size)
+                break
+            except OSError:
+                continue
+        else:
+            font = ImageFont.load_default()
+        _font_cache[size] = font
+    return font
+
+
+def _draw_donut(draw, values, center_x, center_y, radius, inner_radius, bg, scale):
+    """
+    Vẽ các cung donut. Trả về list (value, mid_angle) của các phần > 0.
+    Góc tính như Tk canvas: 0 độ ở hướng 3 giờ, tăng ngược chiều kim đồng hồ.
+    """
+    total = sum(values) or 1  # Tránh chia 0
+    start_angle = 0
+    segments = []
+    box = [
+        (center_x - radius) * scale, (center_y - radius) * scale,
+        (center_x + radius) * scale, (center_y + radius) * scale,
+    ]
+    for value, color in zip(values, CHART_COLORS):
+        if value > 0:
+            extent = (value / total) * 360
+            # PIL đo góc theo chiều kim đồng hồ nên đảo dấu
+            draw.pieslice(box, -(start_angle + extent), -start_angle,
+                          fill=color, outline='white', width=scale)
+            segments.append((value, start_angle + extent / 2))
+            start_angle += extent
+    draw.ellipse(
+        [
+            (center_x - inner_radius) * scale, (center_y - inner_radius) * scale,
+            (center_x + inner_radius) * scale, (center_y + inner_radius) * scale,
+        ],
+        fill=bg,
+    )
+    return segments
+
+
+def render_detail_chart(protein, carbs, fat, size=160, bg=None):
+    """
+    Biểu đồ cho thẻ món trong MainWindow: donut có nhãn gram trên từng cung
+    và legend Protein/Carbs/Fat phía dưới (kích thước size x (size + 5)).
+    """
+    bg = bg or config.COLORS['bg_dark']
+    s = _SUPERSAMPLE
+    width, height = size, size + 5
+    img = Image.new("RGB", (width * s, height * s), bg)
+    draw = ImageDraw.Draw(img)
+
+    center_x, center_y = 75 * size / 160, 75 * size / 160
+    radius = 50 * size / 160
+    inner_radius = 30 * size / 160
+    values = [protein, carbs, fat]
+    segments = _draw_donut(draw, values, center_x, center_y, radius, inner_radius, bg, s)
+
+    # Nhãn ở giữa mỗi cung
+    font = _load_font(8 * s)
+    label_radius = (radius + inner_radius) / 2
+    for value, mid_angle in segments:
+        rad = math.radians(mid_angle)
+        label_x = center_x + label_radius * math.cos(rad)
+        label_y = center_y - label_radius * math.sin(rad)
+        draw.text((label_x * s, label_y * s), f"{value}g", fill='white', font=font, anchor="mm")
+
+    # Legend ghi rõ chỉ số kèm số (g)
+    legend_y = 118 * size / 160
+    for i, (label, value, color) in enumerate(zip(CHART_LABELS, values, CHART_COLORS)):
+        y = legend_y + i * 14
+        draw.rectangle([10 * s, y * s, 20 * s, (y + 10) * s], fill=color, outline='white')
+        draw.text((26 * s, (y + 5) * s), f"{label}: {value}g", fill='white', font=font, anchor="lm")
+
+    return img.resize((width, height), Image.LANCZOS)
+
+
+def render_card_chart(protein, carbs, fat, size=200, bg=None):
+    """
+    Biểu đồ cho thẻ món trong ResultScreen (size x size).
+    Legend chỉ vẽ khi đủ rộng (tránh chồng lên donut khi size nhỏ).
+    """
+    bg = bg or config.COLORS['bg_medium']
+    s = _SUPERSAMPLE
+    img = Image.new("RGB", (size * s, size * s), bg)
+    draw = ImageDraw.Draw(img)
+
+    center = size // 2
+    radius = (size - 20) // 2
+    values = [protein, carbs, fat]
+    _draw_donut(draw, values, center, center, radius, radius // 2, bg, s)
+
+    if size >= 120:
+        font = _load_font(7 * s)
+        legend_y = 5
+        for i, (label, value, color) in enumerate(zip(CHART_LABELS, values, CHART_COLORS)):
+            y = legend_y + i * 15
+            draw.rectangle([5 * s, y * s, 15 * s, (y + 10) * s], fill=color)
+            draw.text((20 * s, (y + 5) * s), f"{label}: {value}g", fill='white', font=font, anchor="lm")
+
+    return img.resize((size, size), Image.LANCZOS)
+
+
+class NutritionChartCache:
+    """Cache ảnh biểu đồ theo (food_key, size), dùng lại qua các lần rebuild và các phiên"""
+
+    def __init__(self, render_func, name, cache_dir=None):
+        """
+        Args:
+            render_func: Hàm render(protein, carbs, fat, size) -> PIL.Image
+            name: Tên kiểu biểu đồ (dùng trong tên file cache)
+            cache_dir: Thư mục lưu PNG (mặc định config.CHART_CACHE_DIR, None để tắt)
+        """
+        self.render_func = render_func
+        self.name = name
+        cache_dir = cache_dir if cache_dir is not None else getattr(config, "CHART_CACHE_DIR", None)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._images = {}   # (food_key, size) -> PIL.Image
+        self._photos = {}   # (food_key, size) -> ImageTk.PhotoImage
+        self.hits = 0
+        self.misses = 0
+
+    def _disk_path(self, food_key, size, values):
+        # Hash giá trị để file cache tự mất hiệu lực khi food_36.json đổi
+        digest = hashlib.sha1(f"{food_key}|{size}|{values}".encode("utf-8")).hexdigest()[:16]
+        return self.cache_dir / f"{self.name}_{size}_{digest}.png"
+
+    def get_image(self, food_key, size, protein, carbs, fat):
+        """Lấy ảnh PIL của biểu đồ (render 1 lần, sau đó lấy từ cache)"""
+        key = (food_key, size)
+        img = self._images.get(key)
+        if img is not None:
+            return img
+
+        values = (protein, carbs, fat)
+        path = self._disk_path(food_key, size, values) if self.cache_dir else None
+        if path is not None and path.exists():
+            try:
+                img = Image.open(path)
+                img.load()
+            except OSError:
+                img = None
+        if img is None:
+            img = self.render_func(protein, carbs, fat, size=size)
+            if path is not None:
+                try:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    img.save(path)
+                except OSError as e:
+                    logger.warning("⚠️ Không lưu được cache biểu đồ: %s", e)
+        self._images[key] = img
+        return img
+
+    def get_photo(self, food_key, size, protein, carbs, fat):
+        """
+        Lấy ImageTk.PhotoImage của biểu đồ (phải gọi trên Tk thread).
+        Trả về None nếu không có PIL để caller vẽ bằng canvas như cũ.
+        """
+        if not HAS_PIL:
+            return None
+        key = (food_key, size)
+        photo = self._photos.get(key)
+        if photo is not None:
+            self.hits += 1
+            get_metrics().incr("cache_lookups", cache=f"chart_{self.name}", result="hit")
+            return photo
+        self.misses += 1
+        get_metrics().incr("cache_lookups", cache=f"chart_{self.name}", result="miss")
+        photo = ImageTk.PhotoImage(self.get_image(food_key, size, protein, carbs, fat))
+        self._photos[key] = photo
+        return photo
+
+    def clear(self):
+        """Xóa cache trong bộ nhớ (file PNG trên đĩa vẫn giữ)"""
+        self._images.clear()
+        self._photos.clear()
+
+
+_RENDERERS = {
+    "detail": render_detail_chart,
+    "card": render_card_chart,
+}
+_caches = {}
+
+
+def get_chart_cache(name):
+    """Cache dùng chung cho cả app theo kiểu biểu đồ ("detail" hoặc "card")"""
+    cache = _caches.get(name)
+    if cache is None:
+        cache = _caches[name] = NutritionChartCache(_RENDERERS[name], name)
+    return cache
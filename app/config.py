@@ -6,10 +6,31 @@ File cấu hình chung cho ứng dụng Food Detection
 # Đường dẫn model
 MODEL_PATH = r"C:\Users\PC\Downloads\food_selected_pho_bun\food_detection_1100_image_in_36class\food_detection_36class_1100_resume\yolov8s_vietfood_36class_1100\weights\best.pt"
 
+# Inference server (kiosk cấu hình yếu dùng model trên máy khác trong LAN)
+# Đặt URL, ví dụ "http://192.168.1.10:8770", để MainWindow gửi ảnh lên server thay vì load model
+INFERENCE_SERVER_URL = None
+INFERENCE_SERVER_PORT = 8770
+INFERENCE_BATCH_WINDOW_MS = 10   # Thời gian chờ gom các request thành 1 batch
+INFERENCE_MAX_BATCH = 8
+
 # Cấu hình camera
 CAMERA_WIDTH = 1280
 CAMERA_HEIGHT = 720
 CAMERA_FPS = 30
+# Các nguồn camera của quầy: index thiết bị, URL RTSP, file video hoặc thư mục ảnh frame (phát lại).
+# Với file/thư mục: "speed" = số lần tốc độ gốc (0 = nhanh hết mức), "fps" = FPS của thư mục frame.
+# "roi" (x1, y1, x2, y2 theo tỉ lệ 0..1) = vùng camera đó "sở hữu" khi gộp detection,
+# để món nằm ở vùng chồng lấn giữa 2 camera không bị tính 2 lần.
+# Ví dụ 2 camera cho khay dài:
+#   CAMERA_SOURCES = [
+#       {"id": "left", "source": 0, "roi": (0.0, 0.0, 0.5, 1.0)},
+#       {"id": "right", "source": "rtsp://192.168.1.20:554/stream1", "roi": (0.5, 0.0, 1.0, 1.0)},
+#   ]
+CAMERA_SOURCES = [{"id": "cam0", "source": 0}]
+# Bỏ cuộc (báo lỗi) nếu chưa mở được camera nào sau ngần này giây
+CAMERA_OPEN_TIMEOUT_S = 10
+# True: detect liên tục frame mới của mọi camera (chia đều model giữa các camera)
+CAMERA_LIVE_DETECT = False
 
 # Cấu hình UI
 WINDOW_WIDTH = 1600
@@ -35,8 +56,41 @@ COLORS = {
 DEFAULT_CONFIDENCE = 0.5
 MIN_CONFIDENCE = 0.1
 MAX_CONFIDENCE = 1.0
+DETECT_BATCH_WINDOW_MS = 5    # Gom các ảnh detect gần nhau thành 1 batch (ms)
+DETECT_MAX_BATCH = 8
+# Tiền xử lý vào buffer cấp sẵn, dùng lại mỗi frame (food_core/preprocess.py); ảnh vào model là MODEL_IMGSZ x MODEL_IMGSZ
+ZERO_COPY_PREPROCESS = False
+MODEL_IMGSZ = 640
+# Ảnh của phiên upload (session_images.py): ảnh gốc giữ trong RAM tới SESSION_IMAGE_BUDGET_MB (LRU,
+# ảnh bị đẩy ra được đọc lại từ file); hiển thị dùng preview JPEG thu nhỏ
+SESSION_IMAGE_BUDGET_MB = 512
+SESSION_PREVIEW_MAX_SIDE = 1024
+SESSION_PREVIEW_JPEG_QUALITY = 85
+# Decode ảnh upload (image_utils.DecodePool)
+DECODE_WORKERS = 0            # Số thread decode (0 = số CPU)
+DECODE_MAX_SIDE = 1280        # JPEG lớn hơn được decode thu nhỏ 1/2..1/8 nhưng cạnh dài vẫn >= giá trị này (None = đủ)
 
 # File paths
 FOOD_DATA_FILE = r"C:\Users\PC\Downloads\food_selected_pho_bun\food_36.json"
 HISTORY_FILE = "detection_history.json"
-MAX_HISTORY_RECORDS = 100
\ No newline at end of file
+CHART_CACHE_DIR = "cache/charts"
+INVOICE_STORE_FILE = "invoices/invoices.jsonl"   # Mỗi dòng 1 hóa đơn (append-only)
+INVOICE_INDEX_FILE = "invoices/invoices.idx"     # invoice_id, timestamp, offset, length, total
+DETECTION_LOG_FILE = "logs/detections.jsonl"     # Log detection append-only cho báo cáo
+MAX_HISTORY_RECORDS = 100
+
+# Đo hiệu năng (metrics.py)
+METRICS_ENABLED = True
+METRICS_FILE = "logs/metrics.json"   # Snapshot metrics, ghi định kỳ và khi thoát app
+METRICS_EXPORT_INTERVAL_S = 60
+SHOW_PERF_OVERLAY = False            # Overlay FPS/latency trên cửa sổ (bật/tắt bằng F12)
+METRICS_ENDPOINT_ENABLED = False     # GET /metrics (Prometheus) trên payment server, cổng 8765
+
+# Logging (log_utils.py)
+LOG_LEVEL = "INFO"                   # "DEBUG" để xem chi tiết normalize / detections
+LOG_FILE = "logs/app.log"            # JSON Lines, xoay vòng; "" để tắt
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+LOG_RATE_LIMIT_INTERVAL_S = 10       # Mỗi mẫu message tối đa LOG_RATE_LIMIT_BURST lần / cửa sổ
+LOG_RATE_LIMIT_BURST = 5
+ULTRALYTICS_LOG_LEVEL = "WARNING"
\ No newline at end of file
@@ -0,0 +1,20 @@
+# food_core/__init__.py
+"""
+Lõi nhận diện món ăn và giỏ hàng, không phụ thuộc tkinter hay config của app.
+
+Dùng được từ GUI (app/), CLI headless, worker và benchmark:
+    from food_core import YOLOModelManager, FoodTable, CartManager, load_food_data
+"""
+from .model import DEFAULT_CONFIDENCE, YOLOModelManager, extract_detections
+from .foods import FoodTable, load_food_data, normalize_food_key
+from .cart import CartManager
+
+__all__ = [
+    "DEFAULT_CONFIDENCE",
+    "YOLOModelManager",
+    "extract_detections",
+    "FoodTable",
+    "load_food_data",
+    "normalize_food_key",
+    "CartManager",
+]
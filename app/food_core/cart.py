@@ -0,0 +1,225 @@
+# food_core/cart.py
+"""
+Giỏ hàng: dựng cart từ detections, tính tổng, chỉnh số lượng theo workflow self-service.
+Không phụ thuộc GUI.
+"""
+import numpy as np
+
+from .foods import normalize_food_key
+
+
+class CartManager:
+    """Quản lý giỏ hàng với các ràng buộc theo workflow"""
+    
+    @staticmethod
+    def normalize_food_key(class_name, food_data):
+        """Chuẩn hóa tên class từ model để khớp với key trong food_data"""
+        return normalize_food_key(class_name, food_data)
+    
+    @staticmethod
+    def _new_cart_item(key, info, class_id=None):
+        """Tạo một CartItem rỗng cho food_key"""
+        return {
+            "key": key,
+            "class_id": class_id,
+            "name_vi": info.get("name_vi", key),
+            "detected_qty": 0,  # Số lượng mô hình phát hiện (read-only)
+            "quantity": 0,      # Số lượng trong giỏ hàng (cart_qty)
+            "sum_conf": 0.0,
+            "avg_conf": 0.0,
+            "price": info.get("price", 0),
+            "calories": info.get("calories", 0),
+            "excluded": False,  # Bỏ khỏi thanh toán nhưng vẫn giữ trong session
+        }
+    
+    @staticmethod
+    def build_cart_from_detections(current_detections, food_data, normalize_func, food_table=None):
+        """
+        Gom current_detections thành giỏ hàng (cart) theo food_key.
+        Đây là bước khởi tạo CartItems từ DetectedItems (read‑only).
+        
+        Nếu có food_table và mọi detection đều có "class_id" thì đếm bằng
+        np.bincount thay vì duyệt từng detection.
+        
+        Returns:
+            dict: Cart dictionary với structure {food_key: {key, name_vi, detected_qty, quantity, ...}}
+        """
+        detections = current_detections or []
+        if food_table is not None and detections and all(
+            det.get("class_id") is not None for det in detections
+        ):
+            return CartManager._build_cart_vectorized(detections, food_data, food_table)
+        
+        cart = {}
+        for det in detections:
+            raw_name = det["name"]
+            conf = float(det.get("confidence", 0))
+            key = normalize_func(raw_name)
+            info = food_data.get(key, {})
+            item = cart.get(key)
+            if item is None:
+                item = cart[key] = CartManager._new_cart_item(key, info, det.get("class_id"))
+            item["detected_qty"] += 1
+            item["quantity"] += 1
+            item["sum_conf"] += conf
+        
+        # Tính avg_conf
+        for item in cart.values():
+            if item["detected_qty"] > 0:
+                item["avg_conf"] = item["sum_conf"] / item["detected_qty"]
+            else:
+                item["avg_conf"] = 0.0
+        
+        return cart
+    
+    @staticmethod
+    def _build_cart_vectorized(detections, food_data, food_table):
+        """Dựng cart từ bincount trên class id (giữ thứ tự xuất hiện đầu tiên)."""
+        ids = np.fromiter((det["class_id"] for det in detections), dtype=np.intp, count=len(detections))
+        confs = np.fromiter(
+            (float(det.get("confidence", 0)) for det in detections), dtype=np.float64, count=len(detections)
+        )
+        counts = food_table.counts(ids)
+        sum_conf = food_table.counts(ids, weights=confs)
+        
+        unique_ids, first_index = np.unique(ids, return_index=True)
+        cart = {}
+        for cls_id in unique_ids[np.argsort(first_index)].tolist():
+            key = food_table.food_keys[cls_id]
+            item = cart.get(key)
+            if item is None:
+                item = cart[key] = CartManager._new_cart_item(key, food_data.get(key, {}), cls_id)
+            n = int(counts[cls_id])
+            item["detected_qty"] += n
+            item["quantity"] += n
+            item["sum_conf"] += float(sum_conf[cls_id])
+        
+        for item in cart.values():
+            item["avg_conf"] = item["sum_conf"] / item["detected_qty"] if item["detected_qty"] else 0.0
+        return cart
+    
+    @staticmethod
+    def get_cart_totals(cart, food_table=None):
+        """
+        Trả về (total_items, total_price, total_calories) từ cart,
+        chỉ tính các món chưa bị excluded_from_payment.
+        """
+        if food_table is not None:
+            nutrition = CartManager.get_cart_nutrition(cart, food_table)
+            return nutrition["items"], nutrition["price"], nutrition["calories"]
+        
+        total_items = 0
+        total_price = 0
+        total_calories = 0
+        for item in cart.values():
+            if item.get("excluded"):
+                continue
+            qty = max(0, int(item.get("quantity", 0)))
+            if qty <= 0:
+                continue
+            total_items += qty
+            total_price += item.get("price", 0) * qty
+            total_calories += item.get("calories", 0) * qty
+        return total_items, total_price, total_calories
+    
+    @staticmethod
+    def get_cart_nutrition(cart, food_table):
+        """
+        Tổng số phần, tiền và dinh dưỡng (price, calories, protein, carbs, fat) của cart
+        bằng tích vô hướng giữa vector số lượng theo class id và bảng FoodTable.
+        
+        Returns:
+            dict: {"items", "price", "calories", "protein", "carbs", "fat"}
+        """
+        qty, leftover = food_table.cart_quantities(cart)
+        totals = food_table.totals(qty)
+        totals["items"] = int(qty.sum())
+        # Món không có class id (không map được về model) vẫn tính theo giá trong cart
+        for item in leftover:
+            n = max(0, int(item.get("quantity", 0)))
+            totals["items"] += n
+            totals["price"] += item.get("price", 0) * n
+            totals["calories"] += item.get("calories", 0) * n
+        return totals
+    
+    @staticmethod
+    def can_edit_cart(current_session):
+        """Chỉ cho chỉnh giỏ khi session đang ở trạng thái unpaid."""
+        if not current_session:
+            return True
+        return current_session.get("status") == "unpaid"
+    
+    @staticmethod
+    def change_cart_quantity(cart, key, delta, current_session):
+        """
+        Tăng/giảm quantity trong cart có kiểm soát.
+        
+        Quy tắc:
+        - Luôn đảm bảo quantity (cart_qty) >= detected_qty.
+        - Cho phép tăng tự do (người dùng muốn mua nhiều hơn model phát hiện).
+        
+        Returns:
+            bool: True nếu đã thay đổi, False nếu không thể thay đổi
+        """
+        if not CartManager.can_edit_cart(current_session):
+            return False
+        
+        item = cart.get(key)
+        if not item:
+            return False
+        
+        detected_qty = int(item.get("detected_qty", 0))
+        current_qty = int(item.get("quantity", 0))
+        new_q = current_qty + delta
+        
+        # Không cho phép giảm xuống thấp hơn detected_qty
+        if new_q < detected_qty:
+            new_q = detected_qty
+        # Đảm bảo không âm trong mọi trường hợp
+        if new_q < 0:
+            new_q = 0
+        
+        if new_q == current_qty:
+            return False  # Không có thay đổi
+        
+        item["quantity"] = new_q
+        return True
+    
+    @staticmethod
+    def toggle_exclude_item(cart, key, current_session):
+        """
+        Bật/tắt trạng thái excluded_from_payment cho một món trong cart.
+        
+        Returns:
+            bool: True nếu đã thay đổi, False nếu không thể thay đổi
+        """
+        if not CartManager.can_edit_cart(current_session):
+            return False
+        
+        item = cart.get(key)
+        if not item:
+            return False
+        
+        item["excluded"] = not item.get("excluded", False)
+        return True
+    
+    @staticmethod
+    def cart_discrepancies(cart):
+        """
+        Chênh lệch giữa DetectedItems và CartItems (dùng trước khi thanh toán).
+        
+        Returns:
+            (diffs, excluded): diffs là list (name, detected_qty, quantity) với quantity > detected_qty,
+            excluded là list tên món bị bỏ khỏi thanh toán
+        """
+        diffs = []
+        excluded = []
+        for item in cart.values():
+            name = item.get("name_vi") or item.get("key")
+            detected_qty = int(item.get("detected_qty", 0))
+            qty = int(item.get("quantity", 0))
+            if item.get("excluded"):
+                excluded.append(name)
+            if qty > detected_qty:
+                diffs.append((name, detected_qty, qty))
+        return diffs, excluded
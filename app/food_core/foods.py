@@ -0,0 +1,172 @@
+# food_core/foods.py
+"""
+Dữ liệu món ăn: load food_36.json, chuẩn hóa tên class -> food key,
+bảng dinh dưỡng/giá dạng mảng NumPy đánh index theo class id của model.
+
+food_36.json được "biên dịch" một lần khi load thành các mảng
+(price, calories, protein, carbs, fat) có chỉ số là class id của YOLO,
+nhờ đó đếm giỏ hàng là một lần np.bincount và tổng tiền / dinh dưỡng là tích vô hướng.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def load_food_data(path):
+    """
+    Load dictionary món ăn từ file JSON.
+
+    Returns:
+        dict: {food_key: info}, rỗng nếu không đọc được
+    """
+    try:
+        if not os.path.exists(path):
+            logger.warning("⚠️ Không tìm thấy file %s", path)
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error("❌ Lỗi load food data: %s", e)
+        return {}
+
+
+def normalize_food_key(class_name, food_data):
+    """
+    Chuẩn hóa tên class từ model để khớp với key trong food_data
+    Ví dụ: 'Banh-canh' -> 'Banh_canh'. Không khớp thì trả lại class_name.
+    """
+    variations = [
+        class_name,
+        class_name.replace('-', '_'),
+        class_name.replace('_', '-'),
+        class_name.replace(' ', '_'),
+        class_name.replace('-', ''),
+        class_name.replace('_', ''),
+    ]
+
+    if class_name.startswith('Bun-'):
+        variations.append('Bun_' + class_name[4:].replace('-', '_'))
+    elif class_name.startswith('Banh-'):
+        variations.append('Banh_' + class_name[5:].replace('-', '_'))
+
+    for key in variations:
+        if key in food_data:
+            return key
+    return class_name
+
+
+class FoodTable:
+    """Bảng tra cứu món ăn theo class id của model"""
+
+    FIELDS = ("price", "calories", "protein", "carbs", "fat")
+
+    def __init__(self, food_data, class_names, normalize_func):
+        """
+        Args:
+            food_data: Dictionary món ăn (nội dung food_36.json)
+            class_names: Tên class của model, dict {class_id: name} (model.names) hoặc list
+            normalize_func: Hàm chuẩn hóa tên class -> key trong food_data
+        """
+        if isinstance(class_names, dict):
+            num_classes = (max(class_names) + 1) if class_names else 0
+            names = [class_names.get(i, str(i)) for i in range(num_classes)]
+        else:
+            names = list(class_names)
+
+        self.class_names = names
+        self.num_classes = len(names)
+        self.food_keys = [normalize_func(name) for name in names]
+        self.known = np.array([key in food_data for key in self.food_keys], dtype=bool)
+
+        # Ma trận (field x class): mỗi hàng là một chỉ số, mỗi cột là một class id
+        raw = [
+            [food_data.get(key, {}).get(field, 0) or 0 for key in self.food_keys]
+            for field in self.FIELDS
+        ]
+        is_integral = all(isinstance(v, int) for row in raw for v in row)
+        # Chỉ số nào toàn số nguyên (price, calories) thì tổng cũng trả về int
+        self._integral_fields = [all(isinstance(v, int) for v in row) for row in raw]
+        self.values = np.array(raw, dtype=np.int64 if is_integral else np.float64).reshape(
+            len(self.FIELDS), self.num_classes
+        )
+        for i, field in enumerate(self.FIELDS):
+            setattr(self, field, self.values[i])
+
+        # food_key -> class id đầu tiên (nhiều class có thể cùng chuẩn hóa về 1 key)
+        self.key_to_class = {}
+        for cls_id, key in enumerate(self.food_keys):
+            self.key_to_class.setdefault(key, cls_id)
+        self.name_to_class = {name: cls_id for cls_id, name in enumerate(names)}
+
+    def class_ids_for_names(self, names):
+        """Đổi danh sách tên class (hoặc food_key) thành mảng class id, bỏ qua tên không biết."""
+        ids = []
+        for name in names:
+            cls_id = self.name_to_class.get(name)
+            if cls_id is None:
+                cls_id = self.key_to_class.get(name)
+            if cls_id is not None:
+                ids.append(cls_id)
+        return np.asarray(ids, dtype=np.intp)
+
+    def counts(self, class_ids, weights=None):
+        """
+        Đếm số lần xuất hiện của mỗi class id (np.bincount).
+
+        Args:
+            class_ids: Iterable class id
+            weights: Trọng số tùy chọn (ví dụ confidence để tính tổng conf)
+
+        Returns:
+            np.ndarray độ dài num_classes
+        """
+        ids = np.asarray(class_ids, dtype=np.intp).ravel()
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64).ravel()
+        return np.bincount(ids, weights=weights, minlength=self.num_classes)
+
+    def totals(self, counts):
+        """
+        Tính tổng các chỉ số bằng tích vô hướng values @ counts.
+
+        Returns:
+            dict {field: tổng} cho price, calories, protein, carbs, fat
+        """
+        sums = self.values @ np.asarray(counts)
+        return {
+            field: int(sums[i]) if self._integral_fields[i] else sums[i].item()
+            for i, field in enumerate(self.FIELDS)
+        }
+
+    def aggregate(self, class_ids):
+        """Gom một lượng lớn detection (ví dụ lịch sử) thành (counts, totals)."""
+        counts = self.counts(class_ids)
+        return counts, self.totals(counts)
+
+    def cart_quantities(self, cart):
+        """
+        Chuyển cart {food_key: item} thành vector số lượng theo class id,
+        chỉ tính các món chưa bị excluded.
+
+        Returns:
+            (qty, leftover): qty là np.ndarray theo class id,
+            leftover là list item không có class id (tính theo cách cũ)
+        """
+        qty = np.zeros(self.num_classes, dtype=np.int64)
+        leftover = []
+        for item in cart.values():
+            if item.get("excluded"):
+                continue
+            n = max(0, int(item.get("quantity", 0)))
+            if n <= 0:
+                continue
+            cls_id = item.get("class_id")
+            if cls_id is None or not (0 <= cls_id < self.num_classes):
+                leftover.append(item)
+                continue
+            qty[cls_id] += n
+        return qty, leftover
@@ -0,0 +1,247 @@
+# food_core/model.py
+"""
+Quản lý YOLOv8 model (không phụ thuộc GUI).
+ultralytics chỉ được import khi load model; log của nó (kể cả output
+verbose) đi qua logging chuẩn của ứng dụng thay vì handler riêng.
+
+preallocate=True: ảnh được letterbox vào InputBufferPool (preprocess.py) và
+đưa cho model dưới dạng tensor dùng chung bộ nhớ với buffer, box được đưa
+lại về tọa độ ảnh gốc sau NMS. Lần đầu dùng, kết quả được so với đường
+thường của ultralytics trên ảnh đầu tiên (verify_preallocated); lệch thì
+tắt pool và chạy đường thường.
+"""
+import logging
+import time
+
+from .preprocess import InputBufferPool, unletterbox_boxes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIDENCE = 0.5
+
+
+def _adopt_ultralytics_logger():
+    """Gỡ handler riêng của logger "ultralytics" nếu ứng dụng đã cấu hình root logger"""
+    if not logging.getLogger().handlers:
+        return
+    ul_logger = logging.getLogger("ultralytics")
+    for handler in list(ul_logger.handlers):
+        ul_logger.removeHandler(handler)
+    ul_logger.propagate = True
+
+
+def extract_detections(result):
+    """
+    Chuyển kết quả YOLO thành list detection đơn giản
+
+    Returns:
+        list: [{name, class_id, confidence, box}, ...] với box = [x1, y1, x2, y2]
+    """
+    detections = []
+    if result is None:
+        return detections
+    for box in result.boxes:
+        cls_id = int(box.cls[0])
+        detections.append({
+            "name": result.names[cls_id],
+            "class_id": cls_id,
+            "confidence": float(box.conf[0]),
+            "box": [round(v, 1) for v in box.xyxy[0].tolist()]
+        })
+    return detections
+
+
+def _iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare_detections(ours, reference, confidence, min_iou=0.9, margin=0.05):
+    """
+    So 2 list detection (extract_detections) của cùng 1 ảnh
+
+    Ghép từng cặp cùng class có IoU lớn nhất. Box không ghép được chỉ được
+    chấp nhận khi confidence sát ngưỡng (< confidence + margin): padding
+    letterbox khác nhau làm điểm số lệch nhẹ.
+
+    Returns:
+        dict: ok, matched, unmatched (số box lệch ngoài vùng sát ngưỡng), min_iou
+    """
+    remaining = list(reference)
+    matched, unmatched, worst = 0, 0, 1.0
+    for det in sorted(ours, key=lambda d: -d["confidence"]):
+        candidates = [(_iou(det["box"], ref["box"]), i) for i, ref in enumerate(remaining)
+                      if ref["class_id"] == det["class_id"]]
+        best_iou, best = max(candidates, default=(0.0, None))
+        if best is not None and best_iou >= min_iou:
+            remaining.pop(best)
+            matched += 1
+            worst = min(worst, best_iou)
+        elif det["confidence"] >= confidence + margin:
+            unmatched += 1
+    unmatched += sum(1 for ref in remaining if ref["confidence"] >= confidence + margin)
+    return {"ok": unmatched == 0, "matched": matched, "unmatched": unmatched,
+            "min_iou": round(worst, 3) if matched else None}
+
+
+class YOLOModelManager:
+    """Load model và chạy detection (1 ảnh hoặc theo batch)"""
+
+    def __init__(self, model_path, load=True, preallocate=False, imgsz=640, max_batch=8):
+        """
+        Args:
+            model_path: Đường dẫn file model .pt
+            load: False để load sau (gọi load_model(), ví dụ trên thread nền)
+            preallocate: Tiền xử lý vào buffer cấp sẵn (InputBufferPool) thay vì để ultralytics cấp phát
+            imgsz, max_batch: Kích thước ảnh đầu vào và số slot của buffer
+        """
+        self.model_path = model_path
+        self.model = None
+        self.load_error = None
+        self.preallocate = preallocate
+        self.imgsz = imgsz
+        self.max_batch = max_batch
+        self.input_pool = None
+        self._pool_verified = False
+        if load:
+            self.load_model()
+
+    def load_model(self):
+        """
+        Load YOLOv8 model
+
+        Returns:
+            bool: True nếu thành công (lỗi lưu ở self.load_error)
+        """
+        try:
+            from ultralytics import YOLO
+            _adopt_ultralytics_logger()
+            self.model = YOLO(self.model_path)
+            self.load_error = None
+            if self.preallocate:
+                import torch
+                self.input_pool = InputBufferPool(self.imgsz, self.max_batch,
+                                                  pin_memory=torch.cuda.is_available())
+                self._pool_verified = False
+            logger.info("✅ Model loaded: %s", self.model_path)
+            return True
+        except Exception as e:
+            self.load_error = e
+            logger.error("❌ Lỗi load model: %s", e)
+            return False
+
+    def detect(self, image, confidence=DEFAULT_CONFIDENCE):
+        """
+        Chạy detection trên ảnh
+
+        Args:
+            image: Ảnh đầu vào (numpy array)
+            confidence: Ngưỡng confidence
+
+        Returns:
+            results: Kết quả detection từ YOLO
+        """
+        if self.model is None:
+            return None
+        if self.input_pool is not None:
+            results = self.detect_batch([image], confidence)
+            return results[0] if results else None
+
+        try:
+            results = self.model(image, conf=confidence, verbose=False)
+            return results[0]
+        except Exception as e:
+            logger.error("❌ Lỗi detection: %s", e)
+            return None
+
+    def detect_batch(self, images, confidence=DEFAULT_CONFIDENCE, imgsz=None):
+        """
+        Chạy detection trên nhiều ảnh trong 1 lần gọi model
+
+        Args:
+            images: List ảnh (numpy array BGR)
+            confidence: Ngưỡng confidence
+            imgsz: Kích thước ảnh đầu vào của model (None = mặc định của model)
+
+        Returns:
+            list: Kết quả YOLO theo thứ tự ảnh, hoặc None nếu lỗi
+        """
+        if self.model is None or not images:
+            return None
+        if self.input_pool is not None and imgsz in (None, self.imgsz) and not self._pool_verified:
+            self._verify_on_first_use(images[0], confidence)
+        if self.input_pool is not None and imgsz in (None, self.imgsz):
+            try:
+                return self._detect_preallocated(images, confidence)
+            except Exception as e:
+                logger.error("❌ Lỗi detection batch: %s", e)
+                return None
+
+        kwargs = {"conf": confidence, "verbose": False}
+        if imgsz:
+            kwargs["imgsz"] = imgsz
+        try:
+            return list(self.model(images, **kwargs))
+        except Exception as e:
+            logger.error("❌ Lỗi detection batch: %s", e)
+            return None
+
+    def _detect_preallocated(self, images, confidence):
+        """detect_batch qua InputBufferPool: letterbox vào buffer, model nhận tensor không copy"""
+        pool = self.input_pool
+        with pool.lock:  # Buffer dùng lại: giữ tới khi model chạy xong
+            started = time.perf_counter()
+            _, metas = pool.fill(images)
+            fill_ms = (time.perf_counter() - started) * 1000
+            results = list(self.model(pool.as_tensor(len(images)), conf=confidence, verbose=False))
+        for result, image, (scale, left, top) in zip(results, images, metas):
+            # Với input tensor, ultralytics trả box theo tọa độ letterbox và orig_img là ảnh letterbox
+            boxes = result.boxes.data.clone()
+            unletterbox_boxes(boxes, scale, left, top, image.shape)
+            result.orig_img = image
+            result.orig_shape = image.shape[:2]
+            result.update(boxes=boxes)
+            if getattr(result, "speed", None):
+                result.speed["preprocess"] = (result.speed.get("preprocess") or 0) + fill_ms / len(images)
+        return results
+
+    def verify_preallocated(self, image, confidence=DEFAULT_CONFIDENCE):
+        """
+        Chạy 1 ảnh qua cả đường buffer cấp sẵn và đường thường (cùng imgsz), so box
+
+        Returns:
+            dict: kết quả compare_detections + số box mỗi đường
+        """
+        if self.model is None or self.input_pool is None:
+            raise RuntimeError("Cần model đã load với preallocate=True")
+        ours = extract_detections(self._detect_preallocated([image], confidence)[0])
+        reference = extract_detections(self.model([image], conf=confidence, imgsz=self.imgsz, verbose=False)[0])
+        check = compare_detections(ours, reference, confidence)
+        check.update(boxes=len(ours), reference_boxes=len(reference))
+        return check
+
+    def _verify_on_first_use(self, image, confidence):
+        """Kiểm tra đường buffer cấp sẵn 1 lần; lệch hoặc lỗi thì tắt pool"""
+        self._pool_verified = True
+        try:
+            check = self.verify_preallocated(image, confidence)
+        except Exception as e:
+            check = {"ok": False, "error": str(e)}
+        if check["ok"]:
+            logger.info("✅ Buffer cấp sẵn khớp đường thường: %s", check)
+        else:
+            logger.warning("⚠️ Buffer cấp sẵn cho kết quả khác đường thường, dùng đường thường: %s", check)
+            self.input_pool = None
+
+    def get_class_names(self):
+        """Lấy tên class của model dạng {class_id: name} (rỗng nếu chưa load)"""
+        if self.model is None:
+            return {}
+        return dict(self.model.names)
+
+    def is_loaded(self):
+        """Kiểm tra model đã được load chưa"""
+        return self.model is not None
@@ -0,0 +1,131 @@
+# food_core/preprocess.py
+"""
+Tiền xử lý ảnh cho YOLO vào buffer cấp sẵn (không cấp phát mảng mới mỗi frame).
+
+Mặc định ultralytics tạo mới mỗi lần gọi: ảnh letterbox, mảng batch,
+bản transpose và tensor float. InputBufferPool giữ sẵn cho mỗi slot batch
+1 vùng uint8 HWC (letterbox) và 1 vùng float32 NCHW dùng chung bộ nhớ với
+tensor torch (pinned khi có CUDA):
+
+- cv2.resize ghi thẳng vào vùng giữa của slot, chỉ tô lại viền pad
+- BGR -> RGB, HWC -> CHW và /255 trong 1 lần np.multiply(out=...)
+- torch.from_numpy trên buffer đó: model nhận tensor không copy
+
+Bộ đếm `allocations` chỉ đếm buffer của pool (lần đầu hoặc batch lớn hơn sức
+chứa), không phải mọi cấp phát trong lần gọi model; bộ nhớ cấp phát thật mỗi
+batch đo bằng `bench_inference.py` (tracemalloc, mục `alloc`).
+"""
+import threading
+
+import cv2
+import numpy as np
+
+PAD_VALUE = 114  # Màu viền letterbox giống ultralytics
+_INV_255 = np.float32(1 / 255)
+
+
+def letterbox_into(image, dst, pad_value=PAD_VALUE):
+    """
+    Letterbox ảnh BGR vào dst (S x S x 3 uint8) tại chỗ
+
+    Returns:
+        (scale, left, top): để đưa box về tọa độ ảnh gốc
+    """
+    size = dst.shape[0]
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = min(size, round(w * scale)), min(size, round(h * scale))
+    left, top = (size - new_w) // 2, (size - new_h) // 2
+
+    region = dst[top:top + new_h, left:left + new_w]
+    if (new_w, new_h) == (w, h):
+        region[...] = image
+    else:
+        cv2.resize(image, (new_w, new_h), dst=region, interpolation=cv2.INTER_LINEAR)
+    # Chỉ tô viền, không xóa cả buffer
+    dst[:top] = pad_value
+    dst[top + new_h:] = pad_value
+    dst[top:top + new_h, :left] = pad_value
+    dst[top:top + new_h, left + new_w:] = pad_value
+    return scale, left, top
+
+
+def unletterbox_boxes(boxes, scale, left, top, orig_shape):
+    """Đưa box xyxy (numpy hoặc tensor, sửa tại chỗ) từ tọa độ letterbox về ảnh gốc"""
+    boxes[:, [0, 2]] -= left
+    boxes[:, [1, 3]] -= top
+    boxes[:, :4] /= scale
+    h, w = orig_shape[:2]
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+    return boxes
+
+
+class InputBufferPool:
+    """Buffer đầu vào dùng lại giữa các batch (1 batch tại 1 thời điểm: giữ `lock` khi dùng)"""
+
+    def __init__(self, imgsz=640, max_batch=8, pin_memory=False):
+        """
+        Args:
+            imgsz: Cạnh ảnh đầu vào model (bội số của 32)
+            max_batch: Số slot cấp sẵn (tự tăng nếu gặp batch lớn hơn)
+            pin_memory: Dùng pinned memory (torch + CUDA) để copy lên GPU nhanh hơn
+        """
+        self.imgsz = imgsz
+        self.pin_memory = pin_memory
+        self.lock = threading.Lock()
+        self.allocations = 0
+        self.batches = 0
+        self.frames = 0
+        self.capacity = 0
+        self.staging = None   # (N, S, S, 3) uint8 - ảnh letterbox BGR
+        self.inputs = None    # (N, 3, S, S) float32 RGB 0..1
+        self._tensor = None   # torch tensor dùng chung bộ nhớ với inputs (nếu có torch)
+        self._allocate(max_batch)
+
+    def _allocate(self, capacity):
+        size = self.imgsz
+        self.staging = np.empty((capacity, size, size, 3), dtype=np.uint8)
+        self._tensor = None
+        if self.pin_memory:
+            import torch
+            self._tensor = torch.empty((capacity, 3, size, size), dtype=torch.float32, pin_memory=True)
+            self.inputs = self._tensor.numpy()
+        else:
+            self.inputs = np.empty((capacity, 3, size, size), dtype=np.float32)
+        self.capacity = capacity
+        self.allocations += 1
+
+    def fill(self, images):
+        """
+        Letterbox + chuẩn hóa các ảnh BGR vào buffer
+
+        Returns:
+            (inputs, metas): view (n, 3, S, S) float32 và list (scale, left, top) theo ảnh
+        """
+        n = len(images)
+        if n > self.capacity:
+            self._allocate(n)
+        metas = [letterbox_into(image, self.staging[i]) for i, image in enumerate(images)]
+        # BGR -> RGB, HWC -> CHW, uint8 -> float32 / 255 trong 1 lần ghi
+        np.multiply(self.staging[:n, :, :, ::-1].transpose(0, 3, 1, 2), _INV_255,
+                    out=self.inputs[:n], dtype=np.float32)
+        self.batches += 1
+        self.frames += n
+        return self.inputs[:n], metas
+
+    def as_tensor(self, n):
+        """Tensor torch (n, 3, S, S) trên cùng bộ nhớ với buffer (không copy)"""
+        if self._tensor is None:
+            import torch
+            self._tensor = torch.from_numpy(self.inputs)
+        return self._tensor[:n]
+
+    def stats(self):
+        return {
+            "allocations": self.allocations,
+            "batches": self.batches,
+            "frames": self.frames,
+            "capacity": self.capacity,
+            "bytes": self.staging.nbytes + self.inputs.nbytes,
+        }
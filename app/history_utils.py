@@ -3,13 +3,19 @@
 Quản lý lịch sử detection
 """
 import json
+import logging
 import os
 from datetime import datetime
 import config
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
 
 class HistoryManager:
-    def __init__(self, history_file=None):
+    def __init__(self, history_file=None, detection_log_file=None):
         self.history_file = history_file or config.HISTORY_FILE
+        # Log append-only (JSON Lines) không bị cắt theo MAX_HISTORY_RECORDS, dùng cho báo cáo
+        self.detection_log_file = detection_log_file or config.DETECTION_LOG_FILE
         self.detection_history = []
         self.load_history()
     
@@ -20,7 +26,7 @@ class HistoryManager:
                 with open(self.history_file, 'r', encoding='utf-8') as f:
                     self.detection_history = json.load(f)
         except Exception as e:
-            print(f"⚠️ Không thể load lịch sử: {e}")
+            logger.warning("⚠️ Không thể load lịch sử: %s", e)
             self.detection_history = []
     
     def save_history(self):
@@ -29,7 +35,7 @@ class HistoryManager:
             with open(self.history_file, 'w', encoding='utf-8') as f:
                 json.dump(self.detection_history, f, ensure_ascii=False, indent=2)
         except Exception as e:
-            print(f"❌ Lỗi lưu lịch sử: {e}")
+            logger.error("❌ Lỗi lưu lịch sử: %s", e)
     
     def add_record(self, detections, source="upload"):
         """
@@ -39,6 +45,43 @@ class HistoryManager:
             detections: List các detection {name, confidence}
             source: Nguồn (upload, camera, ...)
         """
+        self.add_records([(detections, source)])
+    
+    def add_records(self, entries):
+        """
+        Thêm nhiều kết quả vào lịch sử và chỉ ghi file 1 lần
+        
+        Args:
+            entries: List các cặp (detections, source)
+        """
+        if not entries:
+            return
+        records = [self._make_record(detections, source) for detections, source in entries]
+        for record in records:
+            self.detection_history.insert(0, record)
+        
+        if len(self.detection_history) > config.MAX_HISTORY_RECORDS:
+            self.detection_history = self.detection_history[:config.MAX_HISTORY_RECORDS]
+        
+        with get_metrics().timer("history_write"):
+            self.save_history()
+            self.append_detection_log(records)
+    
+    def append_detection_log(self, records):
+        """Ghi thêm các bản ghi vào detection log (mỗi dòng 1 bản ghi)"""
+        if not self.detection_log_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.detection_log_file) or ".", exist_ok=True)
+            with open(self.detection_log_file, 'a', encoding='utf-8') as f:
+                f.write("".join(
+                    json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records
+                ))
+        except Exception as e:
+            logger.error("❌ Lỗi ghi detection log: %s", e)
+    
+    def _make_record(self, detections, source):
+        """Tạo 1 bản ghi lịch sử từ list detection"""
         record = {
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "source": source,
@@ -52,15 +95,10 @@ class HistoryManager:
                 "confidence": det["confidence"]
             })
         
-        self.detection_history.insert(0, record)
-        
-        if len(self.detection_history) > config.MAX_HISTORY_RECORDS:
-            self.detection_history = self.detection_history[:config.MAX_HISTORY_RECORDS]
-        
-        self.save_history()
+        return record
     
     def clear_history(self):
-        """Xóa toàn bộ lịch sử"""
+        """Xóa toàn bộ lịch sử (detection log cho báo cáo vẫn giữ)"""
         self.detection_history = []
         self.save_history()
     
@@ -76,7 +114,7 @@ class HistoryManager:
                 json.dump(self.detection_history, f, ensure_ascii=False, indent=2)
             return True
         except Exception as e:
-            print(f"❌ Lỗi xuất file: {e}")
+            logger.error("❌ Lỗi xuất file: %s", e)
             return False
     
     def get_history(self):
@@ -1,10 +1,46 @@
 # utils/image_utils.py
 """
 Các hàm tiện ích xử lý ảnh
+
+Decode ảnh: DecodePool decode song song trên thread pool (cv2/libjpeg-turbo
+nhả GIL khi decode). Với JPEG lớn hơn `max_side`, ảnh được decode thẳng ra
+1/2, 1/4 hoặc 1/8 kích thước (scaled decode của libjpeg, nhanh hơn nhiều so
+với decode đủ rồi resize): dùng PyTurboJPEG nếu có, không thì
+IMREAD_REDUCED_COLOR_* của OpenCV.
 """
+import io
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
+import numpy as np
 from PIL import Image, ImageTk
 
+import config
+from metrics import get_metrics
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    HAS_TURBOJPEG = True
+except ImportError:
+    HAS_TURBOJPEG = False
+
+logger = logging.getLogger(__name__)
+
+# Hệ số thu nhỏ libjpeg hỗ trợ khi decode (lớn nhất trước)
+JPEG_REDUCTIONS = (8, 4, 2)
+_CV2_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+_turbo = None
+_turbo_lock = threading.Lock()
+
 def resize_image_to_canvas(img, canvas_width, canvas_height):
     """
     Resize ảnh để fit vào canvas
@@ -32,19 +68,192 @@ def resize_image_to_canvas(img, canvas_width, canvas_height):
     
     return img_tk, new_w, new_h
 
-def load_image(file_path):
+def _get_turbo():
+    """TurboJPEG dùng chung (None nếu không có PyTurboJPEG hoặc thiếu libturbojpeg)"""
+    global _turbo, HAS_TURBOJPEG
+    if not HAS_TURBOJPEG:
+        return None
+    with _turbo_lock:
+        if _turbo is None:
+            try:
+                _turbo = TurboJPEG()
+            except Exception as e:
+                logger.warning("⚠️ Không load được libturbojpeg, dùng OpenCV: %s", e)
+                HAS_TURBOJPEG = False
+                return None
+        return _turbo
+
+
+def jpeg_reduction(width, height, max_side):
+    """Hệ số thu nhỏ lớn nhất mà cạnh dài sau decode vẫn >= max_side (1 = decode đủ)"""
+    if not max_side:
+        return 1
+    longest = max(width, height)
+    for factor in JPEG_REDUCTIONS:
+        if longest // factor >= max_side:
+            return factor
+    return 1
+
+
+def _is_jpeg(data):
+    return len(data) > 3 and data[0] == 0xFF and data[1] == 0xD8
+
+
+# EXIF Orientation -> phép biến đổi để ảnh đứng đúng chiều (giống cv2.imdecode)
+_EXIF_ORIENTATION_TAG = 0x0112
+_ORIENT_OPS = {
+    2: lambda img: cv2.flip(img, 1),
+    3: lambda img: cv2.rotate(img, cv2.ROTATE_180),
+    4: lambda img: cv2.flip(img, 0),
+    5: cv2.transpose,
+    6: lambda img: cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE),
+    7: lambda img: cv2.flip(cv2.transpose(img), -1),
+    8: lambda img: cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE),
+}
+
+
+def exif_orientation(data):
+    """Giá trị EXIF Orientation của ảnh (1 nếu không có hoặc không đọc được), chỉ đọc header"""
+    try:
+        return int(Image.open(io.BytesIO(data)).getexif().get(_EXIF_ORIENTATION_TAG, 1))
+    except Exception:
+        return 1
+
+
+def apply_exif_orientation(img, orientation):
+    """Xoay/lật ảnh BGR theo EXIF Orientation (TurboJPEG không tự làm như cv2.imdecode)"""
+    op = _ORIENT_OPS.get(orientation)
+    return img if op is None else op(img)
+
+
+def decode_image(data, max_side=None):
+    """
+    Decode bytes ảnh ra BGR
+
+    Args:
+        data: bytes ảnh
+        max_side: Cạnh dài tối thiểu cần giữ; JPEG lớn hơn được decode thu nhỏ (None = đủ kích thước)
+
+    Returns:
+        (img, factor): ảnh (None nếu lỗi) và hệ số đã thu nhỏ so với ảnh gốc (1, 2, 4, 8)
+    """
+    factor = 1
+    with get_metrics().timer("decode"):
+        if max_side and _is_jpeg(data):
+            turbo = _get_turbo()
+            if turbo is not None:
+                try:
+                    width, height, _, _ = turbo.decode_header(data)
+                    factor = jpeg_reduction(width, height, max_side)
+                    img = turbo.decode(data, pixel_format=TJPF_BGR, scaling_factor=(1, factor))
+                    return apply_exif_orientation(img, exif_orientation(data)), factor
+                except Exception:
+                    factor = 1  # JPEG lạ (CMYK, hỏng một phần...): để OpenCV thử
+            else:
+                try:
+                    # PIL chỉ đọc header để lấy kích thước
+                    width, height = Image.open(io.BytesIO(data)).size
+                    factor = jpeg_reduction(width, height, max_side)
+                except Exception:
+                    factor = 1
+        flag = _CV2_REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR)
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+    return img, factor
+
+
+def load_image(file_path, max_side=None):
     """
     Load ảnh từ file path
     
     Args:
         file_path: Đường dẫn file
+        max_side: Xem decode_image (None = đủ kích thước)
         
     Returns:
         img: Ảnh dạng numpy array hoặc None nếu lỗi
     """
     try:
-        img = cv2.imread(file_path)
+        # Đọc bytes rồi imdecode: chạy được với đường dẫn Unicode trên Windows (cv2.imread thì không)
+        with open(file_path, "rb") as f:
+            data = f.read()
+        img, _ = decode_image(data, max_side)
         return img
     except Exception as e:
-        print(f"❌ Lỗi load ảnh {file_path}: {e}")
-        return None
\ No newline at end of file
+        logger.error("❌ Lỗi load ảnh %s: %s", file_path, e)
+        return None
+
+
+class DecodePool:
+    """Decode ảnh song song trên thread pool, trả kết quả theo thứ tự như 1 stream"""
+
+    def __init__(self, workers=None, max_side=None):
+        """
+        Args:
+            workers: Số thread decode (mặc định config.DECODE_WORKERS, 0 = số CPU)
+            max_side: Xem decode_image
+        """
+        workers = config.DECODE_WORKERS if workers is None else workers
+        self.workers = workers or os.cpu_count() or 1
+        self.max_side = max_side
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="decode")
+
+    def decode(self, source):
+        """
+        Đọc + decode 1 nguồn (chạy trên worker thread)
+
+        Args:
+            source: Đường dẫn file hoặc (name, reader) với reader() trả về bytes
+
+        Returns:
+            (name, img hoặc None, lỗi hoặc None, factor)
+        """
+        if isinstance(source, tuple):
+            name, reader = source
+        else:
+            name, reader = source, None
+        try:
+            if reader is None:
+                with open(name, "rb") as f:
+                    data = f.read()
+            else:
+                data = reader()
+            img, factor = decode_image(data, self.max_side)
+            if img is None:
+                return name, None, "decode failed", 1
+            return name, img, None, factor
+        except Exception as e:
+            return name, None, str(e), 1
+
+    def _decode_then(self, source, postprocess):
+        return postprocess(self.decode(source))
+
+    def imap(self, sources, prefetch=None, postprocess=None):
+        """
+        Decode các nguồn song song, yield kết quả decode() theo đúng thứ tự đầu vào.
+        Chỉ giữ tối đa `prefetch` ảnh đang decode/chờ lấy (mặc định 2 x số thread),
+        nên duyệt được thư mục rất lớn mà không nạp hết vào bộ nhớ.
+
+        postprocess: hàm nhận kết quả decode() và chạy luôn trên worker thread
+        (ví dụ tạo preview); khi có, yield kết quả của nó thay cho decode()
+        """
+        prefetch = prefetch or self.workers * 2
+        pending = deque()
+        for source in sources:
+            if postprocess is None:
+                pending.append(self._pool.submit(self.decode, source))
+            else:
+                pending.append(self._pool.submit(self._decode_then, source, postprocess))
+            if len(pending) >= prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        return False
\ No newline at end of file
@@ -0,0 +1,176 @@
+# inference_server.py
+"""
+Server inference nội bộ (LAN) cho các kiosk cấu hình yếu.
+
+Một máy mạnh load model 1 lần; các kiosk gửi ảnh JPEG/PNG qua HTTP và
+nhận lại detection dạng JSON (xem remote_detector.RemoteDetector).
+Các request đến gần nhau (trong cửa sổ vài ms) được gộp thành 1 batch
+và chạy model 1 lần.
+
+Endpoint:
+    POST /detect?conf=0.5   body = bytes ảnh  -> {"detections": [...], ...}
+    GET  /info                                -> {"names": {...}, "model": ..., ...}
+    GET  /stats                               -> thống kê batch (fill ratio, queue delay)
+
+Cách dùng:
+    python inference_server.py --model best.pt --port 8770 --window-ms 10 --max-batch 8
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import cv2
+import numpy as np
+
+import config
+from batch_scheduler import DetectionScheduler
+from food_core import YOLOModelManager, extract_detections
+from log_utils import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Ảnh lớn hơn mức này bị từ chối (tránh client gửi nhầm file)
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+REQUEST_TIMEOUT = 30
+
+
+def make_inference_handler(model_manager, scheduler):
+    """Tạo lớp Handler dùng chung model_manager và DetectionScheduler"""
+    class InferenceHTTPHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive cho kiosk gửi liên tục
+        timeout = REQUEST_TIMEOUT
+
+        def log_message(self, format, *args):
+            pass  # Tắt log request
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/info":
+                self._send_json(200, {
+                    "names": model_manager.get_class_names(),
+                    "model": os.path.basename(str(model_manager.model_path)),
+                    "window_ms": scheduler.window_ms,
+                    "max_batch": scheduler.max_batch,
+                })
+            elif path == "/stats":
+                self._send_json(200, scheduler.snapshot())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            parsed = urlparse(self.path)
+            if parsed.path != "/detect":
+                self._send_json(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length <= 0 or length > MAX_IMAGE_BYTES:
+                self._send_json(400, {"error": "missing or too large body"})
+                return
+            data = self.rfile.read(length)
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                self._send_json(400, {"error": "cannot decode image"})
+                return
+            query = parse_qs(parsed.query)
+            try:
+                confidence = float((query.get("conf") or [config.DEFAULT_CONFIDENCE])[0])
+            except ValueError:
+                confidence = config.DEFAULT_CONFIDENCE
+
+            future = scheduler.submit(image, confidence)
+            try:
+                result = future.result(REQUEST_TIMEOUT)
+            except FutureTimeout:
+                future.cancel()
+                self._send_json(503, {"error": "timeout"})
+                return
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            h, w = image.shape[:2]
+            self._send_json(200, {
+                "detections": extract_detections(result),
+                "width": w,
+                "height": h,
+                "batch_size": future.batch_size,
+                "queue_ms": round(future.queue_ms, 2),
+                "infer_ms": round(future.exec_ms, 2),
+            })
+
+    return InferenceHTTPHandler
+
+
+class InferenceHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer với thread request dạng daemon"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class InferenceServer:
+    """Quản lý vòng đời server inference"""
+
+    def __init__(self, model_manager, host="0.0.0.0", port=config.INFERENCE_SERVER_PORT,
+                 window_ms=config.INFERENCE_BATCH_WINDOW_MS, max_batch=config.INFERENCE_MAX_BATCH):
+        self.model_manager = model_manager
+        self.host = host
+        self.port = port
+        self.scheduler = DetectionScheduler(model_manager, window_ms, max_batch, name="inference-scheduler")
+        self._httpd = None
+
+    def serve_forever(self):
+        """Chạy server trên thread hiện tại (Ctrl+C để dừng)"""
+        handler = make_inference_handler(self.model_manager, self.scheduler)
+        self._httpd = InferenceHTTPServer((self.host, self.port), handler)
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+            self.scheduler.stop()
+
+    def shutdown(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Server inference YOLO cho các kiosk trong LAN")
+    parser.add_argument("--model", default=config.MODEL_PATH, help="Đường dẫn model .pt")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=config.INFERENCE_SERVER_PORT)
+    parser.add_argument("--window-ms", type=float, default=config.INFERENCE_BATCH_WINDOW_MS,
+                        help="Thời gian chờ gom batch (ms)")
+    parser.add_argument("--max-batch", type=int, default=config.INFERENCE_MAX_BATCH,
+                        help="Số ảnh tối đa mỗi batch")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    model_manager = YOLOModelManager(args.model)
+    if not model_manager.is_loaded():
+        logger.error("❌ Không load được model: %s", args.model)
+        return 2
+
+    server = InferenceServer(model_manager, args.host, args.port, args.window_ms, args.max_batch)
+    logger.info("✅ Inference server: http://%s:%s (window %s ms, batch tối đa %s)",
+                args.host, args.port, args.window_ms, args.max_batch)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("👋 Dừng inference server")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
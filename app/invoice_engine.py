@@ -0,0 +1,292 @@
+# invoice_engine.py
+"""
+Engine hóa đơn dùng chung cho toàn app.
+
+- Dựng hóa đơn (invoice record) từ cart (hoặc detections nếu chưa có cart).
+- Ghi mỗi hóa đơn đúng 1 lần vào store append-only dạng JSON Lines,
+  kèm file index (invoice_id, timestamp, offset, length, total) để tra cứu
+  1 hóa đơn mà không phải đọc cả store.
+- Xuất text / JSON / CSV khi cần.
+"""
+import csv
+import io
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import config
+from metrics import get_metrics
+
+INDEX_FIELDS = ("invoice_id", "timestamp", "offset", "length", "total_price")
+
+
+class InvoiceEngine:
+    """Tạo, lưu và xuất hóa đơn"""
+
+    def __init__(self, store_path=None, index_path=None):
+        self.store_path = Path(store_path or config.INVOICE_STORE_FILE)
+        self.index_path = Path(index_path or config.INVOICE_INDEX_FILE)
+        self._lock = threading.Lock()
+        self._index = None   # invoice_id -> (offset, length), nạp lười khi cần
+        self._last_id = None
+
+    # ===================== BUILD =====================
+
+    def _new_invoice_id(self, now):
+        invoice_id = f"INV_{now.strftime('%Y%m%d_%H%M%S')}"
+        # Tránh trùng id khi 2 hóa đơn trong cùng 1 giây
+        if self._last_id and self._last_id.split("-")[0] == invoice_id:
+            suffix = int(self._last_id.split("-")[1]) + 1 if "-" in self._last_id else 2
+            invoice_id = f"{invoice_id}-{suffix}"
+        self._last_id = invoice_id
+        return invoice_id
+
+    def build_invoice(self, cart, detections, payment_method, food_data=None,
+                      normalize_func=None, session=None):
+        """
+        Dựng hóa đơn từ cart (đã được user xác nhận); nếu chưa có cart thì
+        dùng raw detections (mỗi detection là 1 phần).
+
+        Args:
+            cart: Giỏ hàng {food_key: item}
+            detections: List detection gốc (fallback)
+            payment_method: Tên phương thức thanh toán
+            food_data: Dictionary món ăn (cho fallback)
+            normalize_func: Hàm chuẩn hóa tên class (cho fallback)
+            session: current_session (lưu session_id)
+
+        Returns:
+            dict: invoice record
+        """
+        if cart:
+            items = [self._line_from_cart_item(item) for item in cart.values()]
+        else:
+            items = self._lines_from_detections(detections or [], food_data or {}, normalize_func)
+
+        now = datetime.now()
+        charged = [line for line in items if line["quantity"] > 0]
+        with self._lock:
+            invoice_id = self._new_invoice_id(now)
+        return {
+            "invoice_id": invoice_id,
+            "timestamp": now.isoformat(timespec="seconds"),
+            "session_id": (session or {}).get("id"),
+            "payment_method": payment_method,
+            "items": items,
+            "total_items": sum(line["quantity"] for line in charged),
+            "total_price": sum(line["line_total"] for line in charged),
+            "total_calories": sum(line["calories"] * line["quantity"] for line in charged),
+        }
+
+    @staticmethod
+    def _line_from_cart_item(item):
+        excluded = bool(item.get("excluded"))
+        qty = 0 if excluded else max(0, int(item.get("quantity", 0)))
+        price = item.get("price", 0)
+        return {
+            "key": item.get("key"),
+            "name": item.get("name_vi") or item.get("key"),
+            "quantity": qty,
+            "detected_qty": int(item.get("detected_qty", 0)),
+            "price": price,
+            "calories": item.get("calories", 0),
+            "line_total": price * qty,
+            "avg_conf": round(float(item.get("avg_conf", 0.0)), 4),
+            "excluded": excluded,
+        }
+
+    @staticmethod
+    def _lines_from_detections(detections, food_data, normalize_func):
+        lines = {}
+        for det in detections:
+            key = normalize_func(det["name"]) if normalize_func else det["name"]
+            info = food_data.get(key, {})
+            line = lines.get(key)
+            if line is None:
+                line = lines[key] = {
+                    "key": key,
+                    "name": info.get("name_vi") or det["name"],
+                    "quantity": 0,
+                    "detected_qty": 0,
+                    "price": info.get("price", 0),
+                    "calories": info.get("calories", 0),
+                    "line_total": 0,
+                    "avg_conf": 0.0,
+                    "excluded": False,
+                }
+            line["quantity"] += 1
+            line["detected_qty"] += 1
+            line["line_total"] += line["price"]
+            line["avg_conf"] += float(det.get("confidence", 0))
+        for line in lines.values():
+            line["avg_conf"] = round(line["avg_conf"] / line["detected_qty"], 4)
+        return list(lines.values())
+
+    # ===================== STORE =====================
+
+    def save(self, invoice):
+        """
+        Ghi hóa đơn vào store (append 1 dòng JSON) và thêm 1 dòng vào index.
+
+        Returns:
+            dict: invoice (không đổi)
+        """
+        data = (json.dumps(invoice, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock, get_metrics().timer("invoice_write"):
+            self.store_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.store_path, "ab") as f:
+                offset = f.tell()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            index_line = "\t".join(str(v) for v in (
+                invoice["invoice_id"], invoice["timestamp"], offset, len(data), invoice["total_price"]
+            ))
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(index_line + "\n")
+            if self._index is not None:
+                self._index[invoice["invoice_id"]] = (offset, len(data))
+        return invoice
+
+    def iter_index(self):
+        """Duyệt index dạng dict {invoice_id, timestamp, offset, length, total_price}"""
+        if not self.index_path.exists():
+            return
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != len(INDEX_FIELDS):
+                    continue
+                entry = dict(zip(INDEX_FIELDS, parts))
+                entry["offset"] = int(entry["offset"])
+                entry["length"] = int(entry["length"])
+                entry["total_price"] = int(float(entry["total_price"]))
+                yield entry
+
+    def get(self, invoice_id):
+        """Đọc 1 hóa đơn theo id (seek theo offset trong index). None nếu không có."""
+        with self._lock:
+            if self._index is None:
+                self._index = {e["invoice_id"]: (e["offset"], e["length"]) for e in self.iter_index()}
+            pos = self._index.get(invoice_id)
+        if pos is None:
+            return None
+        with open(self.store_path, "rb") as f:
+            f.seek(pos[0])
+            return json.loads(f.read(pos[1]).decode("utf-8"))
+
+    def iter_invoices(self, since=None, until=None):
+        """
+        Duyệt lần lượt từng hóa đơn trong store (không nạp toàn bộ vào bộ nhớ).
+
+        Args:
+            since, until: Chuỗi ISO timestamp để lọc (bao gồm since, không gồm until)
+        """
+        if not self.store_path.exists():
+            return
+        with open(self.store_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    invoice = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Dòng ghi dở (mất điện giữa chừng)
+                ts = invoice.get("timestamp", "")
+                if since and ts < since:
+                    continue
+                if until and ts >= until:
+                    continue
+                yield invoice
+
+    # ===================== RENDER =====================
+
+    @staticmethod
+    def render_text(invoice):
+        """Hóa đơn dạng text đẹp như siêu thị"""
+        try:
+            when = datetime.fromisoformat(invoice["timestamp"]).strftime("%d/%m/%Y %H:%M:%S")
+        except (KeyError, ValueError):
+            when = invoice.get("timestamp", "")
+        lines = []
+        lines.append(" " * 20 + "🍕 FOOD DETECTION AI")
+        lines.append(" " * 18 + "=" * 30)
+        lines.append(" " * 20 + "HÓA ĐƠN BÁN HÀNG")
+        lines.append(" " * 18 + "=" * 30)
+        lines.append("")
+        lines.append(f"Ngày: {when}")
+        lines.append(f"Mã HĐ: {invoice['invoice_id']}")
+        lines.append(f"Phương thức: {invoice.get('payment_method', '')}")
+        lines.append("-" * 50)
+        lines.append(f"{'Tên món':<25} {'SL':>3} {'Giá':>12} {'TT':>12}")
+        lines.append("-" * 50)
+
+        for line in invoice["items"]:
+            qty = line["quantity"]
+            if qty <= 0:
+                continue
+            name = (line["name"] or "")[:23]
+            lines.append(f"{name:<25} {qty:>3} {line['price']:>11,}đ {line['line_total']:>11,}đ")
+
+        lines.append("-" * 50)
+        lines.append(f"{'Tổng số phần:':<25} {invoice['total_items']:>3}")
+        lines.append(f"{'Tổng calo:':<25} {invoice['total_calories']:,} kcal")
+        lines.append("")
+        lines.append(f"{'TỔNG TIỀN:':<25} {invoice['total_price']:>11,}đ")
+        lines.append("")
+        lines.append(" " * 15 + "Cảm ơn quý khách!")
+        lines.append(" " * 12 + "Hẹn gặp lại 🎉")
+        lines.append("=" * 50)
+        return "\n".join(lines)
+
+    @staticmethod
+    def render_json(invoice):
+        """Hóa đơn dạng JSON (dễ đọc)"""
+        return json.dumps(invoice, ensure_ascii=False, indent=2)
+
+    CSV_FIELDS = ("invoice_id", "timestamp", "payment_method", "key", "name", "quantity",
+                  "detected_qty", "price", "line_total", "calories", "excluded")
+
+    @classmethod
+    def render_csv(cls, invoices):
+        """Xuất 1 hoặc nhiều hóa đơn dạng CSV (mỗi dòng là 1 món)"""
+        if isinstance(invoices, dict):
+            invoices = [invoices]
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=cls.CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for invoice in invoices:
+            for line in invoice["items"]:
+                row = dict(line)
+                row["invoice_id"] = invoice["invoice_id"]
+                row["timestamp"] = invoice["timestamp"]
+                row["payment_method"] = invoice.get("payment_method", "")
+                writer.writerow(row)
+        return buf.getvalue()
+
+    def export(self, invoice, path, fmt="text"):
+        """
+        Ghi hóa đơn ra file theo định dạng "text", "json" hoặc "csv".
+
+        Returns:
+            str: Đường dẫn file
+        """
+        renderers = {"text": self.render_text, "json": self.render_json, "csv": self.render_csv}
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(renderers[fmt](invoice), encoding="utf-8")
+        return str(path)
+
+
+_default_engine = None
+
+
+def get_invoice_engine():
+    """Engine dùng chung (store theo config)"""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = InvoiceEngine()
+    return _default_engine
@@ -5,14 +5,73 @@ Màn hình loading chuyên nghiệp
 from tkinter import *
 import config
 import math
+import queue
+
+
+class SpinnerScene:
+    """
+    Spinner 8 chấm được tạo 1 lần trên canvas; mỗi frame chỉ dời tọa độ
+    các item có sẵn (canvas.coords) thay vì delete("all") rồi vẽ lại.
+    """
+    
+    def __init__(self, canvas, center_x=100, center_y=100, radius=50, num_dots=8,
+                 dot_sizes=None, dot_colors=None, center_text=None, step_deg=10):
+        """
+        Args:
+            canvas: Canvas để vẽ
+            dot_sizes: Bán kính từng chấm (mặc định 8)
+            dot_colors: Màu từng chấm
+            center_text: Text/icon ở giữa (None nếu không có)
+            step_deg: Số độ quay mỗi frame
+        """
+        self.canvas = canvas
+        self.center_x = center_x
+        self.center_y = center_y
+        self.radius = radius
+        self.num_dots = num_dots
+        self.step_deg = step_deg
+        self.angle = 0
+        self.dot_sizes = dot_sizes or [8] * num_dots
+        dot_colors = dot_colors or [config.COLORS['accent_green']] * num_dots
+        
+        self.dots = [
+            canvas.create_oval(0, 0, 0, 0, fill=color, outline="")
+            for color in dot_colors
+        ]
+        self.text_item = None
+        if center_text:
+            self.text_item = canvas.create_text(center_x, center_y, text=center_text, font=("Arial", 40))
+        self._place_dots()
+    
+    def _place_dots(self):
+        """Đặt lại vị trí các chấm theo góc hiện tại"""
+        for i, item in enumerate(self.dots):
+            rad = math.radians((self.angle + i * 360 / self.num_dots) % 360)
+            x = self.center_x + self.radius * math.cos(rad)
+            y = self.center_y + self.radius * math.sin(rad)
+            size = self.dot_sizes[i]
+            self.canvas.coords(item, x - size, y - size, x + size, y + size)
+    
+    def step(self):
+        """Quay spinner thêm 1 bước"""
+        self.angle = (self.angle + self.step_deg) % 360
+        self._place_dots()
+
 
 class LoadingScreen:
+    # Chu kỳ frame của animation (ms)
+    FRAME_MS = 50
+    
     def __init__(self, parent):
         self.parent = parent
         self.window = None
         self.canvas = None
-        self.angle = 0
+        self.spinner = None
+        self.message_label = None
+        self.progress_label = None
         self.is_active = False
+        # Cập nhật message/progress từ thread khác đi qua queue, được xử lý trong _tick
+        self._updates = queue.Queue()
         
     def show(self, message="Đang xử lý..."):
         """Hiển thị màn hình loading"""
@@ -77,72 +136,56 @@ class LoadingScreen:
         )
         self.progress_label.pack(pady=5)
         
-        self.is_active = True
-        self.animate_spinner()
-        
-        self.window.update()
-    
-    def animate_spinner(self):
-        """Animate loading spinner"""
-        if not self.is_active or not self.window or not self.window.winfo_exists():
-            return
-        
-        self.canvas.delete("all")
-        
-        # Vẽ spinner với 8 dots
-        center_x, center_y = 100, 100
-        radius = 50
+        # Spinner dựng 1 lần: chấm đầu to và sáng, mờ dần về sau
         num_dots = 8
-        
+        dot_sizes = [8 - (i * 0.5) for i in range(num_dots)]
+        dot_colors = []
         for i in range(num_dots):
-            angle = (self.angle + i * 45) % 360
-            rad = math.radians(angle)
-            
-            x = center_x + radius * math.cos(rad)
-            y = center_y + radius * math.sin(rad)
-            
-            # Độ mờ dần
             alpha = 1 - (i / num_dots)
-            size = 8 - (i * 0.5)
-            
-            # Màu gradient
             if alpha > 0.7:
-                color = config.COLORS['accent_green']
+                dot_colors.append(config.COLORS['accent_green'])
             elif alpha > 0.4:
-                color = config.COLORS['accent_purple']
+                dot_colors.append(config.COLORS['accent_purple'])
             else:
-                color = config.COLORS['text_gray']
-            
-            self.canvas.create_oval(
-                x - size, y - size,
-                x + size, y + size,
-                fill=color,
-                outline=""
-            )
-        
-        # Vẽ icon giữa
-        self.canvas.create_text(
-            center_x, center_y,
-            text="🍜",
-            font=("Arial", 40),
+                dot_colors.append(config.COLORS['text_gray'])
+        self.spinner = SpinnerScene(
+            self.canvas, num_dots=num_dots, dot_sizes=dot_sizes,
+            dot_colors=dot_colors, center_text="🍜"
         )
         
-        self.angle = (self.angle + 10) % 360
-        
-        if self.is_active:
-            self.window.after(50, self.animate_spinner)
+        self.is_active = True
+        self.window.update_idletasks()
+        self.window.after(self.FRAME_MS, self._tick)
+    
+    def _tick(self):
+        """1 callback `after` duy nhất: áp dụng các cập nhật đang chờ rồi quay spinner"""
+        if not self.is_active or not self.window or not self.window.winfo_exists():
+            return
+        self._drain_updates()
+        self.spinner.step()
+        self.window.after(self.FRAME_MS, self._tick)
+    
+    def _drain_updates(self):
+        """Lấy hết cập nhật trong queue, mỗi label chỉ set giá trị mới nhất"""
+        latest = {}
+        while True:
+            try:
+                kind, text = self._updates.get_nowait()
+            except queue.Empty:
+                break
+            latest[kind] = text
+        if "message" in latest and self.message_label.winfo_exists():
+            self.message_label.config(text=latest["message"])
+        if "progress" in latest and self.progress_label.winfo_exists():
+            self.progress_label.config(text=latest["progress"])
     
     def update_message(self, message):
-        """Cập nhật message"""
-        if self.message_label and self.message_label.winfo_exists():
-            self.message_label.config(text=message)
-            self.window.update()
+        """Cập nhật message (an toàn khi gọi từ thread khác)"""
+        self._updates.put(("message", message))
     
     def update_progress(self, text):
-        """Cập nhật progress text"""
-        if self.progress_label and self.progress_label.winfo_exists():
-            self.progress_label.config(text=text)
-            self.window.update()
+        """Cập nhật progress text (an toàn khi gọi từ thread khác)"""
+        self._updates.put(("progress", text))
     
     def close(self):
         """Đóng màn hình loading"""
@@ -0,0 +1,167 @@
+# log_utils.py
+"""
+Cấu hình logging cho app và các CLI (thay cho print trên hot path).
+
+- Mọi module dùng `logger = logging.getLogger(__name__)`.
+- Record đi qua QueueHandler (gọi từ thread nào cũng chỉ tốn 1 lần put vào
+  queue); QueueListener ghi ra console và file xoay vòng (JSON Lines) trên
+  thread nền, nên console chậm (Windows) không chặn thread UI/detect.
+- RateLimitFilter: cùng 1 mẫu message chỉ được ghi tối đa `burst` lần mỗi
+  `interval` giây; số lần bị bỏ qua được ghi kèm lần kế tiếp.
+- Log của ultralytics đi chung đường này (food_core gỡ handler riêng của nó
+  khi load model).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+import config
+
+CONSOLE_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# Thuộc tính có sẵn của LogRecord (phần còn lại là field từ extra=...)
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class RateLimitFilter(logging.Filter):
+    """Giới hạn số lần ghi mỗi mẫu message (logger + format string) trong 1 cửa sổ thời gian"""
+
+    def __init__(self, interval=10.0, burst=5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._windows = {}  # (logger, msg) -> [bắt đầu cửa sổ, số lần đã ghi, số lần bỏ qua]
+
+    def filter(self, record):
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 4096:
+                    self._windows = {k: w for k, w in self._windows.items() if now - w[0] < self.interval}
+            elif window[1] < self.burst:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class LoggerLevelFilter(logging.Filter):
+    """Bỏ record dưới `level` của 1 nhánh logger (ultralytics tự đặt lại level của nó khi import)"""
+
+    def __init__(self, prefix, level):
+        super().__init__()
+        self.prefix = prefix
+        self.level = level if isinstance(level, int) else logging.getLevelName(level)
+
+    def filter(self, record):
+        if record.levelno >= self.level:
+            return True
+        return not (record.name == self.prefix or record.name.startswith(self.prefix + "."))
+
+
+class JsonFormatter(logging.Formatter):
+    """1 dòng JSON mỗi record: ts, level, logger, thread, msg + các field truyền qua extra="""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Format dễ đọc cho console, ghi chú số lần bị rate limit"""
+
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" (+{suppressed} lần lặp lại bị bỏ qua)"
+        return text
+
+
+def setup_logging(level=None, log_file=None, stream=None):
+    """
+    Cấu hình root logger (gọi 1 lần khi khởi động; các lần sau không làm gì)
+
+    Args:
+        level: Mức log console/file (mặc định config.LOG_LEVEL)
+        log_file: File log xoay vòng (mặc định config.LOG_FILE; "" để tắt)
+        stream: Stream cho console (mặc định sys.stderr, để stdout của CLI chỉ chứa kết quả)
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        level = level or config.LOG_LEVEL
+        log_file = config.LOG_FILE if log_file is None else log_file
+
+        handlers = []
+        console = logging.StreamHandler(stream or sys.stderr)
+        console.setFormatter(ConsoleFormatter(CONSOLE_FORMAT, datefmt="%H:%M:%S"))
+        handlers.append(console)
+        if log_file:
+            try:
+                os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+                file_handler = logging.handlers.RotatingFileHandler(
+                    log_file, maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT,
+                    encoding="utf-8", delay=True
+                )
+                file_handler.setFormatter(JsonFormatter())
+                handlers.append(file_handler)
+            except OSError as e:
+                sys.stderr.write(f"⚠️ Không mở được file log {log_file}: {e}\n")
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(LoggerLevelFilter("ultralytics", config.ULTRALYTICS_LOG_LEVEL))
+        queue_handler.addFilter(RateLimitFilter(config.LOG_RATE_LIMIT_INTERVAL_S, config.LOG_RATE_LIMIT_BURST))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Ghi nốt các record còn trong queue và dừng thread ghi log"""
+    global _listener
+    with _setup_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
@@ -1,13 +1,124 @@
 # main.py
 
-from tkinter import Tk
-from main_window import MainWindow
+import argparse
+import os
+import subprocess
+import sys
+import time
 
-def main():
+import config
+from log_utils import setup_logging
+
+STARTUP_PROFILE_DIR = "startup_profile"
+
+
+def import_time_breakdown(module="main_window", top=40):
+    """
+    Đo thời gian import (python -X importtime) trong process riêng
+
+    Returns:
+        list: [(cumulative_us, self_us, module), ...] giảm dần theo cumulative
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        rows.append((int(parts[1]), int(parts[0]), parts[2].rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def profile_startup(out_dir=STARTUP_PROFILE_DIR):
+    """
+    Đo thời gian khởi động: bảng import, cProfile của MainWindow.__init__
+    và thời gian tới khi cửa sổ hiện. Đóng app sau khi đo.
+    """
+    import cProfile
+    import pstats
+
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    rows = import_time_breakdown()
+    imports_path = os.path.join(out_dir, "import_time.txt")
+    with open(imports_path, "w", encoding="utf-8") as f:
+        f.write(f"{'cumulative ms':>14} {'self ms':>9}  module\n")
+        for cumulative, self_us, module in rows:
+            f.write(f"{cumulative / 1000:>14.1f} {self_us / 1000:>9.1f}  {module}\n")
+
+    t0 = time.perf_counter()
+    from tkinter import Tk
+    from main_window import MainWindow
+    import_s = time.perf_counter() - t0
+
+    root = Tk()
+    profiler = cProfile.Profile()
+    t0 = time.perf_counter()
+    profiler.enable()
+    app = MainWindow(root)
+    profiler.disable()
+    init_s = time.perf_counter() - t0
+    root.update_idletasks()
+    root.update()
+    window_s = time.perf_counter() - t0
+
+    prof_path = os.path.join(out_dir, "main_window_init.prof")
+    profiler.dump_stats(prof_path)
+    stats_path = os.path.join(out_dir, "main_window_init.txt")
+    with open(stats_path, "w", encoding="utf-8") as f:
+        pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+
+    print("⏱️ Startup profile:")
+    print(f"   import main_window:  {import_s * 1000:8.1f} ms")
+    print(f"   MainWindow.__init__: {init_s * 1000:8.1f} ms")
+    print(f"   cửa sổ hiện sau:     {(import_s + window_s) * 1000:8.1f} ms")
+    if rows:
+        print("   import chậm nhất:")
+        for cumulative, _, module in rows[:5]:
+            print(f"     {cumulative / 1000:8.1f} ms  {module.strip()}")
+    print(f"📄 {imports_path}, {stats_path}, {prof_path} (mở bằng snakeviz/pstats)")
+    print(f"   (tổng thời gian đo: {time.perf_counter() - started:.1f}s)")
+
+    app.on_close()
+
+
+def main(argv=None):
     """Khởi chạy ứng dụng"""
+    parser = argparse.ArgumentParser(description="Food Detection App")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Đo thời gian import + MainWindow.__init__ rồi thoát")
+    parser.add_argument("--profile-dir", default=STARTUP_PROFILE_DIR,
+                        help="Thư mục ghi kết quả --profile-startup")
+    parser.add_argument("--replay", nargs="+", metavar="PATH",
+                        help="Dùng file video / thư mục frame thay cho camera (BẬT CAMERA để phát)")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="Tốc độ phát lại (1 = thời gian thực, 0 = nhanh hết mức)")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+
+    if args.replay:
+        config.CAMERA_SOURCES = [{"id": f"replay{i}", "source": path, "speed": args.replay_speed}
+                                 for i, path in enumerate(args.replay)]
+
+    if args.profile_startup:
+        profile_startup(args.profile_dir)
+        return
+
+    from tkinter import Tk
+    from main_window import MainWindow
     root = Tk()
     app = MainWindow(root)
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -2,48 +2,74 @@
 """
 Cửa sổ chính của ứng dụng Food Detection - Tất cả UI trong 1 cửa sổ
 """
-import cv2
 from tkinter import *
 from tkinter import filedialog, messagebox
 from pathlib import Path
 from datetime import datetime
-from urllib.parse import urlparse, parse_qs
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import json
-import os
-import socket
+import logging
 import threading
+import time
 import math
+from collections import deque
 
 import config
-from yolo_model import YOLOModelManager
-from image_utils import resize_image_to_canvas, load_image
+from yolo_model import YOLOModelManager, extract_detections
+from batch_scheduler import DetectionScheduler
+from image_utils import resize_image_to_canvas, DecodePool
 from history_utils import HistoryManager
 from cart_manager import CartManager
-from payment_handler import PaymentHandler
+from food_core import FoodTable, load_food_data
+from chart_cache import get_chart_cache
+from loading_screen import SpinnerScene
+from ui_dispatcher import (
+    UIDispatcher, COALESCE_LATEST, COALESCE_BATCH,
+    EVENT_PROGRESS, EVENT_STATUS, EVENT_HISTORY, EVENT_IMAGE_RESULT,
+    EVENT_DETECTION_DONE, EVENT_DETECTION_ERROR,
+)
+from payment_handler import PaymentHandler, PAYMENT_QR_SIZE
+from metrics import get_metrics
+from multi_camera import MultiCameraManager, RECONNECT_DELAY, parse_camera_sources, tile_frames
+from session_images import CompactDetections, SessionImageStore
 
-try:
-    import qrcode
-    from PIL import Image, ImageTk
-    HAS_QR = True
-except ImportError:
-    HAS_QR = False
+logger = logging.getLogger(__name__)
 
+# Các bước hiện trên overlay hiệu năng (theo thứ tự)
+PERF_OVERLAY_STAGES = ("capture", "decode", "preprocess", "inference", "postprocess", "annotate",
+                       "render", "result_screen", "history_write", "invoice_write", "detect_total")
 
 
 class MainWindow:
-    def __init__(self, root):
+    def __init__(self, root, model_manager=None):
+        """
+        Args:
+            root: Tk root
+            model_manager: Model dùng thay cho model mặc định (benchmark, test); chưa load
+                           thì vẫn được load ở thread nền như bình thường
+        """
         self.root = root
         self.root.title("🍕 Food Detection AI - YOLOv8 (Multi-Image)")
         self.root.geometry(f"{config.WINDOW_WIDTH}x{config.WINDOW_HEIGHT}")
         self.root.configure(bg=config.COLORS['bg_dark'])
         
-        # Load model
-        self.model_manager = YOLOModelManager()
+        # Model (hoặc kết nối inference server nếu có cấu hình) được load ở thread nền
+        # sau khi cửa sổ đã hiện, xem _start_model_loading
+        if model_manager is not None:
+            self.model_manager = model_manager
+        elif config.INFERENCE_SERVER_URL:
+            from remote_detector import RemoteDetector
+            self.model_manager = RemoteDetector(config.INFERENCE_SERVER_URL, show_errors=False, load=False)
+        else:
+            self.model_manager = YOLOModelManager(show_errors=False, load=False)
+        self.model_loading = False
+        # Mọi lần detect (camera, upload) đi qua scheduler để gom batch
+        self.detect_scheduler = DetectionScheduler(self.model_manager)
         
         # Load food data từ food_36.json
         self.food_data = self.load_food_data()
         
+        # Bảng giá/dinh dưỡng theo class id (dùng cho tính tổng dạng vector)
+        self.food_table = self.build_food_table()
+        
         # History manager
         self.history_manager = HistoryManager()
         
@@ -60,14 +86,22 @@ class MainWindow:
         )
         
         # Variables
-        self.cap = None
+        self.camera_manager = None
         self.is_camera_running = False
         self.current_image = None
+        self.camera_frames = {}  # camera_id -> frame mới nhất (camera mode)
+        self._camera_annotated = {}  # camera_id -> (result, frame đã vẽ box) khi detect liên tục
+        self._camera_results_shown = None  # Các result đang hiện trong panel kết quả (detect liên tục)
+        self._camera_started_at = 0.0
         self.confidence_threshold = config.DEFAULT_CONFIDENCE
         
-        # Multi-image variables
-        self.uploaded_images = []
+        # Multi-image variables: ảnh upload giữ gọn trong ngân sách bộ nhớ (session_images.py)
+        self.uploaded_images = SessionImageStore()
         self.current_index = 0
+        # Ảnh upload được decode song song ở thread nền (threads tạo khi dùng lần đầu)
+        self.decode_pool = DecodePool(max_side=config.DECODE_MAX_SIDE)
+        self.uploading = False
+        self._upload_generation = 0  # Tăng mỗi lần upload/reset để bỏ ảnh của lần upload cũ
         
         # Current detections (cho result screen)
         self.current_detections = []
@@ -80,6 +114,7 @@ class MainWindow:
         # Payment state
         self._last_payment_method = None
         self._last_invoice_path = None
+        self._last_invoice = None  # Hóa đơn đã ghi vào invoice store của phiên vừa thanh toán
         
         # Screen states
         self.current_screen = "main"  # "main", "loading", "result", "payment", "payment_success"
@@ -91,39 +126,96 @@ class MainWindow:
         self.payment_frame = None
         self.payment_success_frame = None
         
+        # Handle widget của màn hình kết quả (cập nhật tối thiểu khi cart đổi)
+        self._result_render_key = None
+        self._cart_row_widgets = {}
+        self._result_summary_labels = {}
+        
         # Store for animation
-        self.loading_angle = 0
+        self.loading_spinner = None
         self.is_loading_active = False
         
-        # Payment: server link + cửa sổ thanh toán (để đóng khi web xác nhận)
-        self.payment_handler.start_payment_server(self)
+        # Cập nhật UI từ worker thread đi qua dispatcher (pump trên Tk thread)
+        self.ui_dispatcher = UIDispatcher(self.root)
+        
+        # Đo hiệu năng + overlay (F12)
+        self.metrics = get_metrics()
+        self.perf_overlay = None
+        self._perf_overlay_after = None  # id của root.after đang chờ cập nhật overlay
         
         self.setup_ui()
+        self._register_ui_handlers()
+        self.ui_dispatcher.start()
+        
+        self.root.bind("<F12>", self.toggle_perf_overlay)
+        if config.SHOW_PERF_OVERLAY:
+            self.toggle_perf_overlay()
+        if self.metrics.enabled and config.METRICS_FILE:
+            self.root.after(config.METRICS_EXPORT_INTERVAL_S * 1000, self._export_metrics_periodically)
+        
+        # Việc chậm chạy sau khi cửa sổ đã hiện: server thanh toán (link cho QR) và load model
+        self.root.after_idle(self.payment_handler.start_payment_server, self)
+        if not self.model_manager.is_loaded():
+            self._start_model_loading()
+        
+        # Đóng cửa sổ -> dừng server thanh toán, camera rồi mới thoát
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
     
     def load_food_data(self):
         """Load dữ liệu món ăn từ JSON"""
-        try:
-            if os.path.exists(config.FOOD_DATA_FILE):
-                with open(config.FOOD_DATA_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            else:
-                print(f"⚠️ Không tìm thấy file {config.FOOD_DATA_FILE}")
-                return {}
-        except Exception as e:
-            print(f"❌ Lỗi load food data: {e}")
-            return {}
+        return load_food_data(config.FOOD_DATA_FILE)
     
+    def _start_model_loading(self):
+        """Load model (import ultralytics/torch + weights) trên thread nền để cửa sổ hiện ngay"""
+        self.model_loading = True
+        self.status_label.config(text="⏳ Đang load model...")
+        
+        def load():
+            ok = self.model_manager.load_model()
+            self.ui_dispatcher.call(self._on_model_loaded, ok)
+        
+        threading.Thread(target=load, name="model-loader", daemon=True).start()
+    
+    def _on_model_loaded(self, ok):
+        """Model load xong (Tk thread): dựng FoodTable hoặc báo lỗi"""
+        self.model_loading = False
+        if ok:
+            self.food_table = self.build_food_table()
+            self.status_label.config(text="✅ Ready! Upload nhiều ảnh để detect")
+            return
+        self.status_label.config(text="❌ Model chưa được load!")
+        messagebox.showerror(
+            "Lỗi Model",
+            f"Không thể load model:\n{self.model_manager.load_error}\n\n"
+            f"Đảm bảo file model tồn tại tại:\n{self.model_manager.model_path}"
+        )
+    
+    def build_food_table(self):
+        """Biên dịch food_data thành FoodTable theo class id của model (None nếu model chưa load)"""
+        class_names = self.model_manager.get_class_names()
+        if not class_names:
+            return None
+        return FoodTable(self.food_data, class_names, self.normalize_food_key)
     
-    def on_payment_success_from_web(self, method):
-        """Gọi từ server khi điện thoại mở link thanh toán → chuyển sang màn hình thành công."""
+    def on_payment_success_from_web(self, method, session_id=None):
+        """
+        Gọi từ server (trên Tk thread) khi điện thoại mở link thanh toán lần đầu
+        → chuyển sang màn hình thành công. Token của phiên cũ/đã đóng bị bỏ qua.
+        """
         name_map = {"cash": "Tiền mặt", "momo": "Momo", "zalopay": "ZaloPay", "vietqr": "VietQR"}
         method_name = name_map.get(method, method)
+        if session_id is not None and (self.current_session or {}).get("id") != session_id:
+            logger.warning("⚠️ Bỏ qua xác nhận thanh toán của phiên cũ: %s", session_id)
+            return
+        if self.current_session and self.current_session.get("status") == "paid":
+            return  # Đã ở trạng thái thanh toán rồi
         if getattr(self, "cart", None):
             if self.current_session:
                 self.current_session["status"] = "paid"
             # Lưu thông tin thanh toán để hiển thị
             self._last_payment_method = method_name
             self._last_invoice_path = None  # Chưa xuất hóa đơn
+            self._record_invoice(method_name)
             # Chuyển sang màn hình thành công
             self.show_screen("payment_success")
         else:
@@ -485,6 +577,14 @@ class MainWindow:
         )
         self.loading_canvas.pack(pady=20)
         
+        # Spinner dựng 1 lần, animate bằng cách dời tọa độ các chấm
+        num_dots = 8
+        dot_colors = []
+        for i in range(num_dots):
+            intensity = int(255 * (i + 1) / num_dots)
+            dot_colors.append(f'#{intensity:02x}{intensity//2:02x}88')
+        self.loading_spinner = SpinnerScene(self.loading_canvas, num_dots=num_dots, dot_colors=dot_colors)
+        
         # Message
         self.loading_message_label = Label(
             main_container,
@@ -579,6 +679,7 @@ class MainWindow:
     def cancel_result(self):
         """Hủy kết quả nhận diện hiện tại và về trang chính"""
         if messagebox.askyesno("Xác nhận", "Bạn có chắc muốn hủy kết quả nhận diện này?"):
+            self._revoke_session_token()
             self.current_detections = []
             self.show_screen("main")
             self.status_label.config(text="✅ Đã hủy kết quả. Bạn có thể detect lại.")
@@ -714,7 +815,11 @@ class MainWindow:
             self.animate_spinner()
         elif screen_name == "result":
             self.result_frame.place(relx=0, rely=0, relwidth=1, relheight=1)
-            self.display_result_screen()
+            with self.metrics.timer("result_screen"):
+                self.display_result_screen()
+            # Render trước QR thanh toán để đổi hình thức thanh toán không bị khựng
+            if self.current_session:
+                self.payment_handler.prerender_session_qr(self.current_session.get("id"))
         elif screen_name == "payment":
             self.payment_frame.place(relx=0, rely=0, relwidth=1, relheight=1)
             self.display_payment_screen()
@@ -727,29 +832,22 @@ class MainWindow:
         if not self.is_loading_active or self.current_screen != "loading":
             return
         
-        self.loading_canvas.delete("all")
-        
-        # Vẽ spinner
-        center_x, center_y = 100, 100
-        radius = 50
-        num_dots = 8
-        
-        for i in range(num_dots):
-            angle = (self.loading_angle + i * 45) % 360
-            rad = math.radians(angle)
-            
-            x = center_x + radius * math.cos(rad)
-            y = center_y + radius * math.sin(rad)
-            
-            # Màu sắc khác nhau tùy theo vị trí
-            intensity = int(255 * (i + 1) / num_dots)
-            color = f'#{intensity:02x}{intensity//2:02x}88'
-            
-            self.loading_canvas.create_oval(x-8, y-8, x+8, y+8, fill=color, outline=color)
-        
-        self.loading_angle = (self.loading_angle + 10) % 360
+        self.loading_spinner.step()
         self.root.after(50, self.animate_spinner)
     
+    def post_loading_status(self, message=None, progress=None):
+        """
+        Gửi message/progress cho màn hình loading (an toàn khi gọi từ worker thread).
+        Nhiều cập nhật trong cùng 1 frame được gộp, chỉ áp dụng bản mới nhất.
+        """
+        payload = {}
+        if message is not None:
+            payload["message"] = message
+        if progress is not None:
+            payload["progress"] = progress
+        if payload:
+            self.ui_dispatcher.post(EVENT_PROGRESS, payload)
+    
     def update_confidence(self, value):
         """Update confidence threshold"""
         self.confidence_threshold = float(value)
@@ -766,25 +864,66 @@ class MainWindow:
             return
         
         # Clear previous uploads
-        self.uploaded_images = []
+        self._cancel_upload()
+        self.uploaded_images.clear()
         self.current_index = 0
+        self.update_navigation()
         
-        # Load all images
-        for path in file_paths:
-            img = load_image(path)
-            if img is not None:
-                self.uploaded_images.append({
-                    'path': path,
-                    'image': img,
-                    'detected_image': None,
-                    'results': None
-                })
-        
-        if len(self.uploaded_images) > 0:
+        # Decode song song ở thread nền; ảnh đầu tiên hiện ngay khi decode xong
+        self.uploading = True
+        self.status_label.config(text=f"📁 Đang đọc {len(file_paths)} ảnh...")
+        threading.Thread(
+            target=self._decode_uploads,
+            args=(list(file_paths), self._upload_generation),
+            name="upload-decode",
+            daemon=True,
+        ).start()
+    
+    def _cancel_upload(self):
+        """Bỏ các ảnh của lần upload đang decode dở (nếu có)"""
+        self._upload_generation += 1
+        self.uploading = False
+    
+    def _decode_uploads(self, paths, generation):
+        """Worker thread: decode ảnh + tạo preview trên decode pool, đưa từng ảnh lên Tk thread theo thứ tự"""
+        store = self.uploaded_images
+
+        def with_preview(decoded):
+            path, img, error, _ = decoded
+            return path, img, error, (store.make_preview(img) if img is not None else None)
+
+        for path, img, error, preview in self.decode_pool.imap(paths, postprocess=with_preview):
+            if generation != self._upload_generation:
+                return
+            if img is None:
+                logger.error("❌ Lỗi load ảnh %s: %s", path, error)
+                continue
+            self.ui_dispatcher.call(self._on_upload_decoded, generation, path, img, preview)
+        self.ui_dispatcher.call(self._on_upload_done, generation, len(paths))
+    
+    def _on_upload_decoded(self, generation, path, img, preview):
+        if generation != self._upload_generation:
+            return
+        self.uploaded_images.add(path, img, preview)
+        if len(self.uploaded_images) == 1:
             self.current_index = 0
             self.display_current_image()
-            self.update_navigation()
-            self.status_label.config(text=f"📁 Đã load {len(self.uploaded_images)} ảnh")
+        else:
+            self.image_counter_label.config(
+                text=f"📸 Ảnh {self.current_index + 1}/{len(self.uploaded_images)}: "
+                     f"{Path(self.uploaded_images[self.current_index].path).name}"
+            )
+        self.update_navigation()
+        self.status_label.config(text=f"📁 Đang đọc ảnh... ({len(self.uploaded_images)})")
+    
+    def _on_upload_done(self, generation, total):
+        if generation != self._upload_generation:
+            return
+        self.uploading = False
+        if len(self.uploaded_images) > 0:
+            self.status_label.config(
+                text=f"📁 Đã load {len(self.uploaded_images)}/{total} ảnh | {self.uploaded_images.memory_text()}"
+            )
         else:
             messagebox.showerror("Lỗi", "Không thể load ảnh nào!")
     
@@ -809,20 +948,20 @@ class MainWindow:
         
         current = self.uploaded_images[self.current_index]
         
-        # Ưu tiên hiển thị ảnh đã detect
-        if current['detected_image'] is not None:
-            self.display_image(current['detected_image'])
-            if current['results'] is not None:
-                self.show_results(current['results'])
+        # Ảnh đã detect được vẽ box lại từ preview + detections
+        view = self.uploaded_images.view(current)
+        if view is not None:
+            self.display_image(view)
+        if current.is_detected:
+            self.show_detections(current.detections.to_list())
         else:
-            self.display_image(current['image'])
             self.results_text.delete(1.0, END)
             self.results_text.insert(END, "⚠️ Chưa detect ảnh này\n\n")
             self.results_text.insert(END, "Nhấn nút DETECT để nhận diện")
         
         # Update counter
         self.image_counter_label.config(
-            text=f"📸 Ảnh {self.current_index + 1}/{len(self.uploaded_images)}: {Path(current['path']).name}"
+            text=f"📸 Ảnh {self.current_index + 1}/{len(self.uploaded_images)}: {Path(current.path).name}"
         )
     
     def update_navigation(self):
@@ -837,65 +976,117 @@ class MainWindow:
     def toggle_camera(self):
         """Bật/tắt camera"""
         if not self.is_camera_running:
-            self.uploaded_images = []
+            self._cancel_upload()
+            self.uploaded_images.clear()
             self.current_index = 0
             self.update_navigation()
             self.image_counter_label.config(text="📷 Camera Mode")
             
-            self.cap = cv2.VideoCapture(0)
-            if self.cap.isOpened():
-                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, config.CAMERA_WIDTH)
-                self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config.CAMERA_HEIGHT)
-                self.cap.set(cv2.CAP_PROP_FPS, config.CAMERA_FPS)
-                
-                self.is_camera_running = True
-                self.btn_camera.config(text="⏸️ TẮT CAMERA", bg=config.COLORS['accent_orange'])
-                self.status_label.config(text="📷 Camera đang chạy...")
-                self.update_camera()
-            else:
-                self.status_label.config(text="❌ Không thể mở camera!")
+            sources = parse_camera_sources(config.CAMERA_SOURCES)
+            if not sources:
+                self.status_label.config(text="❌ Chưa cấu hình camera (CAMERA_SOURCES)!")
+                return
+            # Mỗi camera mở/đọc trên thread riêng (RTSP có thể mất vài giây để kết nối)
+            self.camera_manager = MultiCameraManager(
+                sources,
+                detect_scheduler=self.detect_scheduler,
+                confidence=lambda: self.confidence_threshold,
+                live_detect=config.CAMERA_LIVE_DETECT,
+            )
+            self.camera_manager.start()
+            self.camera_frames = {}
+            self._camera_started_at = time.perf_counter()
+            self._camera_results_shown = None
+            
+            self.is_camera_running = True
+            self.btn_camera.config(text="⏸️ TẮT CAMERA", bg=config.COLORS['accent_orange'])
+            self.status_label.config(text=f"📷 Đang mở {len(sources)} camera...")
+            self.update_camera()
         else:
             self.stop_camera()
     
     def stop_camera(self):
         """Dừng camera"""
         self.is_camera_running = False
-        if self.cap:
-            self.cap.release()
+        self._release_cameras()
         self.btn_camera.config(text="📷 BẬT CAMERA", bg=config.COLORS['accent_blue'])
         self.status_label.config(text="⏸️ Camera đã tắt")
         self.image_counter_label.config(text="📸 Chưa có ảnh")
     
+    def _release_cameras(self):
+        """Dừng các thread capture/điều phối (nếu có)"""
+        if self.camera_manager is not None:
+            self.camera_manager.stop()
+            self.camera_manager = None
+        self.camera_frames = {}
+        self._camera_annotated = {}
+        self._camera_results_shown = None
+    
     def update_camera(self):
-        """Update camera frame"""
-        if self.is_camera_running:
-            ret, frame = self.cap.read()
-            if ret:
-                self.current_image = frame
-                self.display_image(frame)
-            self.root.after(30, self.update_camera)
+        """Hiển thị frame mới nhất của các camera (ghép ngang nếu nhiều camera)"""
+        if not self.is_camera_running or self.camera_manager is None:
+            return
+        manager = self.camera_manager
+        frames = manager.latest_frames()
+        if frames:
+            if not self.camera_frames:
+                # FPS từng camera xem trên overlay F12, không ghi đè thanh trạng thái mỗi frame
+                self.status_label.config(text=f"📷 {len(frames)}/{len(manager.workers)} camera đang chạy...")
+            self.camera_frames = frames
+            preview = dict(frames)
+            if manager.live_detect:
+                # Frame đã detect gần nhất của từng camera (nếu có)
+                results = manager.latest_results()
+                for cam, res in results.items():
+                    cached = self._camera_annotated.get(cam)
+                    if cached is None or cached[0] is not res["result"]:
+                        with self.metrics.timer("annotate"):
+                            cached = self._camera_annotated[cam] = (res["result"], res["result"].plot())
+                    preview[cam] = cached[1]
+                # Chỉ dựng lại panel kết quả khi có result mới (giữ tham chiếu để so identity)
+                shown = tuple(res["result"] for res in results.values())
+                previous = self._camera_results_shown
+                if previous is None or len(previous) != len(shown) or any(
+                        a is not b for a, b in zip(previous, shown)):
+                    self._camera_results_shown = shown
+                    self.show_detections(manager.fuse(
+                        {cam: res["detections"] for cam, res in results.items()},
+                        {cam: (res["frame"].shape[1], res["frame"].shape[0]) for cam, res in results.items()},
+                    ))
+            self.current_image = tile_frames(list(preview.values()))
+            self.display_image(self.current_image)
+        elif (all(s["ended"] for s in manager.stats().values())
+              or time.perf_counter() - self._camera_started_at > config.CAMERA_OPEN_TIMEOUT_S + RECONNECT_DELAY):
+            # Không nguồn nào mở được (hoặc mở bị treo quá lâu)
+            self.stop_camera()
+            self.status_label.config(text="❌ Không thể mở camera!")
+            return
+        self.root.after(30, self.update_camera)
     
     def detect_food(self):
         """Chạy detection với loading screen"""
+        if self.model_loading:
+            self.status_label.config(text="⏳ Model đang được load, vui lòng chờ...")
+            return
         if not self.model_manager.is_loaded():
             self.status_label.config(text="❌ Model chưa được load!")
             return
         
         # Camera mode
-        if self.is_camera_running and self.current_image is not None:
-            self.detect_with_loading([self.current_image], is_camera=True)
+        if self.is_camera_running and self.camera_frames:
+            self.detect_with_loading(list(self.camera_frames.items()), is_camera=True)
             return
         
         # Multi-image mode
+        if self.uploading:
+            self.status_label.config(text="⏳ Đang đọc ảnh, vui lòng chờ...")
+            return
         if len(self.uploaded_images) == 0:
             self.status_label.config(text="⚠️ Chưa có ảnh để detect!")
             return
         
         # Collect images to detect
-        images_to_detect = []
-        for img_data in self.uploaded_images:
-            if img_data['detected_image'] is None:
-                images_to_detect.append(img_data)
+        images_to_detect = [img_data for img_data in self.uploaded_images if not img_data.is_detected]
         
         if len(images_to_detect) == 0:
             messagebox.showinfo("Thông báo", "Tất cả ảnh đã được detect!")
@@ -908,8 +1099,11 @@ class MainWindow:
         """
         Chạy detection với màn hình loading
         
+        Worker thread không sửa trực tiếp widget hay state (current_detections, cart, ...)
+        mà post event qua self.ui_dispatcher; state chỉ được cập nhật trên Tk thread.
+        
         Args:
-            items: List ảnh cần detect hoặc single image (camera)
+            items: List ảnh cần detect hoặc list (camera_id, frame) (camera)
             is_camera: True nếu là camera mode
         """
         # Chuyển sang loading screen
@@ -918,6 +1112,7 @@ class MainWindow:
         self.loading_progress_label.config(text="⚡ Đang phân tích hình ảnh...")
 
         # Khởi tạo session mới cho lần detect này
+        self._revoke_session_token()
         self.current_session = {
             "id": datetime.now().strftime("%Y%m%d_%H%M%S"),
             "status": "unpaid",
@@ -926,100 +1121,165 @@ class MainWindow:
         # Xoá cart & detections cũ
         self.cart = {}
         self.current_detections = []
+        self.metrics.incr("sessions_started", source="camera" if is_camera else "upload")
+        
+        session = self.current_session
+        confidence = self.confidence_threshold
+        dispatcher = self.ui_dispatcher
+        metrics = self.metrics
+        started = time.perf_counter()
         
         # Run detection trong thread
         def run_detection():
             try:
                 if is_camera:
-                    # Camera mode - single image
-                    img = items[0]
-                    self.root.after(0, lambda: self.loading_progress_label.config(text="⚡ Đang nhận diện..."))
+                    # Camera mode - frame mới nhất của mọi camera, chạy chung 1 batch
+                    self.post_loading_status(progress="⚡ Đang nhận diện...")
                     
-                    result = self.model_manager.detect(img, self.confidence_threshold)
-                    if result:
-                        annotated_frame = result.plot()
-                        
-                        # Collect detections
-                        detections = []
-                        for box in result.boxes:
-                            cls_id = int(box.cls[0])
-                            conf = float(box.conf[0])
-                            class_name = result.names[cls_id]
-                            detections.append({
-                                "name": class_name,
-                                "confidence": conf
-                            })
-                        
-                        # Update UI
-                        self.current_detections = detections
-                        self.build_cart_from_detections()
-                        self.root.after(0, lambda: self.display_image(annotated_frame))
-                        self.root.after(0, lambda: self.show_results(result))
-                        self.root.after(0, lambda: self.history_manager.add_record(detections, "camera"))
-                        self.root.after(0, lambda: self.update_history_display())
-                        self.root.after(0, lambda: self.status_label.config(text=f"✅ Phát hiện {len(result.boxes)} món ăn!"))
-                        
-                        # Go to result screen
-                        if len(detections) > 0:
-                            self.root.after(500, lambda: self.show_result_screen())
-                        else:
-                            self.root.after(500, lambda: self.show_screen("main"))
+                    futures = [(cam, frame, self.detect_scheduler.submit(frame, confidence))
+                               for cam, frame in items]
+                    annotated_frames = []
+                    per_camera = {}
+                    frame_sizes = {}
+                    for cam, frame, future in futures:
+                        result = future.result()
+                        if result is None:
+                            continue
+                        with metrics.timer("annotate"):
+                            annotated_frames.append(result.plot())
+                        per_camera[cam] = extract_detections(result)
+                        frame_sizes[cam] = (frame.shape[1], frame.shape[0])
+                    
+                    # Gộp detection của cả quầy: mỗi món chỉ tính ở camera sở hữu vùng chứa nó
+                    manager = self.camera_manager
+                    if manager is not None:
+                        detections = manager.fuse(per_camera, frame_sizes)
+                    else:
+                        detections = [dict(det, camera=cam) for cam, dets in per_camera.items() for det in dets]
+                    if annotated_frames:
+                        dispatcher.post(EVENT_IMAGE_RESULT, {
+                            "camera": True,
+                            "annotated": tile_frames(annotated_frames),
+                            "detections": detections,
+                        })
+                        dispatcher.post(EVENT_HISTORY, (detections, "camera"))
+                        dispatcher.post(EVENT_STATUS, f"✅ Phát hiện {len(detections)} món ăn!")
                 
                 else:
                     # Multi-image mode
                     total = len(items)
-                    all_detections = []
-                    
-                    for i, img_data in enumerate(items):
-                        self.root.after(0, lambda idx=i, t=total: 
-                                      self.loading_message_label.config(text=f"Đang xử lý ảnh {idx+1}/{t}..."))
-                        self.root.after(0, lambda: 
-                                      self.loading_progress_label.config(text=f"⚡ {Path(items[i]['path']).name}"))
+                    detections = []
+                    # Gửi trước tối đa 2 batch để scheduler gom batch, nhưng không nạp
+                    # ảnh gốc của cả phiên vào bộ nhớ cùng lúc
+                    window = max(1, self.detect_scheduler.max_batch * 2)
+                    pending = deque()
+                    submitted = 0
+                    done = 0
+                    while done < total:
+                        while submitted < total and len(pending) < window:
+                            img_data = items[submitted]
+                            submitted += 1
+                            image = img_data.image
+                            if image is None:
+                                logger.error("❌ Không đọc được ảnh %s", img_data.path)
+                                pending.append((img_data, None))
+                            else:
+                                pending.append((img_data, self.detect_scheduler.submit(image, confidence)))
+                        img_data, future = pending.popleft()
+                        done += 1
+                        self.post_loading_status(
+                            message=f"Đang xử lý ảnh {done}/{total}...",
+                            progress=f"⚡ {Path(img_data.path).name}"
+                        )
                         
-                        result = self.model_manager.detect(img_data['image'], self.confidence_threshold)
+                        result = None
+                        if future is not None:
+                            try:
+                                result = future.result()
+                            except Exception as e:
+                                logger.error("❌ Lỗi detection: %s", e)
                         if result:
-                            annotated_frame = result.plot()
-                            img_data['detected_image'] = annotated_frame
-                            img_data['results'] = result
+                            image_detections = extract_detections(result)
+                            detections.extend(image_detections)
                             
-                            # Collect detections
-                            detections = []
-                            for box in result.boxes:
-                                cls_id = int(box.cls[0])
-                                conf = float(box.conf[0])
-                                class_name = result.names[cls_id]
-                                detections.append({
-                                    "name": class_name,
-                                    "confidence": conf
-                                })
-                            
-                            all_detections.extend(detections)
-                            
-                            # Add to history
-                            self.root.after(0, lambda d=detections, p=img_data['path']: 
-                                          self.history_manager.add_record(d, f"upload ({Path(p).name})"))
-                    
-                    # Update UI
-                    self.root.after(0, self.update_history_display)
-                    self.root.after(0, lambda: self.status_label.config(text=f"✅ Đã detect {len(items)} ảnh!"))
+                            # Chỉ giữ detection dạng mảng, không giữ result (ảnh gốc + tensor)
+                            dispatcher.post(EVENT_IMAGE_RESULT, {
+                                "camera": False,
+                                "img_data": img_data,
+                                "detections": CompactDetections.from_detections(image_detections, result.names),
+                            })
+                            dispatcher.post(
+                                EVENT_HISTORY,
+                                (image_detections, f"upload ({Path(img_data.path).name})")
+                            )
                     
-                    # Set current detections and go to result screen
-                    self.current_detections = all_detections
-                    self.build_cart_from_detections()
-                    if len(all_detections) > 0:
-                        self.root.after(500, lambda: self.show_result_screen())
-                    else:
-                        self.root.after(500, lambda: self.show_screen("main"))
+                    dispatcher.post(EVENT_STATUS,
+                                    f"✅ Đã detect {len(items)} ảnh! | {self.uploaded_images.memory_text()}")
+                
+                metrics.observe("detect_total", (time.perf_counter() - started) * 1000)
+                for det in detections:
+                    metrics.incr("detections", cls=det["name"])
+                # Set current detections and go to result screen (trên Tk thread)
+                dispatcher.post(EVENT_DETECTION_DONE, {"session": session, "detections": detections})
             
             except Exception as e:
-                print(f"❌ Lỗi detection: {e}")
-                self.root.after(0, lambda: self.show_screen("main"))
-                self.root.after(0, lambda: messagebox.showerror("Lỗi", f"Lỗi khi detect:\n{e}"))
+                logger.exception("❌ Lỗi detection: %s", e)
+                dispatcher.post(EVENT_DETECTION_ERROR, {"session": session, "error": e})
         
         # Start detection thread
         thread = threading.Thread(target=run_detection, daemon=True)
         thread.start()
     
+    # ===================== UI EVENTS (Tk thread) =====================
+    
+    def _register_ui_handlers(self):
+        """Đăng ký handler cho các event từ worker thread"""
+        d = self.ui_dispatcher
+        d.register(EVENT_PROGRESS, self._on_progress_event, coalesce=COALESCE_LATEST)
+        d.register(EVENT_STATUS, lambda text: self.status_label.config(text=text), coalesce=COALESCE_LATEST)
+        d.register(EVENT_HISTORY, self._on_history_event, coalesce=COALESCE_BATCH)
+        d.register(EVENT_IMAGE_RESULT, self._on_image_result_event)
+        d.register(EVENT_DETECTION_DONE, self._on_detection_done_event)
+        d.register(EVENT_DETECTION_ERROR, self._on_detection_error_event)
+    
+    def _on_progress_event(self, payload):
+        """Cập nhật text màn hình loading (chỉ bản mới nhất mỗi frame)"""
+        if "message" in payload:
+            self.loading_message_label.config(text=payload["message"])
+        if "progress" in payload:
+            self.loading_progress_label.config(text=payload["progress"])
+    
+    def _on_history_event(self, entries):
+        """Ghi gộp các bản ghi lịch sử của 1 tick rồi cập nhật panel 1 lần"""
+        self.history_manager.add_records(entries)
+        self.update_history_display()
+    
+    def _on_image_result_event(self, payload):
+        """Lưu kết quả detect của 1 ảnh / hiển thị frame camera đã detect"""
+        if payload["camera"]:
+            self.display_image(payload["annotated"])
+            self.show_detections(payload["detections"])
+        else:
+            self.uploaded_images.set_detections(payload["img_data"], payload["detections"])
+    
+    def _on_detection_done_event(self, payload):
+        """Gán detections cho session và chuyển màn hình"""
+        if payload["session"] is not self.current_session:
+            return  # Session đã bị reset/thay thế trong lúc detect
+        self.current_detections = payload["detections"]
+        self.build_cart_from_detections()
+        if len(self.current_detections) > 0:
+            self.root.after(500, self.show_result_screen)
+        else:
+            self.root.after(500, lambda: self.show_screen("main"))
+    
+    def _on_detection_error_event(self, payload):
+        """Báo lỗi detection và quay về màn hình chính"""
+        if payload["session"] is not self.current_session:
+            return
+        self.show_screen("main")
+        messagebox.showerror("Lỗi", f"Lỗi khi detect:\n{payload['error']}")
+    
     def normalize_food_key(self, class_name):
         """Chuẩn hóa tên class từ model để khớp với key trong food_data"""
         return CartManager.normalize_food_key(class_name, self.food_data)
@@ -1034,7 +1294,8 @@ class MainWindow:
         self.cart = CartManager.build_cart_from_detections(
             self.current_detections, 
             self.food_data, 
-            self.normalize_food_key
+            self.normalize_food_key,
+            food_table=self.food_table
         )
         self._recalc_cart_totals()
     
@@ -1043,7 +1304,7 @@ class MainWindow:
         Trả về (total_items, total_price, total_calories) từ cart,
         chỉ tính các món chưa bị excluded_from_payment.
         """
-        return CartManager.get_cart_totals(self.cart)
+        return CartManager.get_cart_totals(self.cart, self.food_table)
     
     def _recalc_cart_totals(self):
         """Cập nhật lại tổng tiền / calo dựa trên cart hiện tại."""
@@ -1063,9 +1324,8 @@ class MainWindow:
         """Tăng/giảm quantity trong cart có kiểm soát."""
         if CartManager.change_cart_quantity(self.cart, key, delta, self.current_session):
             self._recalc_cart_totals()
-            # Render lại màn hình kết quả
-            if self.current_screen == "result":
-                self.display_result_screen()
+            # Chỉ cập nhật dòng bị đổi + tổng kết, không dựng lại màn hình
+            self._update_result_view(key)
     
     def _delete_cart_item(self, key):
         """Đánh dấu món là excluded_from_payment."""
@@ -1074,27 +1334,59 @@ class MainWindow:
             if key in self.cart:
                 self.cart[key]["excluded"] = True
             self._recalc_cart_totals()
-            if self.current_screen == "result":
-                self.display_result_screen()
+            self._update_result_view(key)
     
     def _toggle_exclude_item(self, key):
         """Bật/tắt trạng thái excluded_from_payment cho một món trong cart."""
         if CartManager.toggle_exclude_item(self.cart, key, self.current_session):
             self._recalc_cart_totals()
-            if self.current_screen == "result":
-                self.display_result_screen()
+            self._update_result_view(key)
+    
+    def _update_result_view(self, key):
+        """
+        Áp dụng thay đổi tối thiểu lên màn hình kết quả sau khi cart đổi:
+        dòng của món `key` (SL, thành tiền, nút) và khối tổng kết.
+        Nếu chưa có widget cho món này thì dựng lại toàn bộ.
+        """
+        if self.current_screen != "result":
+            return
+        if key not in self._cart_row_widgets:
+            self.display_result_screen(force=True)
+            return
+        self._apply_cart_row_state(key)
+        self._apply_result_summary()
     
-    def display_result_screen(self):
-        """Hiển thị chi tiết kết quả detection"""
+    def display_result_screen(self, force=False):
+        """
+        Hiển thị chi tiết kết quả detection.
+        
+        Màn hình chỉ được dựng lại khi detections/session đổi (hoặc force=True);
+        các lần hiện lại sau đó chỉ cập nhật lại giỏ hàng và tổng kết.
+        """
+        # Giữ tham chiếu tới list detections đã render (so sánh bằng `is`)
+        render_key = (self.current_detections, (self.current_session or {}).get("id"))
+        if (not force and self._result_render_key is not None
+                and render_key[0] is self._result_render_key[0]
+                and render_key[1] == self._result_render_key[1]):
+            for key in self._cart_row_widgets:
+                self._apply_cart_row_state(key)
+            self._apply_result_summary()
+            return
+        self._result_render_key = render_key
+        self._cart_row_widgets = {}
+        self._result_summary_labels = {}
+        
         # Clear previous content
         for widget in self.result_scrollable_frame.winfo_children():
             widget.destroy()
         
-        # Debug: in ra danh sách detections
-        print(f"\n=== DEBUG: Total detections: {len(self.current_detections)} ===")
-        for i, det in enumerate(self.current_detections):
-            print(f"  {i+1}. {det['name']} (confidence: {det['confidence']:.2%})")
-        print("=" * 50 + "\n")
+        # Debug: danh sách detections (chỉ dựng chuỗi khi bật LOG_LEVEL = "DEBUG")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Total detections: %d\n%s", len(self.current_detections),
+                "\n".join(f"  {i+1}. {det['name']} (confidence: {det['confidence']:.2%})"
+                          for i, det in enumerate(self.current_detections))
+            )
         
         if not self.current_detections:
             label = Label(
@@ -1107,11 +1399,8 @@ class MainWindow:
             label.pack(pady=20)
             return
         
-        # Calculate totals (lưu để dùng cho thanh toán)
-        total_price = 0
-        total_calories = 0
-        self._result_total_price = 0
-        self._result_total_calories = 0
+        # Tổng tiền / calo cho thanh toán luôn lấy theo CART
+        self._recalc_cart_totals()
         
         # Display each food item
         displayed_count = 0  # Đếm số món được hiển thị
@@ -1127,7 +1416,7 @@ class MainWindow:
             
             # Nếu không tìm thấy, tạo fallback data
             if not food_info:
-                print(f"⚠️ Không tìm thấy thông tin cho: {class_name}")
+                logger.warning("⚠️ Không tìm thấy thông tin cho: %s", class_name)
                 food_info = {
                     'name_vi': class_name,
                     'price': 0,
@@ -1140,14 +1429,6 @@ class MainWindow:
             
             displayed_count += 1
             
-            # Add to totals
-            p = food_info.get('price', 0)
-            c = food_info.get('calories', 0)
-            total_price += p
-            total_calories += c
-            self._result_total_price += p
-            self._result_total_calories += c
-            
             # Create food frame
             food_frame = Frame(
                 self.result_scrollable_frame,
@@ -1226,11 +1507,11 @@ class MainWindow:
                 right_frame,
                 food_info.get('protein', 0),
                 food_info.get('carbs', 0),
-                food_info.get('fat', 0)
+                food_info.get('fat', 0),
+                food_key=food_key
             )
         
         # Summary frame (dựa trên CART)
-        total_items, total_price_cart, total_calories_cart = self._get_cart_totals()
         summary_frame = Frame(
             self.result_scrollable_frame,
             bg=config.COLORS['bg_header'],
@@ -1247,20 +1528,16 @@ class MainWindow:
             fg=config.COLORS['accent_green']
         ).pack(pady=10)
         
-        summary_data = [
-            f"🍽️  Tổng số phần: {total_items}",
-            f"💰 Tổng giá tiền: {total_price_cart:,} VNĐ",
-            f"🔥 Tổng calo: {total_calories_cart} kcal"
-        ]
-        
-        for text in summary_data:
-            Label(
+        for name in ("items", "price", "calories"):
+            label = Label(
                 summary_frame,
-                text=text,
                 font=("Arial", 11),
                 bg=config.COLORS['bg_header'],
                 fg='white'
-            ).pack(anchor=W, padx=20, pady=5)
+            )
+            label.pack(anchor=W, padx=20, pady=5)
+            self._result_summary_labels[name] = label
+        self._apply_result_summary()
 
         # CART TABLE: cho phép chỉnh sửa có ràng buộc theo workflow
         if self.cart:
@@ -1282,72 +1559,8 @@ class MainWindow:
                     anchor=W
                 ).grid(row=0, column=i, padx=4)
 
-            for row_idx, item in enumerate(self.cart.values(), start=1):
-                row = Frame(cart_frame, bg=config.COLORS['bg_medium'])
-                row.pack(fill=X, pady=2)
-
-                name = item["name_vi"]
-                qty = int(item["quantity"])
-                price = item["price"]
-                total_line = price * qty
-                conf = item.get("avg_conf", 0)
-                detected_qty = int(item.get("detected_qty", 0))
-                excluded = bool(item.get("excluded", False))
-                can_decrease = qty > detected_qty
-
-                Label(row, text=name, font=("Arial", 10), bg=config.COLORS['bg_medium'], fg='white',
-                      width=30, anchor=W).grid(row=0, column=0, padx=4, pady=2, sticky=W)
-
-                qty_frame = Frame(row, bg=config.COLORS['bg_medium'])
-                qty_frame.grid(row=0, column=1, padx=4)
-                btn_minus = Button(
-                    qty_frame,
-                    text="-",
-                    width=2,
-                    bd=0,
-                    cursor="hand2",
-                    state=(NORMAL if can_decrease else DISABLED),
-                    command=lambda k=item["key"]: self._change_cart_quantity(k, -1),
-                )
-                btn_minus.pack(side=LEFT)
-                Label(qty_frame, text=str(qty), width=3, bg=config.COLORS['bg_medium'],
-                      fg='white').pack(side=LEFT)
-                Button(qty_frame, text="+", width=2, bd=0, cursor="hand2",
-                       command=lambda k=item["key"]: self._change_cart_quantity(k, +1)).pack(side=LEFT)
-
-                Label(row, text=f"{price:,}đ", font=("Arial", 10), bg=config.COLORS['bg_medium'],
-                      fg=config.COLORS['accent_orange'], width=10, anchor=E).grid(row=0, column=2, padx=4)
-
-                total_text = f"{total_line:,}đ"
-                total_fg = config.COLORS['accent_green']
-                if excluded:
-                    total_text += " (Không thanh toán)"
-                    total_fg = config.COLORS['text_gray']
-                Label(
-                    row,
-                    text=total_text,
-                    font=("Arial", 10, "bold"),
-                    bg=config.COLORS['bg_medium'],
-                    fg=total_fg,
-                    width=18,
-                    anchor=E,
-                ).grid(row=0, column=3, padx=4)
-
-                Label(row, text=f"{conf:.0%}", font=("Arial", 10), bg=config.COLORS['bg_medium'],
-                      fg='white', width=8, anchor=E).grid(row=0, column=4, padx=4)
-
-                # Nút bỏ/khôi phục khỏi thanh toán (không xóa khỏi dữ liệu nhận diện)
-                exclude_label = "Bỏ khỏi TT" if not excluded else "Khôi phục"
-                Button(
-                    row,
-                    text=exclude_label,
-                    bg=config.COLORS['accent_orange'],
-                    fg='white',
-                    font=('Arial', 9, 'bold'),
-                    bd=0,
-                    cursor='hand2',
-                    command=lambda k=item["key"]: self._toggle_exclude_item(k)
-                ).grid(row=0, column=5, padx=4)
+            for item in self.cart.values():
+                self._build_cart_row(cart_frame, item)
         
         # Nút Thanh toán
         btn_pay_frame = Frame(self.result_scrollable_frame, bg=config.COLORS['bg_dark'])
@@ -1365,6 +1578,96 @@ class MainWindow:
             command=self.show_payment_dialog
         ).pack(pady=8)
     
+    def _build_cart_row(self, cart_frame, item):
+        """Tạo 1 dòng trong bảng giỏ hàng và lưu handle các widget thay đổi được"""
+        key = item["key"]
+        row = Frame(cart_frame, bg=config.COLORS['bg_medium'])
+        row.pack(fill=X, pady=2)
+
+        Label(row, text=item["name_vi"], font=("Arial", 10), bg=config.COLORS['bg_medium'], fg='white',
+              width=30, anchor=W).grid(row=0, column=0, padx=4, pady=2, sticky=W)
+
+        qty_frame = Frame(row, bg=config.COLORS['bg_medium'])
+        qty_frame.grid(row=0, column=1, padx=4)
+        btn_minus = Button(
+            qty_frame,
+            text="-",
+            width=2,
+            bd=0,
+            cursor="hand2",
+            command=lambda k=key: self._change_cart_quantity(k, -1),
+        )
+        btn_minus.pack(side=LEFT)
+        qty_label = Label(qty_frame, width=3, bg=config.COLORS['bg_medium'], fg='white')
+        qty_label.pack(side=LEFT)
+        Button(qty_frame, text="+", width=2, bd=0, cursor="hand2",
+               command=lambda k=key: self._change_cart_quantity(k, +1)).pack(side=LEFT)
+
+        Label(row, text=f"{item['price']:,}đ", font=("Arial", 10), bg=config.COLORS['bg_medium'],
+              fg=config.COLORS['accent_orange'], width=10, anchor=E).grid(row=0, column=2, padx=4)
+
+        total_label = Label(
+            row,
+            font=("Arial", 10, "bold"),
+            bg=config.COLORS['bg_medium'],
+            width=18,
+            anchor=E,
+        )
+        total_label.grid(row=0, column=3, padx=4)
+
+        Label(row, text=f"{item.get('avg_conf', 0):.0%}", font=("Arial", 10), bg=config.COLORS['bg_medium'],
+              fg='white', width=8, anchor=E).grid(row=0, column=4, padx=4)
+
+        # Nút bỏ/khôi phục khỏi thanh toán (không xóa khỏi dữ liệu nhận diện)
+        btn_exclude = Button(
+            row,
+            bg=config.COLORS['accent_orange'],
+            fg='white',
+            font=('Arial', 9, 'bold'),
+            bd=0,
+            cursor='hand2',
+            command=lambda k=key: self._toggle_exclude_item(k)
+        )
+        btn_exclude.grid(row=0, column=5, padx=4)
+
+        self._cart_row_widgets[key] = {
+            "btn_minus": btn_minus,
+            "qty_label": qty_label,
+            "total_label": total_label,
+            "btn_exclude": btn_exclude,
+        }
+        self._apply_cart_row_state(key)
+    
+    def _apply_cart_row_state(self, key):
+        """Đồng bộ các widget của 1 dòng giỏ hàng với trạng thái trong cart"""
+        item = self.cart.get(key)
+        widgets = self._cart_row_widgets.get(key)
+        if not item or not widgets:
+            return
+        qty = int(item["quantity"])
+        detected_qty = int(item.get("detected_qty", 0))
+        excluded = bool(item.get("excluded", False))
+
+        total_text = f"{item['price'] * qty:,}đ"
+        total_fg = config.COLORS['accent_green']
+        if excluded:
+            total_text += " (Không thanh toán)"
+            total_fg = config.COLORS['text_gray']
+
+        widgets["btn_minus"].config(state=(NORMAL if qty > detected_qty else DISABLED))
+        widgets["qty_label"].config(text=str(qty))
+        widgets["total_label"].config(text=total_text, fg=total_fg)
+        widgets["btn_exclude"].config(text="Bỏ khỏi TT" if not excluded else "Khôi phục")
+    
+    def _apply_result_summary(self):
+        """Cập nhật khối tổng kết (giỏ hàng) từ cart hiện tại"""
+        if not self._result_summary_labels:
+            return
+        total_items, total_price_cart, total_calories_cart = self._get_cart_totals()
+        self._result_summary_labels["items"].config(text=f"🍽️  Tổng số phần: {total_items}")
+        self._result_summary_labels["price"].config(text=f"💰 Tổng giá tiền: {total_price_cart:,} VNĐ")
+        self._result_summary_labels["calories"].config(text=f"🔥 Tổng calo: {total_calories_cart} kcal")
+    
     def display_payment_screen(self):
         """Hiển thị màn hình thanh toán"""
         # Clear previous content
@@ -1420,25 +1723,18 @@ class MainWindow:
             if m == "cash":
                 qr_label.config(text="💵 Thanh toán khi nhận hàng. Không cần quét mã.")
                 return
-            # QR chứa link web
-            payment_server_url = getattr(self.payment_handler, '_payment_server_url', None)
+            # QR chứa link web kèm token của phiên hiện tại
+            session_id = (self.current_session or {}).get("id")
+            payment_server_url = self.payment_handler.get_payment_url(session_id, m) if session_id else None
             if payment_server_url:
-                qr_content = f"{payment_server_url}?m={m}"
+                qr_content = payment_server_url
             else:
                 qr_content = "THANHTOANTHANHCON"
             
             try:
-                import qrcode
-                from PIL import Image, ImageTk
-                qr = qrcode.QRCode(version=1, box_size=10, border=4)
-                qr.add_data(qr_content)
-                qr.make(fit=True)
-                img = qr.make_image(fill_color="black", back_color="white")
-                try:
-                    img = img.resize((400, 400), Image.Resampling.LANCZOS)
-                except AttributeError:
-                    img = img.resize((400, 400), Image.LANCZOS)
-                photo = ImageTk.PhotoImage(img)
+                photo = self.payment_handler.make_qr_image(qr_content, size=PAYMENT_QR_SIZE, method=m)
+                if photo is None:
+                    raise ImportError("qrcode")
                 qr_photo_holder[0] = photo
                 lab = Label(f_qr, image=photo, bg="white", padx=12, pady=12)
                 lab.pack(pady=6)
@@ -1464,9 +1760,12 @@ class MainWindow:
             method_name = name_map.get(method, method)
             if self.current_session:
                 self.current_session["status"] = "paid"
+                # Các lần quét QR sau của phiên này chỉ nhận lại trang thành công
+                self.payment_handler.confirm_session(self.current_session.get("id"), method)
             # Lưu thông tin thanh toán
             self._last_payment_method = method_name
             self._last_invoice_path = None  # Chưa xuất hóa đơn
+            self._record_invoice(method_name)
             # Chuyển sang màn hình thành công
             self.show_screen("payment_success")
         
@@ -1519,7 +1818,7 @@ class MainWindow:
         def export_invoice():
             """Xuất hóa đơn và reset session"""
             path = self.payment_handler.save_invoice_to_downloads(
-                self.cart, self.current_detections, payment_method
+                self.cart, self.current_detections, payment_method, invoice=self._last_invoice
             )
             self._last_invoice_path = path
             messagebox.showinfo("Thành công", f"Đã xuất hóa đơn:\n{path}")
@@ -1538,66 +1837,45 @@ class MainWindow:
                font=('Arial', 11, 'bold'), width=20, height=2, bd=0, cursor='hand2', 
                command=skip_invoice).pack(side=RIGHT, padx=10, pady=10)
     
+    def _record_invoice(self, method_name):
+        """Ghi hóa đơn của phiên vừa thanh toán vào invoice store (đúng 1 lần mỗi phiên)"""
+        self._last_invoice = self.payment_handler.record_invoice(
+            self.cart, self.current_detections, method_name, self.current_session
+        )
+        self.metrics.incr("sessions_paid", method=method_name)
+    
     def _generate_invoice_text(self):
         """Tạo nội dung hóa đơn đẹp như siêu thị"""
-        total_items, total_price, total_cal = self._get_cart_totals()
-        payment_method = getattr(self, '_last_payment_method', 'Tiền mặt')
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        lines = []
-        lines.append(" " * 20 + "🍕 FOOD DETECTION AI")
-        lines.append(" " * 18 + "=" * 30)
-        lines.append(" " * 20 + "HÓA ĐƠN BÁN HÀNG")
-        lines.append(" " * 18 + "=" * 30)
-        lines.append("")
-        lines.append(f"Ngày: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-        lines.append(f"Mã HĐ: INV_{ts}")
-        lines.append(f"Phương thức: {payment_method}")
-        lines.append("-" * 50)
-        lines.append(f"{'Tên món':<25} {'SL':>3} {'Giá':>12} {'TT':>12}")
-        lines.append("-" * 50)
-        
-        for item in self.cart.values():
-            qty = int(item.get("quantity", 0))
-            if item.get("excluded") or qty <= 0:
-                continue
-            name = (item.get("name_vi") or item.get("key"))[:23]
-            price = item.get("price", 0)
-            total_line = price * qty
-            lines.append(f"{name:<25} {qty:>3} {price:>11,}đ {total_line:>11,}đ")
-        
-        lines.append("-" * 50)
-        lines.append(f"{'Tổng số phần:':<25} {total_items:>3}")
-        lines.append(f"{'Tổng calo:':<25} {total_cal:,} kcal")
-        lines.append("")
-        lines.append(f"{'TỔNG TIỀN:':<25} {total_price:>11,}đ")
-        lines.append("")
-        lines.append(" " * 15 + "Cảm ơn quý khách!")
-        lines.append(" " * 12 + "Hẹn gặp lại 🎉")
-        lines.append("=" * 50)
-        
-        return "\n".join(lines)
+        invoice = self._last_invoice
+        if invoice is None:
+            # Chưa ghi hóa đơn (không đi qua bước thanh toán) → chỉ dựng để xem trước
+            payment_method = getattr(self, '_last_payment_method', None) or 'Tiền mặt'
+            invoice = self.payment_handler.invoice_engine.build_invoice(
+                self.cart, self.current_detections, payment_method,
+                food_data=self.food_data, normalize_func=self.normalize_food_key,
+                session=self.current_session
+            )
+        return self.payment_handler.invoice_engine.render_text(invoice)
     
-    def show_results(self, result):
-        """Hiển thị kết quả detection trong panel"""
+    def show_detections(self, detections):
+        """Hiển thị list detection (1 ảnh hoặc gộp từ nhiều camera) trong panel"""
         self.results_text.delete(1.0, END)
         
-        if len(result.boxes) == 0:
+        if len(detections) == 0:
             self.results_text.insert(END, "❌ Không phát hiện món ăn nào!\n\n")
             self.results_text.insert(END, "💡 Thử:\n")
             self.results_text.insert(END, "  • Giảm confidence threshold\n")
             self.results_text.insert(END, "  • Chọn ảnh rõ hơn\n")
             return
         
-        self.results_text.insert(END, f"🎯 Phát hiện: {len(result.boxes)} món\n")
+        self.results_text.insert(END, f"🎯 Phát hiện: {len(detections)} món\n")
         self.results_text.insert(END, "="*35 + "\n\n")
         
-        for i, box in enumerate(result.boxes):
-            cls_id = int(box.cls[0])
-            conf = float(box.conf[0])
-            class_name = result.names[cls_id]
+        for i, det in enumerate(detections):
+            conf = det["confidence"]
+            camera = f"  [{det['camera']}]" if "camera" in det else ""
             
-            self.results_text.insert(END, f"#{i+1} {class_name}\n")
+            self.results_text.insert(END, f"#{i+1} {det['name']}{camera}\n")
             self.results_text.insert(END, f"   Confidence: {conf:.2%}\n")
             
             bar_length = int(conf * 20)
@@ -1662,31 +1940,42 @@ class MainWindow:
     
     def display_image(self, img):
         """Hiển thị ảnh lên canvas"""
-        img_tk, new_w, new_h = resize_image_to_canvas(
-            img, 
-            config.CANVAS_WIDTH, 
-            config.CANVAS_HEIGHT
-        )
-        
-        self.canvas.delete("all")
-        self.canvas.create_image(
-            config.CANVAS_WIDTH//2,
-            config.CANVAS_HEIGHT//2,
-            image=img_tk,
-            anchor=CENTER
-        )
-        self.canvas.image = img_tk
+        with self.metrics.timer("render"):
+            img_tk, new_w, new_h = resize_image_to_canvas(
+                img, 
+                config.CANVAS_WIDTH, 
+                config.CANVAS_HEIGHT
+            )
+            
+            self.canvas.delete("all")
+            self.canvas.create_image(
+                config.CANVAS_WIDTH//2,
+                config.CANVAS_HEIGHT//2,
+                image=img_tk,
+                anchor=CENTER
+            )
+            self.canvas.image = img_tk
     
-    def draw_nutrition_chart(self, parent, protein, carbs, fat):
+    def draw_nutrition_chart(self, parent, protein, carbs, fat, food_key=None):
         """
         Vẽ biểu đồ tròn dinh dưỡng (Donut chart)
         
+        Biểu đồ được render 1 lần thành ảnh và lấy lại từ cache theo (food_key, size);
+        chỉ vẽ trực tiếp lên canvas khi không có PIL.
+        
         Args:
             parent: Frame chứa biểu đồ
             protein: Lượng protein (g)
             carbs: Lượng carbs (g)
             fat: Lượng chất béo (g)
+            food_key: Key món ăn dùng làm khóa cache
         """
+        cache_key = food_key if food_key is not None else f"{protein}/{carbs}/{fat}"
+        photo = get_chart_cache("detail").get_photo(cache_key, 160, protein, carbs, fat)
+        if photo is not None:
+            Label(parent, image=photo, bg=config.COLORS['bg_dark'], bd=0).pack()
+            return
+        
         canvas = Canvas(
             parent, 
             width=160, 
@@ -1768,14 +2057,16 @@ class MainWindow:
     def reset(self):
         """Reset về trạng thái ban đầu"""
         self.stop_camera()
+        self._cancel_upload()
         self.current_image = None
-        self.uploaded_images = []
+        self.uploaded_images.clear()
         self.current_index = 0
         self.canvas.delete("all")
         self.results_text.delete(1.0, END)
         self.image_counter_label.config(text="📸 Chưa có ảnh")
         self.update_navigation()
         self.status_label.config(text="✅ Ready! Upload nhiều ảnh để detect")
+        self._revoke_session_token()
         self.current_detections = []
         self.cart = {}
         self.current_session = None
@@ -1792,11 +2083,13 @@ class MainWindow:
         self.stop_camera()
         
         # Reset images và camera state
+        self._cancel_upload()
         self.current_image = None
-        self.uploaded_images = []
+        self.uploaded_images.clear()
         self.current_index = 0
         
         # Reset cart và detections
+        self._revoke_session_token()
         self.cart = {}
         self.current_detections = []
         self.current_session = None
@@ -1804,6 +2097,7 @@ class MainWindow:
         # Reset payment state
         self._last_payment_method = None
         self._last_invoice_path = None
+        self._last_invoice = None
         
         # Reset UI elements
         if hasattr(self, 'canvas'):
@@ -1820,6 +2114,11 @@ class MainWindow:
         self.show_screen("main")
         self.status_label.config(text="✅ Đã kết thúc phiên. Sẵn sàng cho lần detect mới.")
     
+    def _revoke_session_token(self):
+        """Hủy token thanh toán của phiên hiện tại (QR cũ không còn hiệu lực)"""
+        if self.current_session:
+            self.payment_handler.revoke_session(self.current_session.get("id"))
+    
     def update_result_button_visibility(self):
         """Hiện/ẩn nút Xem kết quả trên trang chính theo current_detections"""
         if hasattr(self, 'btn_see_result') and self.btn_see_result.winfo_exists():
@@ -1834,7 +2133,72 @@ class MainWindow:
             self.show_screen("result")
         self.update_result_button_visibility()
     
+    # ===================== PERFORMANCE OVERLAY / METRICS =====================
+    
+    def toggle_perf_overlay(self, event=None):
+        """Bật/tắt overlay FPS, latency từng bước và độ dài hàng đợi detect"""
+        if self.perf_overlay is not None:
+            # Hủy lượt cập nhật đang chờ, nếu không bật lại nhanh sẽ chạy 2 vòng lặp song song
+            if self._perf_overlay_after is not None:
+                self.root.after_cancel(self._perf_overlay_after)
+                self._perf_overlay_after = None
+            self.perf_overlay.destroy()
+            self.perf_overlay = None
+            return
+        self.perf_overlay = Label(
+            self.root, font=("Consolas", 9), justify=LEFT, anchor=NW,
+            bg="#000000", fg="#7CFC00", padx=8, pady=6
+        )
+        self.perf_overlay.place(relx=1.0, rely=0.0, anchor=NE, x=-8, y=8)
+        self._update_perf_overlay()
+    
+    def _perf_overlay_text(self):
+        m = self.metrics
+        queue_depth = self.detect_scheduler.pending()
+        m.set_gauge("detect_queue_depth", queue_depth)
+        lines = [
+            f"FPS {m.rate('camera_frames'):5.1f}   queue {queue_depth}",
+            f"{'ms':<14}{'p50':>7}{'p95':>8}",
+        ]
+        for stage in PERF_OVERLAY_STAGES:
+            t = m.timing(stage)
+            if t.get("p50") is not None:
+                lines.append(f"{stage:<14}{t['p50']:>7.1f}{t['p95']:>8.1f}")
+        pool = getattr(self.model_manager, "input_pool", None)
+        if pool is not None:
+            lines.append(f"input buffers: {pool.allocations} alloc / {pool.frames} frames")
+        if self.camera_manager is not None:
+            for cam, s in self.camera_manager.stats().items():
+                line = f"{cam:<8} cap {s['capture_fps']:4.1f} det {s['detect_fps']:4.1f} skip {s['skipped']}"
+                if "latency_ms_p95" in s:
+                    line += f" p95 {s['latency_ms_p95']:.0f}ms"
+                lines.append(line)
+        return "\n".join(lines)
+    
+    def _update_perf_overlay(self):
+        self._perf_overlay_after = None
+        if self.perf_overlay is None or not self.perf_overlay.winfo_exists():
+            return
+        self.perf_overlay.config(text=self._perf_overlay_text())
+        self.perf_overlay.lift()  # Luôn nằm trên frame màn hình hiện tại
+        self._perf_overlay_after = self.root.after(500, self._update_perf_overlay)
+    
+    def _export_metrics_periodically(self):
+        self.metrics.export()
+        self.root.after(config.METRICS_EXPORT_INTERVAL_S * 1000, self._export_metrics_periodically)
+    
+    def on_close(self):
+        """Thoát app: dừng server thanh toán, scheduler detect, camera, dispatcher rồi đóng cửa sổ"""
+        self.metrics.export()
+        self.payment_handler.stop_payment_server()
+        self.detect_scheduler.stop()
+        self.decode_pool.shutdown()
+        self.is_camera_running = False
+        self._release_cameras()
+        self.ui_dispatcher.stop()
+        self.root.destroy()
+    
     def __del__(self):
         """Cleanup khi đóng app"""
-        if self.cap:
-            self.cap.release()
+        if getattr(self, "camera_manager", None) is not None:
+            self.camera_manager.stop()
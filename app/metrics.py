@@ -0,0 +1,292 @@
+# metrics.py
+"""
+Đo thời gian các bước trên hot path (decode, preprocess, inference,
+postprocess, annotate, render, ghi lịch sử/hóa đơn) với chi phí thấp.
+
+- Timer: `with metrics.timer("render"): ...` (perf_counter + 1 lần lấy lock)
+- Histogram cuộn: percentile trên N mẫu gần nhất + bucket tích lũy
+- Histogram/counter/gauge có label, tốc độ sự kiện (FPS) theo cửa sổ thời gian
+- snapshot() / export(path) ra JSON để gửi kèm ticket "kiosk chạy chậm"
+
+Tắt bằng config.METRICS_ENABLED = False (timer thành no-op).
+render_prometheus() xuất cùng số liệu theo định dạng text của Prometheus
+(endpoint /metrics của payment server).
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Biên trên các bucket (ms), dùng chung cho mọi histogram
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class RollingHistogram:
+    """Histogram thời gian (ms): cửa sổ mẫu gần nhất cho percentile + bucket tích lũy"""
+
+    def __init__(self, window=512, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # Phần tử cuối: > bucket lớn nhất
+        self.count = 0
+        self.sum = 0.0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, ms):
+        self.count += 1
+        self.sum += ms
+        self._recent.append(ms)
+        for i, bound in enumerate(self.buckets):
+            if ms <= bound:
+                self.bucket_counts[i] += 1
+                return
+        self.bucket_counts[-1] += 1
+
+    def snapshot(self):
+        recent = sorted(self._recent)
+        result = {"count": self.count, "sum_ms": round(self.sum, 3)}
+        if recent:
+            n = len(recent)
+            result.update({
+                "mean": round(sum(recent) / n, 3),
+                "p50": round(recent[n // 2], 3),
+                "p95": round(recent[min(n - 1, int(n * 0.95))], 3),
+                "p99": round(recent[min(n - 1, int(n * 0.99))], 3),
+                "max": round(recent[-1], 3),
+            })
+        return result
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, (time.perf_counter() - self.started) * 1000)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+class Metrics:
+    """Registry timing/counter/gauge/rate dùng chung cho các thread"""
+
+    def __init__(self, enabled=True, window=512):
+        self.enabled = enabled
+        self.window = window
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._events = {}
+
+    def timer(self, name):
+        """Context manager đo thời gian khối lệnh vào histogram `name`"""
+        return _Timer(self, name) if self.enabled else _NULL_TIMER
+
+    def observe(self, name, ms, **labels):
+        """Ghi 1 mẫu thời gian (ms), ví dụ observe("camera_latency", 42.0, camera="left")"""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = RollingHistogram(self.window)
+            hist.observe(ms)
+
+    def incr(self, name, n=1, **labels):
+        """Tăng counter, ví dụ incr("detections", cls="Pho")"""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + n
+
+    def set_gauge(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def tick(self, name, now=None):
+        """Ghi 1 sự kiện để tính tốc độ (ví dụ frame camera -> FPS)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            events = self._events.get(name)
+            if events is None:
+                events = self._events[name] = deque(maxlen=256)
+            events.append(time.perf_counter() if now is None else now)
+
+    def rate(self, name, window_s=2.0):
+        """Số sự kiện / giây trong window_s giây gần nhất"""
+        now = time.perf_counter()
+        with self._lock:
+            events = list(self._events.get(name, ()))
+        recent = [t for t in events if now - t <= window_s]
+        if len(recent) < 2:
+            return 0.0
+        span = now - recent[0]
+        return (len(recent) - 1) / span if span > 0 else 0.0
+
+    def timing(self, name, **labels):
+        """Snapshot 1 histogram (dict rỗng nếu chưa có mẫu)"""
+        with self._lock:
+            hist = self._histograms.get(name, {}).get(_label_key(labels))
+            return hist.snapshot() if hist else {}
+
+    def histograms(self):
+        """Bản sao {name: {labels: (buckets, bucket_counts, count, sum)}} của mọi histogram, cho exporter"""
+        with self._lock:
+            return {name: {key: (h.buckets, list(h.bucket_counts), h.count, h.sum)
+                           for key, h in series.items()}
+                    for name, series in self._histograms.items()}
+
+    def counters(self):
+        with self._lock:
+            return {name: dict(series) for name, series in self._counters.items()}
+
+    def gauges(self):
+        with self._lock:
+            return {name: dict(series) for name, series in self._gauges.items()}
+
+    def snapshot(self):
+        """Toàn bộ số liệu dạng dict (JSON được)"""
+        def label_text(key):
+            return ",".join(f"{k}={v}" for k, v in key)
+
+        def flatten(series_by_name):
+            return {name: {label_text(key) or "": value for key, value in series.items()}
+                    for name, series in series_by_name.items()}
+
+        with self._lock:
+            # Histogram không label giữ dạng {name: snapshot}; có label: {name: {"camera=left": snapshot}}
+            timings = {name: series[()].snapshot() if list(series) == [()]
+                       else {label_text(key) or "": h.snapshot() for key, h in series.items()}
+                       for name, series in self._histograms.items()}
+            event_names = list(self._events)
+
+        return {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "timings_ms": timings,
+            "counters": flatten(self.counters()),
+            "gauges": flatten(self.gauges()),
+            "rates_per_s": {name: round(self.rate(name), 2) for name in event_names},
+        }
+
+    def export(self, path=None):
+        """Ghi snapshot ra file JSON (mặc định config.METRICS_FILE); trả về đường dẫn hoặc None"""
+        path = path or config.METRICS_FILE
+        if not self.enabled or not path:
+            return None
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+            return path
+        except Exception as e:
+            logger.warning("⚠️ Không thể ghi metrics: %s", e)
+            return None
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+            self._events.clear()
+        self.started_at = time.time()
+
+
+def _prom_name(prefix, name, suffix=""):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{name}{suffix}")
+
+
+def _prom_escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(key, *extra):
+    key = tuple(key) + extra
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_prom_escape(v)}"' for k, v in key) + "}"
+
+
+def render_prometheus(metrics, prefix="food_kiosk"):
+    """
+    Xuất metrics theo Prometheus text exposition format (version 0.0.4).
+    Histogram thời gian đổi sang giây (<name>_seconds), counter có hậu tố _total.
+    """
+    lines = []
+    for name, series in sorted(metrics.histograms().items()):
+        metric = _prom_name(prefix, name, "_seconds")
+        lines.append(f"# TYPE {metric} histogram")
+        for key, (buckets, counts, count, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(buckets, counts):
+                cumulative += n
+                lines.append(f"{metric}_bucket{_prom_labels(key, ('le', f'{bound / 1000:g}'))} {cumulative}")
+            lines.append(f"{metric}_bucket{_prom_labels(key, ('le', '+Inf'))} {count}")
+            lines.append(f"{metric}_sum{_prom_labels(key)} {total / 1000:.6f}")
+            lines.append(f"{metric}_count{_prom_labels(key)} {count}")
+    for name, series in sorted(metrics.counters().items()):
+        metric = _prom_name(prefix, name, "_total")
+        lines.append(f"# TYPE {metric} counter")
+        for key, value in sorted(series.items()):
+            lines.append(f"{metric}{_prom_labels(key)} {value}")
+    for name, series in sorted(metrics.gauges().items()):
+        metric = _prom_name(prefix, name)
+        lines.append(f"# TYPE {metric} gauge")
+        for key, value in sorted(series.items()):
+            lines.append(f"{metric}{_prom_labels(key)} {value}")
+    uptime = _prom_name(prefix, "uptime_seconds")
+    lines.append(f"# TYPE {uptime} gauge")
+    lines.append(f"{uptime} {time.time() - metrics.started_at:.1f}")
+    return "\n".join(lines) + "\n"
+
+
+_default_metrics = None
+
+
+def get_metrics():
+    """Registry dùng chung cho cả app (bật/tắt theo config.METRICS_ENABLED)"""
+    global _default_metrics
+    if _default_metrics is None:
+        _default_metrics = Metrics(enabled=config.METRICS_ENABLED)
+    return _default_metrics
@@ -0,0 +1,538 @@
+# multi_camera.py
+"""
+Nhiều camera cho 1 quầy (khay dài): mỗi nguồn (index thiết bị, URL RTSP
+hoặc file video để test) có thread capture riêng, chỉ giữ frame mới nhất.
+
+Khi bật nhận diện liên tục, 1 thread điều phối lấy frame mới của từng
+camera theo vòng tròn (mỗi camera tối đa `max_inflight` frame đang chờ)
+rồi gửi vào DetectionScheduler dùng chung, nên camera nhanh không chiếm
+hết model và các frame của nhiều camera được gộp chung batch.
+
+Mỗi camera có thể khai báo `roi` (x1, y1, x2, y2, tỉ lệ 0..1): camera chỉ
+"sở hữu" các món có tâm box nằm trong roi, nên vùng chồng lấn giữa 2
+camera không bị đếm 2 lần khi gộp detection của cả quầy.
+
+Phát lại (replay): nguồn là file video hoặc thư mục ảnh frame đi qua đúng
+pipeline trên. Thời điểm của frame thứ i luôn là i / fps (đồng hồ của
+video, không phụ thuộc tốc độ đọc), frame được phát theo `speed` lần tốc độ
+gốc; speed = 0 là nhanh hết mức và không bỏ frame nào (chờ tới khi frame
+trước được đưa đi detect) -> load test lặp lại được, hoặc chạy lại footage
+cũ với model mới (xem replay.py).
+
+Cấu hình (config.CAMERA_SOURCES):
+    [{"id": "cam0", "source": 0, "roi": (0.0, 0.0, 0.55, 1.0)},
+     {"id": "cam1", "source": "rtsp://192.168.1.20/stream1", "roi": (0.45, 0.0, 1.0, 1.0)},
+     {"id": "test", "source": "videos/tray.mp4", "speed": 1.0},
+     {"id": "frames", "source": "recordings/2026-10-18/", "fps": 15, "speed": 0}]
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+import config
+from metrics import get_metrics
+from yolo_model import extract_detections
+
+logger = logging.getLogger(__name__)
+
+# Chờ trước khi mở lại camera/RTSP bị mất kết nối (giây)
+RECONNECT_DELAY = 2.0
+
+FRAME_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def parse_camera_sources(entries):
+    """
+    Chuẩn hóa cấu hình camera: chấp nhận int, chuỗi hoặc dict
+
+    Returns:
+        list: [{"id", "source", "roi", "speed", "fps"}, ...]
+    """
+    sources = []
+    for i, entry in enumerate(entries or []):
+        if not isinstance(entry, dict):
+            entry = {"source": entry}
+        source = entry.get("source", 0)
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        sources.append({
+            "id": str(entry.get("id") or f"cam{i}"),
+            "source": source,
+            "roi": tuple(entry["roi"]) if entry.get("roi") else None,
+            "speed": float(entry.get("speed", 1.0)),
+            "fps": entry.get("fps"),
+        })
+    return sources
+
+
+def is_file_source(source):
+    """Nguồn là file video / thư mục frame (không phải index thiết bị hay URL stream)"""
+    return isinstance(source, str) and "://" not in source
+
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+class FrameDirectoryCapture:
+    """Đọc thư mục ảnh frame (theo thứ tự tên, frame_2 trước frame_10) như 1 cv2.VideoCapture"""
+
+    def __init__(self, path, fps=None):
+        self.paths = [os.path.join(path, name)
+                      for name in sorted(os.listdir(path), key=_natural_key)
+                      if name.lower().endswith(FRAME_EXTENSIONS)]
+        self.fps = fps or config.CAMERA_FPS
+        self._index = 0
+
+    def isOpened(self):
+        return self._index < len(self.paths)
+
+    def read(self):
+        while self._index < len(self.paths):
+            path = self.paths[self._index]
+            self._index += 1
+            frame = cv2.imread(path)
+            if frame is not None:
+                return True, frame
+            logger.warning("⚠️ Bỏ qua frame không đọc được: %s", path)
+        return False, None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.paths))
+        return 0.0
+
+    def release(self):
+        self._index = len(self.paths)
+
+
+def open_capture(source, width=None, height=None, fps=None):
+    """
+    Mở nguồn frame: index thiết bị / URL stream / file video (cv2.VideoCapture)
+    hoặc thư mục ảnh (FrameDirectoryCapture); None nếu không mở được
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        cap = FrameDirectoryCapture(source, fps)
+        return cap if cap.isOpened() else None
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        cap.release()
+        return None
+    if isinstance(source, int):
+        if width:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            cap.set(cv2.CAP_PROP_FPS, fps)
+    return cap
+
+
+def tile_frames(frames, height=None):
+    """Ghép các frame BGR thành 1 ảnh ngang (cùng chiều cao) để xem trước"""
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        return None
+    if len(frames) == 1:
+        return frames[0]
+    height = height or min(f.shape[0] for f in frames)
+    resized = [f if f.shape[0] == height else
+               cv2.resize(f, (max(1, round(f.shape[1] * height / f.shape[0])), height))
+               for f in frames]
+    return np.hstack(resized)
+
+
+def in_roi(detection, roi, width, height):
+    """Tâm box có nằm trong roi (tỉ lệ) không; không có roi/box thì luôn đúng"""
+    box = detection.get("box")
+    if not roi or not box:
+        return True
+    cx = (box[0] + box[2]) / 2 / width
+    cy = (box[1] + box[3]) / 2 / height
+    return roi[0] <= cx <= roi[2] and roi[1] <= cy <= roi[3]
+
+
+class CameraStats:
+    """Thống kê 1 camera: FPS capture/detect, latency capture -> có kết quả, frame bị bỏ"""
+
+    def __init__(self, camera_id, window=256):
+        self.camera_id = camera_id
+        self._lock = threading.Lock()
+        self.captured = 0
+        self.detected = 0
+        self.skipped = 0       # Frame bị frame mới hơn ghi đè trước khi được detect
+        self.read_errors = 0
+        self.reconnects = 0
+        self._captured_at = deque(maxlen=window)
+        self._detected_at = deque(maxlen=window)
+        self._latency_ms = deque(maxlen=window)
+
+    def on_capture(self, now):
+        with self._lock:
+            self.captured += 1
+            self._captured_at.append(now)
+
+    def on_detect(self, now, latency_ms):
+        with self._lock:
+            self.detected += 1
+            self._detected_at.append(now)
+            self._latency_ms.append(latency_ms)
+
+    def on_skip(self, n=1):
+        with self._lock:
+            self.skipped += n
+
+    def on_read_error(self):
+        with self._lock:
+            self.read_errors += 1
+
+    @staticmethod
+    def _fps(times, now, window_s=2.0):
+        recent = [t for t in times if now - t <= window_s]
+        if len(recent) < 2:
+            return 0.0
+        return (len(recent) - 1) / (now - recent[0])
+
+    def snapshot(self):
+        now = time.perf_counter()
+        with self._lock:
+            latency = sorted(self._latency_ms)
+            result = {
+                "captured": self.captured,
+                "detected": self.detected,
+                "skipped": self.skipped,
+                "read_errors": self.read_errors,
+                "reconnects": self.reconnects,
+                "capture_fps": round(self._fps(self._captured_at, now), 2),
+                "detect_fps": round(self._fps(self._detected_at, now), 2),
+            }
+        if latency:
+            result["latency_ms_p50"] = round(latency[len(latency) // 2], 2)
+            result["latency_ms_p95"] = round(latency[min(len(latency) - 1, int(len(latency) * 0.95))], 2)
+        return result
+
+
+class CameraWorker:
+    """Thread capture của 1 camera; chỉ giữ frame mới nhất"""
+
+    def __init__(self, camera_id, source, roi=None, opener=None, speed=1.0, fps=None, lossless=False,
+                 open_timeout=None):
+        """
+        Args:
+            speed: (file/thư mục) số lần tốc độ gốc; 0 = nhanh hết mức
+            fps: FPS gốc của thư mục frame / file video không ghi FPS
+            lossless: Chờ frame trước được take_new() rồi mới đọc frame kế (không bỏ frame)
+            open_timeout: Bỏ cuộc nếu chưa mở được nguồn lần nào sau ngần này giây
+                (mặc định config.CAMERA_OPEN_TIMEOUT_S); nguồn đã mở rồi thì luôn thử kết nối lại
+        """
+        self.camera_id = camera_id
+        self.source = source
+        self.roi = roi
+        self.speed = max(0.0, speed)
+        self.fps = fps
+        self.lossless = lossless
+        self.stats = CameraStats(camera_id)
+        self.opener = opener or (lambda src: open_capture(
+            src, config.CAMERA_WIDTH, config.CAMERA_HEIGHT, self.fps or config.CAMERA_FPS))
+        self.open_timeout = config.CAMERA_OPEN_TIMEOUT_S if open_timeout is None else open_timeout
+        self.opened = False
+        self.ended = False
+        self.open_failed = False  # Hết open_timeout mà chưa mở được nguồn
+        self._lock = threading.Lock()
+        self._taken = threading.Condition(self._lock)
+        self._frame = None       # (seq, frame, captured_at, frame_ts)
+        self._taken_seq = 0      # seq của frame mới nhất đã đưa đi detect
+        self._seq = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name=f"camera-{self.camera_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._running = False
+        with self._taken:
+            self._taken.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def latest(self):
+        """(seq, frame, captured_at, frame_ts) mới nhất hoặc None"""
+        with self._lock:
+            return self._frame
+
+    def take_new(self):
+        """Lấy frame chưa được detect (mới nhất); None nếu không có frame mới"""
+        with self._lock:
+            if self._frame is None or self._frame[0] <= self._taken_seq:
+                return None
+            prev_taken = self._taken_seq
+            skipped = self._frame[0] - prev_taken - 1
+            self._taken_seq = self._frame[0]
+            frame = self._frame
+            self._taken.notify_all()
+        # Frame có trước lần detect đầu tiên không tính là bị bỏ
+        if skipped > 0 and prev_taken > 0:
+            self.stats.on_skip(skipped)
+            get_metrics().incr("camera_frames_dropped", skipped, camera=self.camera_id)
+        return frame
+
+    def drained(self):
+        """Nguồn đã hết và frame cuối đã được đưa đi detect"""
+        with self._lock:
+            return self.ended and (self._frame is None or self._frame[0] <= self._taken_seq)
+
+    def _publish(self, frame, now, frame_ts):
+        with self._taken:
+            if self.lossless:
+                while self._running and self._frame is not None and self._frame[0] > self._taken_seq:
+                    self._taken.wait(0.1)
+            self._seq += 1
+            self._frame = (self._seq, frame, now, frame_ts)
+
+    def _loop(self):
+        metrics = get_metrics()
+        file_source = is_file_source(self.source)
+        started = time.perf_counter()
+        while self._running:
+            cap = self.opener(self.source)
+            if cap is None:
+                logger.warning("⚠️ Không mở được camera %s (%s)", self.camera_id, self.source)
+                if file_source or (not self.opened and time.perf_counter() - started >= self.open_timeout):
+                    self.open_failed = not self.opened
+                    self.ended = True
+                    return
+                time.sleep(RECONNECT_DELAY)
+                continue
+            self.opened = True
+            # File/thư mục: frame thứ i ứng với thời điểm i / fps của video
+            fps = (cap.get(cv2.CAP_PROP_FPS) or self.fps or config.CAMERA_FPS) if file_source else 0
+            index = 0
+            opened_at = time.perf_counter()
+            try:
+                while self._running:
+                    with metrics.timer("capture"):
+                        ok, frame = cap.read()
+                    if not ok:
+                        if not file_source:  # Hết file video không phải lỗi
+                            self.stats.on_read_error()
+                            metrics.incr("camera_frames_dropped", camera=self.camera_id)
+                        break
+                    if file_source:
+                        frame_ts = index / fps
+                        index += 1
+                        if self.speed > 0:
+                            # Phát theo đồng hồ của video (không cộng dồn độ trễ từng frame)
+                            delay = opened_at + frame_ts / self.speed - time.perf_counter()
+                            if delay > 0:
+                                time.sleep(delay)
+                    now = time.perf_counter()
+                    if not file_source:
+                        frame_ts = now - opened_at
+                    self.stats.on_capture(now)
+                    metrics.incr("camera_frames_captured", camera=self.camera_id)
+                    metrics.tick("camera_frames")
+                    metrics.tick(f"camera_frames.{self.camera_id}")
+                    self._publish(frame, now, frame_ts)
+            finally:
+                cap.release()
+            if file_source:
+                self.ended = True
+                return
+            if self._running:
+                self.stats.reconnects += 1
+                logger.warning("⚠️ Mất tín hiệu camera %s, thử mở lại", self.camera_id)
+                time.sleep(RECONNECT_DELAY)
+
+
+class MultiCameraManager:
+    """Quản lý các CameraWorker và (tùy chọn) nhận diện liên tục qua scheduler dùng chung"""
+
+    def __init__(self, sources, detect_scheduler=None, confidence=None, live_detect=False,
+                 max_inflight=1, opener=None, on_result=None):
+        """
+        Args:
+            sources: Kết quả parse_camera_sources
+            detect_scheduler: DetectionScheduler dùng chung (bắt buộc nếu live_detect)
+            confidence: Hàm trả về ngưỡng confidence hiện tại (đọc mỗi lần gửi frame)
+            live_detect: True để detect liên tục frame mới của mọi camera
+            max_inflight: Số frame tối đa mỗi camera đang chờ model (công bằng giữa các camera)
+            on_result: Gọi (trên thread của scheduler) với (camera_id, entry) mỗi frame detect xong;
+                entry giống latest_results() thêm "frame_index"
+        """
+        live_detect = live_detect and detect_scheduler is not None
+        self.workers = [
+            CameraWorker(s["id"], s["source"], s.get("roi"), opener,
+                         speed=s.get("speed", 1.0), fps=s.get("fps"),
+                         # Replay nhanh hết mức: chờ frame được detect thay vì bỏ frame
+                         lossless=live_detect and is_file_source(s["source"]) and s.get("speed", 1.0) == 0)
+            for s in sources
+        ]
+        self.detect_scheduler = detect_scheduler
+        self.confidence = confidence or (lambda: config.DEFAULT_CONFIDENCE)
+        self.live_detect = live_detect
+        self.on_result = on_result
+        self.max_inflight = max(1, max_inflight)
+        self._lock = threading.Lock()
+        self._inflight = {w.camera_id: 0 for w in self.workers}
+        self._results = {}   # camera_id -> {"frame", "result", "detections", "captured_at"}
+        self._wakeup = threading.Event()
+        self._next = 0       # Camera bắt đầu vòng tròn kế tiếp
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        for worker in self.workers:
+            worker.start()
+        if self.live_detect:
+            self._thread = threading.Thread(target=self._dispatch_loop, name="camera-dispatch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        for worker in self.workers:
+            worker.stop()
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+
+    @property
+    def roi_by_camera(self):
+        return {w.camera_id: w.roi for w in self.workers}
+
+    def latest_frames(self):
+        """{camera_id: frame} của các camera đã có frame (theo thứ tự cấu hình)"""
+        frames = {}
+        for worker in self.workers:
+            latest = worker.latest()
+            if latest is not None:
+                frames[worker.camera_id] = latest[1]
+        return frames
+
+    def latest_results(self):
+        """{camera_id: {"frame", "result", "detections", "captured_at", "frame_ts"}} của lần detect gần nhất"""
+        with self._lock:
+            return dict(self._results)
+
+    def fuse(self, detections_by_camera, frame_sizes):
+        """
+        Gộp detection của các camera thành 1 danh sách cho cả quầy:
+        mỗi camera chỉ giữ món có tâm nằm trong roi của nó, gắn thêm "camera".
+
+        Args:
+            detections_by_camera: {camera_id: [detection, ...]}
+            frame_sizes: {camera_id: (width, height)}
+        """
+        rois = self.roi_by_camera
+        fused = []
+        for worker in self.workers:
+            cam = worker.camera_id
+            if cam not in detections_by_camera:
+                continue
+            width, height = frame_sizes[cam]
+            for det in detections_by_camera[cam]:
+                if in_roi(det, rois.get(cam), width, height):
+                    fused.append(dict(det, camera=cam))
+        return fused
+
+    def fused_detections(self):
+        """Detection gộp từ kết quả detect liên tục mới nhất của mọi camera"""
+        results = self.latest_results()
+        return self.fuse(
+            {cam: r["detections"] for cam, r in results.items()},
+            {cam: (r["frame"].shape[1], r["frame"].shape[0]) for cam, r in results.items()},
+        )
+
+    def finished(self):
+        """Mọi nguồn đã hết, mọi frame đã detect xong (dùng khi replay)"""
+        with self._lock:
+            if any(self._inflight.values()):
+                return False
+        return all(w.drained() for w in self.workers)
+
+    def stats(self):
+        """{camera_id: snapshot thống kê}"""
+        return {w.camera_id: dict(w.stats.snapshot(), opened=w.opened, ended=w.ended,
+                                   open_failed=w.open_failed) for w in self.workers}
+
+    def _dispatch_loop(self):
+        while self._running:
+            self._wakeup.clear()
+            submitted = False
+            n = len(self.workers)
+            # Vòng tròn bắt đầu từ camera sau camera được gửi đầu tiên ở vòng trước
+            for k in range(n):
+                worker = self.workers[(self._next + k) % n]
+                cam = worker.camera_id
+                # Giữ chỗ inflight trước khi lấy frame: take_new() đánh dấu frame đã
+                # lấy (drained) nên finished() không được thấy khoảng trống giữa 2 bước
+                with self._lock:
+                    if self._inflight[cam] >= self.max_inflight:
+                        continue
+                    self._inflight[cam] += 1
+                item = worker.take_new()
+                if item is None:
+                    with self._lock:
+                        self._inflight[cam] -= 1
+                    continue
+                if not submitted:
+                    self._next = (self._next + k + 1) % n
+                submitted = True
+                self._submit(worker, item)
+            if not submitted:
+                self._wakeup.wait(0.005)
+
+    def _submit(self, worker, item):
+        """Gửi frame đi detect (chỗ inflight đã được giữ trong _dispatch_loop)"""
+        seq, frame, captured_at, frame_ts = item
+        cam = worker.camera_id
+        try:
+            future = self.detect_scheduler.submit(frame, self.confidence())
+        except RuntimeError:
+            with self._lock:
+                self._inflight[cam] -= 1
+            return
+        future.add_done_callback(lambda f: self._on_result(worker, seq, frame, captured_at, frame_ts, f))
+
+    def _on_result(self, worker, seq, frame, captured_at, frame_ts, future):
+        cam = worker.camera_id
+        if future.cancelled() or future.exception() is not None:
+            with self._lock:
+                self._inflight[cam] -= 1
+            self._wakeup.set()
+            return
+        result = future.result()
+        now = time.perf_counter()
+        latency_ms = (now - captured_at) * 1000
+        worker.stats.on_detect(now, latency_ms)
+        get_metrics().observe("camera_latency", latency_ms, camera=cam)
+        entry = {
+            "frame": frame,
+            "result": result,
+            "detections": extract_detections(result),
+            "captured_at": captured_at,
+            "frame_ts": frame_ts,
+            "frame_index": seq - 1,
+        }
+        if self.on_result is not None:
+            try:
+                self.on_result(cam, entry)
+            except Exception as e:
+                logger.error("❌ Lỗi xử lý kết quả camera %s: %s", cam, e)
+        with self._lock:
+            self._results[cam] = entry
+            self._inflight[cam] -= 1
+        self._wakeup.set()
@@ -1,72 +1,102 @@
 """
 Xử lý thanh toán và hóa đơn
 """
-import socket
+import importlib.util
+import logging
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from datetime import datetime
-from urllib.parse import urlparse, parse_qs
-from http.server import HTTPServer, BaseHTTPRequestHandler
 from tkinter import Toplevel, Frame, Label, LabelFrame, Radiobutton, StringVar, Button, messagebox
 
 try:
-    import qrcode
     from PIL import Image, ImageTk
-    HAS_QR = True
+    # qrcode chỉ được import khi render QR lần đầu
+    HAS_QR = importlib.util.find_spec("qrcode") is not None
 except ImportError:
     HAS_QR = False
 
 import config
+from invoice_engine import get_invoice_engine
+from metrics import get_metrics, render_prometheus
 
-# Thư mục gốc project (chứa app/ và web/)
-PROJECT_ROOT = Path(__file__).resolve().parent.parent
-PAYMENT_HTML_PATH = PROJECT_ROOT / "web" / "payment_success.html"
-PAYMENT_SERVER_PORT = 8765
-PAYMENT_QR_TEXT = "THANHTOANTHANHCON"
-
+logger = logging.getLogger(__name__)
 
-def get_local_ip():
-    """Lấy IP nội bộ (Wi‑Fi/LAN) để điện thoại cùng mạng mở được link trong QR."""
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.settimeout(0.5)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except Exception:
-        return "127.0.0.1"
+PAYMENT_QR_TEXT = "THANHTOANTHANHCON"
+# Các hình thức thanh toán có QR (tiền mặt không cần)
+PAYMENT_QR_METHODS = ("momo", "zalopay", "vietqr")
+PAYMENT_QR_SIZE = 400
 
 
-def make_payment_handler(app_ref):
-    """Tạo lớp Handler có tham chiếu tới MainWindow."""
-    class PaymentHTTPHandler(BaseHTTPRequestHandler):
-        def log_message(self, format, *args):
-            pass  # Tắt log request
-        
-        def do_GET(self):
-            path = urlparse(self.path).path
-            query = parse_qs(urlparse(self.path).query)
-            method = (query.get("m") or ["vietqr"])[0]
-            if path in ("/success", "/"):
+class QRImageCache:
+    """
+    Cache ảnh QR theo (url, method, size).
+    
+    QR được render ở kích thước module gốc (box_size=1) rồi phóng to bằng
+    nearest-neighbour theo hệ số nguyên, thay vì box_size=10 + LANCZOS.
+    Ảnh PIL có thể render trước trên thread nền; PhotoImage chỉ tạo trên Tk thread.
+    """
+    
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._images = OrderedDict()  # (url, method, size) -> PIL.Image
+        self._photos = {}             # (url, method, size) -> ImageTk.PhotoImage
+    
+    @staticmethod
+    def render(data, size):
+        """Render QR thành ảnh PIL size x size (nét, không nội suy)"""
+        import qrcode
+        qr = qrcode.QRCode(version=1, box_size=1, border=4)
+        qr.add_data(data)
+        qr.make(fit=True)
+        img = qr.make_image(fill_color="black", back_color="white").get_image().convert("L")
+        native = img.size[0]
+        factor = max(1, size // native)
+        img = img.resize((native * factor, native * factor), Image.NEAREST)
+        if img.size[0] != size:
+            # Căn giữa trên nền trắng cho đúng kích thước yêu cầu
+            canvas = Image.new("L", (size, size), 255)
+            offset = (size - img.size[0]) // 2
+            canvas.paste(img, (offset, offset))
+            img = canvas
+        return img
+    
+    def get_image(self, url, method, size):
+        """Lấy ảnh PIL (render nếu chưa có trong cache)"""
+        key = (url, method, size)
+        with self._lock:
+            img = self._images.get(key)
+            if img is not None:
+                self._images.move_to_end(key)
+                get_metrics().incr("cache_lookups", cache="qr", result="hit")
+                return img
+        get_metrics().incr("cache_lookups", cache="qr", result="miss")
+        img = self.render(url, size)
+        with self._lock:
+            self._images[key] = img
+            while len(self._images) > self.max_entries:
+                old_key, _ = self._images.popitem(last=False)
+                self._photos.pop(old_key, None)
+        return img
+    
+    def get_photo(self, url, method, size):
+        """Lấy ImageTk.PhotoImage (phải gọi trên Tk thread)"""
+        key = (url, method, size)
+        photo = self._photos.get(key)
+        if photo is None:
+            photo = ImageTk.PhotoImage(self.get_image(url, method, size))
+            self._photos[key] = photo
+        return photo
+    
+    def prerender(self, entries, size):
+        """Render trước trên thread nền các QR [(url, method), ...]"""
+        def run():
+            for url, method in entries:
                 try:
-                    html_path = PAYMENT_HTML_PATH
-                    if html_path.exists():
-                        body = html_path.read_bytes()
-                    else:
-                        body = b"<h1>Thanh toan thanh cong!</h1>"
-                except Exception:
-                    body = b"<h1>Thanh toan thanh cong!</h1>"
-                self.send_response(200)
-                self.send_header("Content-Type", "text/html; charset=utf-8")
-                self.send_header("Content-Length", str(len(body)))
-                self.end_headers()
-                self.wfile.write(body)
-                if app_ref and getattr(app_ref, "root", None):
-                    app_ref.root.after(0, lambda: app_ref.on_payment_success_from_web(method))
-                return
-            self.send_response(404)
-            self.end_headers()
-    return PaymentHTTPHandler
+                    self.get_image(url, method, size)
+                except Exception as e:
+                    logger.warning("⚠️ Không render trước được QR: %s", e)
+        threading.Thread(target=run, name="qr-prerender", daemon=True).start()
 
 
 class PaymentHandler:
@@ -80,36 +110,74 @@ class PaymentHandler:
         self.food_data = food_data
         self._payment_window = None
         self._payment_server_url = None
-        self._httpd = None
+        self.payment_server = None
+        self.qr_cache = QRImageCache() if HAS_QR else None
+        self.invoice_engine = get_invoice_engine()
     
     def start_payment_server(self, app_ref):
-        """Chạy server HTTP nền để phục vụ trang thanh toán thành công khi quét QR."""
+        """Chạy server HTTP nền (đa luồng) để phục vụ trang thanh toán thành công khi quét QR."""
         try:
-            local_ip = get_local_ip()
-            handler = make_payment_handler(app_ref)
-            self._httpd = HTTPServer(("0.0.0.0", PAYMENT_SERVER_PORT), handler)
-            self._payment_server_url = f"http://{local_ip}:{PAYMENT_SERVER_PORT}/success"
-            import threading
-            t = threading.Thread(target=self._httpd.serve_forever, daemon=True)
-            t.start()
-            print(f"✅ Payment server: {self._payment_server_url}")
+            from payment_server import PaymentServer  # http.server chỉ import khi cần
+            metrics_provider = None
+            if config.METRICS_ENDPOINT_ENABLED:
+                metrics_provider = lambda: render_prometheus(get_metrics())
+            self.payment_server = PaymentServer(metrics_provider=metrics_provider)
+            self._payment_server_url = self.payment_server.start(app_ref)
+            logger.info("✅ Payment server: %s", self._payment_server_url)
         except Exception as e:
-            print(f"⚠️ Không chạy được payment server: {e}")
+            logger.warning("⚠️ Không chạy được payment server: %s", e)
+            self.payment_server = None
             self._payment_server_url = None
     
-    def make_qr_image(self, data, size=200):
-        """Tạo ảnh QR (PIL) từ chuỗi. Trả về ImageTk hoặc None nếu không có thư viện."""
+    def stop_payment_server(self):
+        """Dừng server thanh toán (gọi khi app thoát)"""
+        if self.payment_server:
+            try:
+                self.payment_server.stop()
+            except Exception as e:
+                logger.warning("⚠️ Lỗi khi dừng payment server: %s", e)
+            self.payment_server = None
+        self._payment_server_url = None
+    
+    def get_payment_url(self, session_id, method):
+        """
+        URL cho QR thanh toán của phiên: chứa token riêng của phiên để server
+        chỉ xác nhận đúng phiên đó (và chỉ 1 lần). None nếu server không chạy.
+        """
+        if not self.payment_server or not self._payment_server_url:
+            return None
+        return self.payment_server.session_url(session_id, method)
+    
+    def confirm_session(self, session_id, method):
+        """Ghi nhận phiên đã thanh toán từ app để các lần quét QR sau chỉ trả trang"""
+        if self.payment_server and session_id:
+            self.payment_server.tokens.confirm_session(session_id, method)
+    
+    def revoke_session(self, session_id):
+        """Hủy token thanh toán của phiên (phiên kết thúc / bị hủy)"""
+        if self.payment_server and session_id:
+            self.payment_server.tokens.revoke(session_id)
+    
+    def prerender_session_qr(self, session_id, size=PAYMENT_QR_SIZE):
+        """
+        Render trước QR của mọi hình thức thanh toán cho phiên (gọi khi mở màn hình kết quả),
+        để đổi hình thức thanh toán hiển thị QR ngay lập tức.
+        """
+        if not self.qr_cache or not session_id:
+            return
+        entries = []
+        for method in PAYMENT_QR_METHODS:
+            url = self.get_payment_url(session_id, method)
+            if url:
+                entries.append((url, method))
+        if entries:
+            self.qr_cache.prerender(entries, size)
+    
+    def make_qr_image(self, data, size=200, method=None):
+        """Tạo ảnh QR từ chuỗi (lấy từ cache). Trả về ImageTk hoặc None nếu không có thư viện."""
         if not HAS_QR:
             return None
-        qr = qrcode.QRCode(version=1, box_size=10, border=4)
-        qr.add_data(data)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        try:
-            img = img.resize((size, size), Image.Resampling.LANCZOS)
-        except AttributeError:
-            img = img.resize((size, size), Image.LANCZOS)
-        return ImageTk.PhotoImage(img)
+        return self.qr_cache.get_photo(data, method, size)
     
     def show_payment_dialog(self, cart, current_detections, current_session, 
                            result_total_price, result_total_calories,
@@ -196,12 +264,12 @@ class PaymentHandler:
             if m == "cash":
                 qr_label.config(text="💵 Thanh toán khi nhận hàng. Không cần quét mã.")
                 return
-            if self._payment_server_url:
-                qr_content = f"{self._payment_server_url}?m={m}"
-            else:
+            session_id = (current_session or {}).get("id")
+            qr_content = self.get_payment_url(session_id, m) if session_id else None
+            if not qr_content:
                 qr_content = PAYMENT_QR_TEXT
             if HAS_QR:
-                photo = self.make_qr_image(qr_content, size=400)
+                photo = self.make_qr_image(qr_content, size=PAYMENT_QR_SIZE, method=m)
                 if photo:
                     qr_photo_holder[0] = photo
                     lab = Label(f_qr, image=photo, bg="white", padx=12, pady=12)
@@ -226,7 +294,9 @@ class PaymentHandler:
             method = method_var.get()
             name_map = {"cash": "Tiền mặt", "momo": "Momo", "zalopay": "ZaloPay", "vietqr": "VietQR"}
             method_name = name_map.get(method, method)
-            path = self.save_invoice_to_downloads(cart, current_detections, method_name)
+            self.confirm_session((current_session or {}).get("id"), method)
+            invoice = self.record_invoice(cart, current_detections, method_name, current_session)
+            path = self.save_invoice_to_downloads(cart, current_detections, method_name, invoice=invoice)
             self._payment_window = None
             pay_win.destroy()
             messagebox.showinfo("Thanh toán thành công", 
@@ -239,80 +309,41 @@ class PaymentHandler:
         Button(pay_win, text="Đóng", bg=config.COLORS['text_gray'], fg='white', font=('Arial', 10),
                bd=0, padx=20, pady=6, cursor='hand2', command=_on_close).pack(pady=0)
     
-    def save_invoice_to_downloads(self, cart, current_detections, payment_method_name):
+    def record_invoice(self, cart, current_detections, payment_method_name, session=None):
         """
-        Tạo nội dung hóa đơn và lưu vào thư mục Downloads. Trả về đường dẫn file.
+        Dựng hóa đơn cho giao dịch vừa thanh toán và ghi 1 lần vào invoice store.
+        
+        Returns:
+            dict: invoice record (dùng lại để hiển thị / xuất file)
+        """
+        invoice = self.invoice_engine.build_invoice(
+            cart, current_detections, payment_method_name,
+            food_data=self.food_data, normalize_func=self.normalize_food_key_func, session=session
+        )
+        try:
+            self.invoice_engine.save(invoice)
+        except OSError as e:
+            logger.error("⚠️ Không lưu được hóa đơn vào store: %s", e)
+        return invoice
+    
+    def save_invoice_to_downloads(self, cart, current_detections, payment_method_name, invoice=None, fmt="text"):
+        """
+        Xuất hóa đơn vào thư mục Downloads. Trả về đường dẫn file.
         
         Args:
             cart: Giỏ hàng hiện tại
             current_detections: Danh sách detections gốc (fallback)
             payment_method_name: Tên phương thức thanh toán
+            invoice: Hóa đơn đã ghi khi thanh toán (None thì tạo và ghi mới)
+            fmt: "text", "json" hoặc "csv"
         """
-        # Ưu tiên lấy theo CART (đã được user xác nhận)
-        if cart:
-            total_items, total, total_cal = self.get_cart_totals_func()
-            items_iter = list(cart.values())
-        else:
-            # Fallback: dùng raw detections nếu chưa có cart
-            total_items = len(current_detections)
-            total = 0
-            total_cal = 0
-            for det in current_detections:
-                key = self.normalize_food_key_func(det['name'])
-                info = self.food_data.get(key, {})
-                total += info.get('price', 0)
-                total_cal += info.get('calories', 0)
-            items_iter = None
-        
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        downloads = Path.home() / "Downloads"
-        downloads.mkdir(parents=True, exist_ok=True)
-        path = downloads / f"HoaDon_Food_{ts}.txt"
-        
-        # Format hóa đơn đẹp như siêu thị
-        lines = []
-        lines.append(" " * 20 + "🍕 FOOD DETECTION AI")
-        lines.append(" " * 18 + "=" * 30)
-        lines.append(" " * 20 + "HÓA ĐƠN BÁN HÀNG")
-        lines.append(" " * 18 + "=" * 30)
-        lines.append("")
-        lines.append(f"Ngày: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-        lines.append(f"Mã HĐ: INV_{ts}")
-        lines.append(f"Phương thức: {payment_method_name}")
-        lines.append("-" * 50)
-        lines.append(f"{'Tên món':<25} {'SL':>3} {'Giá':>12} {'TT':>12}")
-        lines.append("-" * 50)
-        
-        if items_iter is not None:
-            for item in items_iter:
-                qty = int(item.get("quantity", 0))
-                if item.get("excluded") or qty <= 0:
-                    continue
-                name = (item.get("name_vi") or item.get("key"))[:23]
-                price = item.get("price", 0)
-                total_line = price * qty
-                lines.append(f"{name:<25} {qty:>3} {price:>11,}đ {total_line:>11,}đ")
-        else:
-            for det in current_detections:
-                key = self.normalize_food_key_func(det['name'])
-                info = self.food_data.get(key, {})
-                name = (info.get('name_vi') or det['name'])[:23]
-                price = info.get('price', 0)
-                total_line = price
-                lines.append(f"{name:<25} {1:>3} {price:>11,}đ {total_line:>11,}đ")
-        
-        lines.append("-" * 50)
-        lines.append(f"{'Tổng số phần:':<25} {total_items:>3}")
-        lines.append(f"{'Tổng calo:':<25} {total_cal:,} kcal")
-        lines.append("")
-        lines.append(f"{'TỔNG TIỀN:':<25} {total:>11,}đ")
-        lines.append("")
-        lines.append(" " * 15 + "Cảm ơn quý khách!")
-        lines.append(" " * 12 + "Hẹn gặp lại 🎉")
-        lines.append("=" * 50)
+        if invoice is None:
+            invoice = self.record_invoice(cart, current_detections, payment_method_name)
         
-        path.write_text("\n".join(lines), encoding="utf-8")
-        return str(path)
+        ext = {"text": "txt", "json": "json", "csv": "csv"}[fmt]
+        ts = invoice["invoice_id"][len("INV_"):]
+        path = Path.home() / "Downloads" / f"HoaDon_Food_{ts}.{ext}"
+        return self.invoice_engine.export(invoice, path, fmt)
     
     def close_payment_window(self):
         """Đóng cửa sổ thanh toán nếu đang mở"""
@@ -0,0 +1,393 @@
+# payment_server.py
+"""
+HTTP server nền phục vụ trang "Thanh toán thành công" khi điện thoại quét QR.
+
+- Mỗi request chạy trên 1 thread riêng (ThreadingHTTPServer): 1 điện thoại
+  mạng chậm không chặn các máy khác.
+- Trang HTML được đọc 1 lần vào bộ nhớ, kèm bản gzip và ETag.
+- HTTP/1.1 keep-alive, timeout cho kết nối treo.
+- Đo thời gian xử lý request; dừng server gọn gàng khi app thoát.
+- Mỗi phiên giao dịch có 1 token riêng trong URL của QR; xác nhận
+  thanh toán là idempotent (quét lại / mở lại link chỉ được ghi nhận 1 lần).
+"""
+import gzip
+import hashlib
+import secrets
+import socket
+import threading
+import time
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+# Thư mục gốc project (chứa app/ và web/)
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+PAYMENT_HTML_PATH = PROJECT_ROOT / "web" / "payment_success.html"
+PAYMENT_SERVER_PORT = 8765
+PAYMENT_FALLBACK_HTML = b"<h1>Thanh toan thanh cong!</h1>"
+PAYMENT_EXPIRED_HTML = (
+    "<h1>Mã thanh toán không hợp lệ hoặc đã hết hạn</h1>"
+    "<p>Vui lòng quét lại mã QR mới trên màn hình.</p>"
+).encode("utf-8")
+
+# Thời gian sống của token thanh toán (giây)
+PAYMENT_TOKEN_TTL = 15 * 60
+
+# Kết quả xác nhận token
+CONFIRM_NEW = "new"              # Lần xác nhận đầu tiên -> chuyển màn hình
+CONFIRM_DUPLICATE = "duplicate"  # Đã xác nhận trước đó -> chỉ trả trang
+CONFIRM_INVALID = "invalid"      # Token không tồn tại / hết hạn
+
+# Kết nối không gửi gì trong khoảng này (giây) sẽ bị đóng
+REQUEST_TIMEOUT = 15
+
+
+def get_local_ip():
+    """Lấy IP nội bộ (Wi‑Fi/LAN) để điện thoại cùng mạng mở được link trong QR."""
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.settimeout(0.5)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except Exception:
+        return "127.0.0.1"
+
+
+class CachedPage:
+    """Nội dung trang tĩnh nạp sẵn trong bộ nhớ (bản gốc + gzip + ETag)"""
+
+    def __init__(self, path, fallback=PAYMENT_FALLBACK_HTML):
+        try:
+            body = Path(path).read_bytes()
+        except OSError:
+            body = fallback
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=6)
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+class PaymentTokenTable:
+    """
+    Bảng token thanh toán: token -> phiên giao dịch.
+
+    Tra cứu O(1) bằng dict; token hết hạn được dọn dần theo thứ tự phát hành
+    (cùng TTL nên thứ tự phát hành cũng là thứ tự hết hạn).
+    """
+
+    def __init__(self, ttl=PAYMENT_TOKEN_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._records = {}     # token -> record
+        self._by_session = {}  # session_id -> token
+        self._expiry = deque()  # (expires_at, token) theo thứ tự phát hành
+
+    def _purge_expired(self, now):
+        while self._expiry and self._expiry[0][0] <= now:
+            _, token = self._expiry.popleft()
+            record = self._records.get(token)
+            if record is not None and record["expires_at"] <= now:
+                self._drop(token)
+
+    def _drop(self, token):
+        record = self._records.pop(token, None)
+        if record is not None and self._by_session.get(record["session_id"]) == token:
+            del self._by_session[record["session_id"]]
+
+    def issue(self, session_id, on_confirm=None):
+        """
+        Lấy token cho phiên giao dịch (dùng lại token cũ nếu còn hạn).
+
+        Args:
+            session_id: Id của current_session
+            on_confirm: Callback(method, session_id) khi token được xác nhận lần đầu
+                        (chạy trên thread của server)
+
+        Returns:
+            str: token
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            token = self._by_session.get(session_id)
+            if token is not None:
+                if on_confirm is not None:
+                    self._records[token]["on_confirm"] = on_confirm
+                return token
+            token = secrets.token_urlsafe(12)
+            expires_at = now + self.ttl
+            self._records[token] = {
+                "token": token,
+                "session_id": session_id,
+                "expires_at": expires_at,
+                "on_confirm": on_confirm,
+                "confirmed_method": None,
+            }
+            self._by_session[session_id] = token
+            self._expiry.append((expires_at, token))
+            return token
+
+    def lookup(self, token):
+        """Trả về bản sao record của token (None nếu không có / hết hạn)"""
+        now = time.monotonic()
+        with self._lock:
+            record = self._records.get(token)
+            if record is None or record["expires_at"] <= now:
+                return None
+            return dict(record)
+
+    def confirm(self, token, method):
+        """
+        Đánh dấu token đã thanh toán (idempotent).
+
+        Returns:
+            (status, record): status là CONFIRM_NEW / CONFIRM_DUPLICATE / CONFIRM_INVALID
+        """
+        now = time.monotonic()
+        with self._lock:
+            record = self._records.get(token) if token else None
+            if record is None or record["expires_at"] <= now:
+                return CONFIRM_INVALID, None
+            if record["confirmed_method"] is not None:
+                return CONFIRM_DUPLICATE, dict(record)
+            record["confirmed_method"] = method
+            return CONFIRM_NEW, dict(record)
+
+    def confirm_session(self, session_id, method):
+        """Đánh dấu phiên đã thanh toán từ phía app (vd. bấm nút xác nhận)"""
+        with self._lock:
+            token = self._by_session.get(session_id)
+        if token is not None:
+            self.confirm(token, method)
+
+    def revoke(self, session_id):
+        """Hủy token của phiên (phiên kết thúc / bị hủy)"""
+        with self._lock:
+            token = self._by_session.get(session_id)
+            if token is not None:
+                self._drop(token)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
+
+
+class RequestStats:
+    """Thống kê request của server (an toàn giữa các thread)"""
+
+    def __init__(self, window=500):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.total = 0
+        self.by_status = {}
+        self.not_modified = 0
+        self.gzipped = 0
+        self.max_ms = 0.0
+        self.confirmations = {}
+
+    def record(self, status, elapsed_ms, gzipped=False):
+        with self._lock:
+            self.total += 1
+            self.by_status[status] = self.by_status.get(status, 0) + 1
+            if status == 304:
+                self.not_modified += 1
+            if gzipped:
+                self.gzipped += 1
+            self._latencies.append(elapsed_ms)
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def record_confirmation(self, status):
+        with self._lock:
+            self.confirmations[status] = self.confirmations.get(status, 0) + 1
+
+    def snapshot(self):
+        """Trả về dict thống kê (p50/p95 tính trên cửa sổ request gần nhất)"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            result = {
+                "total": self.total,
+                "by_status": dict(self.by_status),
+                "not_modified": self.not_modified,
+                "gzipped": self.gzipped,
+                "max_ms": round(self.max_ms, 3),
+                "confirmations": dict(self.confirmations),
+            }
+        if latencies:
+            result["p50_ms"] = round(latencies[len(latencies) // 2], 3)
+            result["p95_ms"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3)
+        return result
+
+    def prometheus(self, prefix="food_kiosk_payment"):
+        """Counter request theo status + xác nhận thanh toán (Prometheus text format)"""
+        with self._lock:
+            by_status = sorted(self.by_status.items())
+            confirmations = sorted(self.confirmations.items())
+        lines = [f"# TYPE {prefix}_http_requests_total counter"]
+        lines += [f'{prefix}_http_requests_total{{status="{status}"}} {n}' for status, n in by_status]
+        lines.append(f"# TYPE {prefix}_confirmations_total counter")
+        lines += [f'{prefix}_confirmations_total{{result="{status}"}} {n}' for status, n in confirmations]
+        return "\n".join(lines) + "\n"
+
+
+def make_payment_handler(app_ref, page, stats, tokens, metrics_provider=None):
+    """
+    Tạo lớp Handler có tham chiếu tới MainWindow, trang cache, bộ thống kê và bảng token.
+    metrics_provider: Hàm trả về text Prometheus cho GET /metrics (None = tắt endpoint).
+    """
+    class PaymentHTTPHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+        timeout = REQUEST_TIMEOUT
+
+        def log_message(self, format, *args):
+            pass  # Tắt log request
+
+        def _send_page(self, head_only=False):
+            """Gửi trang thành công (304 nếu ETag khớp, gzip nếu client hỗ trợ)"""
+            if self.headers.get("If-None-Match") == page.etag:
+                self.send_response(304)
+                self.send_header("ETag", page.etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return 304, False
+            use_gzip = "gzip" in (self.headers.get("Accept-Encoding") or "")
+            body = page.gzip_body if use_gzip else page.body
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", page.etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Vary", "Accept-Encoding")
+            if use_gzip:
+                self.send_header("Content-Encoding", "gzip")
+            self.end_headers()
+            if not head_only:
+                self.wfile.write(body)
+            return 200, use_gzip
+
+        def _send_not_found(self):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return 404, False
+
+        def _send_expired(self, head_only=False):
+            body = PAYMENT_EXPIRED_HTML
+            self.send_response(410)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if not head_only:
+                self.wfile.write(body)
+            return 410, False
+
+        def _send_metrics(self, head_only=False):
+            """Prometheus text format: metrics của app + thống kê request của server"""
+            body = (metrics_provider() + stats.prometheus()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            if not head_only:
+                self.wfile.write(body)
+            return 200, False
+
+        def _confirm(self, query, head_only):
+            """Xác nhận token trong URL; chỉ lần đầu mới gọi vào app"""
+            token = (query.get("t") or [None])[0]
+            method = (query.get("m") or ["vietqr"])[0]
+            if head_only:
+                # HEAD không được phép thay đổi trạng thái
+                return tokens.lookup(token) is not None if token else False
+            status, record = tokens.confirm(token, method)
+            if status == CONFIRM_INVALID:
+                return False
+            stats.record_confirmation(status)
+            if status == CONFIRM_NEW:
+                callback = record.get("on_confirm")
+                if callback is not None:
+                    callback(method, record["session_id"])
+                elif app_ref and getattr(app_ref, "ui_dispatcher", None):
+                    app_ref.ui_dispatcher.call(app_ref.on_payment_success_from_web, method, record["session_id"])
+            return True
+
+        def _handle(self, head_only=False):
+            started = time.perf_counter()
+            parsed = urlparse(self.path)
+            path = parsed.path
+            query = parse_qs(parsed.query)
+            if path == "/success":
+                if self._confirm(query, head_only):
+                    status, gzipped = self._send_page(head_only)
+                else:
+                    status, gzipped = self._send_expired(head_only)
+            elif path == "/":
+                status, gzipped = self._send_page(head_only)
+            elif path == "/metrics" and metrics_provider is not None:
+                status, gzipped = self._send_metrics(head_only)
+            else:
+                status, gzipped = self._send_not_found()
+            stats.record(status, (time.perf_counter() - started) * 1000, gzipped)
+
+        def do_GET(self):
+            self._handle()
+
+        def do_HEAD(self):
+            self._handle(head_only=True)
+
+    return PaymentHTTPHandler
+
+
+class PaymentHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer với thread request dạng daemon"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class PaymentServer:
+    """Quản lý vòng đời server thanh toán (start / stop khi app thoát)"""
+
+    def __init__(self, port=PAYMENT_SERVER_PORT, html_path=PAYMENT_HTML_PATH, metrics_provider=None):
+        self.port = port
+        self.metrics_provider = metrics_provider
+        self.page = CachedPage(html_path)
+        self.stats = RequestStats()
+        self.tokens = PaymentTokenTable()
+        self.url = None
+        self._httpd = None
+        self._thread = None
+
+    def start(self, app_ref):
+        """
+        Chạy server trên thread nền.
+
+        Returns:
+            str: URL trang thành công cho QR (None nếu không chạy được)
+        """
+        handler = make_payment_handler(app_ref, self.page, self.stats, self.tokens, self.metrics_provider)
+        self._httpd = PaymentHTTPServer(("0.0.0.0", self.port), handler)
+        self.url = f"http://{get_local_ip()}:{self.port}/success"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="payment-server", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self, timeout=2.0):
+        """Dừng nhận request mới, đóng socket và chờ thread server kết thúc"""
+        httpd, self._httpd = self._httpd, None
+        if httpd is None:
+            return
+        httpd.shutdown()
+        httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def is_running(self):
+        return self._httpd is not None
+
+    def session_url(self, session_id, method, on_confirm=None):
+        """URL cho QR của 1 phiên giao dịch: /success?t=<token>&m=<method>"""
+        token = self.tokens.issue(session_id, on_confirm)
+        return f"{self.url}?t={token}&m={method}"
@@ -0,0 +1,162 @@
+# remote_detector.py
+"""
+Client cho inference_server: dùng thay YOLOModelManager trong MainWindow
+khi config.INFERENCE_SERVER_URL được đặt (kiosk không cần load model).
+
+Kết quả trả về có cùng các thuộc tính mà app dùng từ kết quả YOLO:
+result.boxes (box.cls[0], box.conf[0], box.xyxy[0]), result.names, result.plot().
+"""
+import http.client
+import json
+import logging
+import threading
+from urllib.parse import urlparse
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Màu box khi vẽ (BGR), lặp theo class id
+_PLOT_COLORS = [(56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+                (10, 249, 72), (23, 204, 146), (134, 219, 61), (52, 147, 26), (187, 212, 0)]
+
+
+class RemoteBox:
+    """1 box detection (cùng dạng truy cập với box của ultralytics)"""
+
+    def __init__(self, det):
+        self.cls = np.array([det["class_id"]])
+        self.conf = np.array([det["confidence"]])
+        self.xyxy = np.array([det.get("box") or [0, 0, 0, 0]], dtype=np.float32)
+
+
+class RemoteResult:
+    """Kết quả detection từ server (thay cho ultralytics Results)"""
+
+    def __init__(self, image, detections, names):
+        self.orig_img = image
+        self.names = names
+        self.boxes = [RemoteBox(det) for det in detections]
+
+    def plot(self):
+        """Vẽ box + nhãn lên bản sao ảnh gốc (BGR)"""
+        img = self.orig_img.copy()
+        thickness = max(2, round(sum(img.shape[:2]) / 600))
+        for box in self.boxes:
+            cls_id = int(box.cls[0])
+            x1, y1, x2, y2 = (int(v) for v in box.xyxy[0])
+            color = _PLOT_COLORS[cls_id % len(_PLOT_COLORS)]
+            cv2.rectangle(img, (x1, y1), (x2, y2), color, thickness)
+            label = f"{self.names.get(cls_id, cls_id)} {float(box.conf[0]):.2f}"
+            (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)
+            top = max(y1, th + 6)
+            cv2.rectangle(img, (x1, top - th - 6), (x1 + tw + 4, top), color, -1)
+            cv2.putText(img, label, (x1 + 2, top - 4), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+        return img
+
+
+class RemoteDetector:
+    """Gửi ảnh tới inference server; cùng interface với YOLOModelManager"""
+
+    def __init__(self, server_url, timeout=10.0, jpeg_quality=90, show_errors=True, load=True):
+        """
+        Args:
+            server_url: URL server, ví dụ "http://192.168.1.10:8770"
+            timeout: Timeout mỗi request (giây)
+            jpeg_quality: Chất lượng JPEG khi gửi ảnh
+            show_errors: Hiện hộp thoại lỗi Tk khi không kết nối được server
+            load: False để kết nối sau bằng load_model()
+        """
+        parsed = urlparse(server_url)
+        self.model_path = server_url
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self.jpeg_quality = jpeg_quality
+        self.show_errors = show_errors
+        self._local = threading.local()  # 1 kết nối keep-alive cho mỗi thread
+        self._names = None
+        self.load_error = None
+        if load:
+            self.load_model()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _request(self, method, path, body=None, headers=None):
+        """Gửi request; thử lại 1 lần nếu kết nối keep-alive cũ đã bị server đóng"""
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+                return resp.status, json.loads(data.decode("utf-8")) if data else {}
+            except (http.client.HTTPException, ConnectionError, OSError):
+                conn.close()
+                self._local.conn = None
+                if attempt == 1:
+                    raise
+
+    def load_model(self):
+        """Lấy thông tin model (tên class) từ server"""
+        try:
+            status, info = self._request("GET", "/info")
+            if status != 200:
+                raise ConnectionError(f"HTTP {status}")
+            self._names = {int(k): v for k, v in info.get("names", {}).items()}
+            self.load_error = None
+            logger.info("✅ Inference server: %s (%s)", self.model_path, info.get("model"))
+            return True
+        except Exception as e:
+            self.load_error = e
+            logger.error("❌ Không kết nối được inference server %s: %s", self.model_path, e)
+            if self.show_errors:
+                from tkinter import messagebox
+                messagebox.showerror(
+                    "Lỗi Model",
+                    f"Không kết nối được inference server:\n{self.model_path}\n\n{e}"
+                )
+            return False
+
+    def detect(self, image, confidence=0.5):
+        """
+        Gửi ảnh lên server và nhận kết quả
+
+        Returns:
+            RemoteResult hoặc None nếu lỗi
+        """
+        if self._names is None and not self.load_model():
+            return None
+        ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return None
+        try:
+            status, payload = self._request(
+                "POST", f"/detect?conf={confidence}", body=buf.tobytes(),
+                headers={"Content-Type": "image/jpeg"}
+            )
+        except Exception as e:
+            logger.error("❌ Lỗi detection (server): %s", e)
+            return None
+        if status != 200:
+            logger.error("❌ Lỗi detection (server): %s", payload.get("error", status))
+            return None
+        return RemoteResult(image, payload.get("detections", []), self._names)
+
+    def detect_batch(self, images, confidence=0.5, imgsz=None):
+        """Gửi từng ảnh (server tự gom batch giữa các request đồng thời)"""
+        if not images:
+            return None
+        results = [self.detect(img, confidence) for img in images]
+        return None if any(r is None for r in results) else results
+
+    def get_class_names(self):
+        return dict(self._names or {})
+
+    def is_loaded(self):
+        return self._names is not None
@@ -0,0 +1,165 @@
+# replay.py
+"""
+Phát lại footage đã ghi (file video hoặc thư mục ảnh frame) qua đúng
+pipeline nhận diện liên tục của camera (MultiCameraManager ->
+DetectionScheduler dùng chung), không cần camera hay giao diện.
+
+- Load test lặp lại được cho đường live: `--speed 1` phát đúng tốc độ gốc
+  (frame bị bỏ khi model không theo kịp, như camera thật), `--speed 0`
+  nhanh hết mức và không bỏ frame nào.
+- Chạy lại footage hôm qua với model mới: mỗi frame 1 dòng JSON (camera,
+  frame_index, frame_ts theo đồng hồ video, detections), sắp theo
+  camera + frame nên diff được giữa 2 model.
+
+Cách dùng:
+    python replay.py counter_2026-10-18.mp4 -o old.jsonl
+    python replay.py counter_2026-10-18.mp4 --model new_best.pt -o new.jsonl
+    python replay.py left=rec/left.mp4 right=rec/right/ --fps 15 --speed 1 --summary load.json
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+import config
+from batch_scheduler import DetectionScheduler
+from food_core import YOLOModelManager
+from log_utils import setup_logging
+from multi_camera import MultiCameraManager, parse_camera_sources
+
+
+def parse_inputs(inputs, speed, fps):
+    """'id=path' hoặc 'path' -> cấu hình nguồn (id mặc định = tên file/thư mục)"""
+    entries = []
+    for item in inputs:
+        camera_id, sep, path = item.partition("=")
+        if not sep or os.path.exists(item):
+            camera_id, path = os.path.splitext(os.path.basename(os.path.normpath(item)))[0], item
+        entries.append({"id": camera_id, "source": path, "speed": speed, "fps": fps})
+    return parse_camera_sources(entries)
+
+
+def replay(manager, timeout=None):
+    """
+    Chạy manager tới khi mọi nguồn phát xong và detect hết
+
+    Returns:
+        (records, elapsed_s): records = list dict mỗi frame, sắp theo (camera, frame_index)
+    """
+    records = []
+    lock = threading.Lock()
+
+    def on_result(camera_id, entry):
+        record = {
+            "camera": camera_id,
+            "frame_index": entry["frame_index"],
+            "frame_ts": round(entry["frame_ts"], 4),
+            "latency_ms": round((time.perf_counter() - entry["captured_at"]) * 1000, 2),
+            "detections": entry["detections"],
+        }
+        with lock:
+            records.append(record)
+
+    manager.on_result = on_result
+    started = time.perf_counter()
+    manager.start()
+    try:
+        while not manager.finished():
+            if timeout and time.perf_counter() - started > timeout:
+                break
+            time.sleep(0.05)
+    finally:
+        manager.stop()
+    elapsed = time.perf_counter() - started
+    records.sort(key=lambda r: (r["camera"], r["frame_index"]))
+    return records, elapsed
+
+
+def summarize(records, stats, elapsed):
+    """Tổng hợp theo camera: số frame, FPS, latency, số món theo class"""
+    cameras = {}
+    for camera_id, s in stats.items():
+        rows = [r for r in records if r["camera"] == camera_id]
+        latency = sorted(r["latency_ms"] for r in rows)
+        classes = Counter(det["name"] for r in rows for det in r["detections"])
+        cameras[camera_id] = {
+            "frames_captured": s["captured"],
+            "frames_detected": len(rows),
+            "frames_skipped": s["skipped"],
+            "detect_fps": round(len(rows) / elapsed, 2) if elapsed > 0 else None,
+            "latency_ms_p50": latency[len(latency) // 2] if latency else None,
+            "latency_ms_p95": latency[min(len(latency) - 1, int(len(latency) * 0.95))] if latency else None,
+            "detections": sum(classes.values()),
+            "classes": dict(classes.most_common()),
+        }
+    return cameras
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Phát lại footage qua pipeline nhận diện camera (headless)")
+    parser.add_argument("inputs", nargs="+", help="File video / thư mục frame, dạng 'path' hoặc 'id=path'")
+    parser.add_argument("-o", "--output", default="-", help="File .jsonl kết quả từng frame ('-' = stdout)")
+    parser.add_argument("--summary", help="Ghi tổng hợp JSON (FPS, latency, số món theo camera)")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="Số lần tốc độ gốc (1 = thời gian thực, 0 = nhanh hết mức, không bỏ frame)")
+    parser.add_argument("--fps", type=float, default=None, help="FPS gốc cho thư mục frame / video thiếu FPS")
+    parser.add_argument("--model", default=config.MODEL_PATH, help="Đường dẫn model .pt")
+    parser.add_argument("--server", default=None, help="Dùng inference server thay cho model local")
+    parser.add_argument("--conf", type=float, default=config.DEFAULT_CONFIDENCE, help="Ngưỡng confidence")
+    parser.add_argument("--timeout", type=float, default=None, help="Dừng sau N giây")
+    args = parser.parse_args(argv)
+
+    # Log ra stderr để stdout chỉ có JSON
+    setup_logging(log_file="")
+    if args.server:
+        from remote_detector import RemoteDetector
+        model_manager = RemoteDetector(args.server, show_errors=False)
+    else:
+        model_manager = YOLOModelManager(args.model)
+    if not model_manager.is_loaded():
+        print(f"❌ Không load được model: {model_manager.model_path}", file=sys.stderr)
+        return 2
+
+    sources = parse_inputs(args.inputs, args.speed, args.fps)
+    scheduler = DetectionScheduler(model_manager)
+    manager = MultiCameraManager(sources, scheduler, confidence=lambda: args.conf, live_detect=True)
+    try:
+        records, elapsed = replay(manager, args.timeout)
+    finally:
+        scheduler.stop()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    cameras = summarize(records, manager.stats(), elapsed)
+    for camera_id, s in cameras.items():
+        print(f"🎞️ {camera_id}: {s['frames_detected']}/{s['frames_captured']} frame, "
+              f"{s['detect_fps'] or 0:.1f} FPS, p95 {s['latency_ms_p95'] or 0:.0f} ms, "
+              f"{s['detections']} món", file=sys.stderr)
+    print(f"✅ {len(records)} frame trong {elapsed:.1f}s (speed {args.speed:g})", file=sys.stderr)
+
+    if args.summary:
+        report = {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "model": model_manager.model_path,
+            "speed": args.speed,
+            "confidence": args.conf,
+            "elapsed_s": round(elapsed, 3),
+            "cameras": cameras,
+        }
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
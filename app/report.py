@@ -0,0 +1,285 @@
+# report.py
+"""
+Báo cáo cuối ngày: doanh thu, món bán chạy, calo, độ tin cậy detection.
+
+Đọc lần lượt từng dòng của invoice store (invoices.jsonl) và detection log
+(detections.jsonl), cộng dồn vào các bộ đếm nhỏ nên không bao giờ nạp toàn
+bộ dữ liệu vào bộ nhớ. Dòng ngoài khoảng ngày được lọc theo timestamp
+trước khi parse JSON.
+
+Cách dùng:
+    python report.py                              # Toàn bộ dữ liệu
+    python report.py --since 2026-01-01 --until 2026-02-01
+    python report.py --today --json > report.json
+"""
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import date
+
+import config
+from food_core import load_food_data, normalize_food_key
+
+_TS_MARKER = '"timestamp":"'
+
+
+def _line_timestamp(line):
+    """Lấy nhanh timestamp trong dòng JSON (không parse cả dòng). Trả về None nếu không thấy."""
+    pos = line.find(_TS_MARKER)
+    if pos < 0:
+        return None
+    start = pos + len(_TS_MARKER)
+    return line[start:start + 19]
+
+
+def _in_range(day, since, until):
+    return (not since or day >= since) and (not until or day < until)
+
+
+def iter_jsonl(path, since=None, until=None):
+    """
+    Duyệt các record trong file JSON Lines, lọc theo ngày (YYYY-MM-DD).
+    Với file .json cũ (mảng JSON, ví dụ detection_history.json) thì đọc cả mảng.
+    """
+    if not path or not os.path.exists(path):
+        return
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                records = json.load(f)
+            except json.JSONDecodeError:
+                return
+        for record in records:
+            if _in_range(record.get("timestamp", "")[:10], since, until):
+                yield record
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if since or until:
+                ts = _line_timestamp(line)
+                if ts is not None and not _in_range(ts[:10], since, until):
+                    continue
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Dòng ghi dở
+            if _in_range(record.get("timestamp", "")[:10], since, until):
+                yield record
+
+
+def _new_item_stats():
+    return {
+        "charged_qty": 0, "detected_qty": 0, "revenue": 0, "calories": 0,
+        "added": 0, "removed": 0, "excluded_lines": 0,
+        "detections": 0, "sum_conf": 0.0,
+    }
+
+
+class SalesReport:
+    """Bộ cộng dồn số liệu báo cáo (thêm từng record một)"""
+
+    def __init__(self, food_data):
+        self.food_data = food_data
+        self._key_cache = {}
+        self.by_day = defaultdict(lambda: {"invoices": 0, "revenue": 0, "items": 0, "calories": 0})
+        self.by_hour = defaultdict(lambda: {"invoices": 0, "revenue": 0})
+        self.by_method = defaultdict(lambda: {"invoices": 0, "revenue": 0})
+        self.items = defaultdict(_new_item_stats)
+        self.invoices = 0
+        self.invoices_with_discrepancy = 0
+        self.detection_records = 0
+        self.detections = 0
+        self.sum_conf = 0.0
+
+    def food_key(self, name):
+        """Chuẩn hóa tên class -> key food_36.json (mỗi tên chỉ chuẩn hóa 1 lần)"""
+        key = self._key_cache.get(name)
+        if key is None:
+            key = self._key_cache[name] = normalize_food_key(name, self.food_data)
+        return key
+
+    def add_invoice(self, invoice):
+        ts = invoice.get("timestamp", "")
+        day, hour = ts[:10], ts[11:13]
+        total = invoice.get("total_price", 0)
+        self.invoices += 1
+
+        d = self.by_day[day]
+        d["invoices"] += 1
+        d["revenue"] += total
+        d["items"] += invoice.get("total_items", 0)
+        d["calories"] += invoice.get("total_calories", 0)
+        h = self.by_hour[hour]
+        h["invoices"] += 1
+        h["revenue"] += total
+        m = self.by_method[invoice.get("payment_method") or "?"]
+        m["invoices"] += 1
+        m["revenue"] += total
+
+        discrepancy = False
+        for line in invoice.get("items", []):
+            stats = self.items[line.get("key")]
+            qty = line.get("quantity", 0)
+            detected = line.get("detected_qty", 0)
+            stats["charged_qty"] += qty
+            stats["detected_qty"] += detected
+            stats["revenue"] += line.get("line_total", 0)
+            stats["calories"] += line.get("calories", 0) * qty
+            if line.get("excluded"):
+                stats["excluded_lines"] += 1
+            if qty > detected:
+                stats["added"] += qty - detected
+                discrepancy = True
+            elif qty < detected:
+                stats["removed"] += detected - qty
+                discrepancy = True
+        if discrepancy:
+            self.invoices_with_discrepancy += 1
+
+    def add_detection_record(self, record):
+        self.detection_records += 1
+        for det in record.get("items", []):
+            conf = float(det.get("confidence", 0))
+            stats = self.items[self.food_key(det.get("name", ""))]
+            stats["detections"] += 1
+            stats["sum_conf"] += conf
+            self.detections += 1
+            self.sum_conf += conf
+
+    def summary(self):
+        """Kết quả báo cáo dạng dict (sẵn sàng để dump JSON)"""
+        items = {}
+        for key, s in self.items.items():
+            items[key] = {
+                "name": self.food_data.get(key, {}).get("name_vi", key),
+                "charged_qty": s["charged_qty"],
+                "detected_qty": s["detected_qty"],
+                "revenue": s["revenue"],
+                "calories": s["calories"],
+                "added": s["added"],
+                "removed": s["removed"],
+                "excluded_lines": s["excluded_lines"],
+                "detections": s["detections"],
+                "avg_conf": round(s["sum_conf"] / s["detections"], 4) if s["detections"] else None,
+            }
+        revenue = sum(d["revenue"] for d in self.by_day.values())
+        detected = sum(s["detected_qty"] for s in self.items.values())
+        charged = sum(s["charged_qty"] for s in self.items.values())
+        return {
+            "invoices": self.invoices,
+            "revenue": revenue,
+            "by_day": dict(sorted(self.by_day.items())),
+            "by_hour": dict(sorted(self.by_hour.items())),
+            "by_payment_method": dict(self.by_method),
+            "items": dict(sorted(items.items(), key=lambda kv: -kv[1]["charged_qty"])),
+            "discrepancy": {
+                "detected_qty": detected,
+                "charged_qty": charged,
+                "added": sum(s["added"] for s in self.items.values()),
+                "removed": sum(s["removed"] for s in self.items.values()),
+                "invoices_with_discrepancy": self.invoices_with_discrepancy,
+                "invoice_ratio": round(self.invoices_with_discrepancy / self.invoices, 4) if self.invoices else 0.0,
+            },
+            "detection": {
+                "records": self.detection_records,
+                "detections": self.detections,
+                "avg_conf": round(self.sum_conf / self.detections, 4) if self.detections else None,
+            },
+        }
+
+
+def build_report(invoice_path, detection_path, food_data, since=None, until=None):
+    """Chạy báo cáo trên 2 nguồn dữ liệu, trả về summary dict"""
+    report = SalesReport(food_data)
+    for invoice in iter_jsonl(invoice_path, since, until):
+        report.add_invoice(invoice)
+    for record in iter_jsonl(detection_path, since, until):
+        report.add_detection_record(record)
+    return report.summary()
+
+
+def format_report(summary):
+    """Báo cáo dạng text cho terminal"""
+    lines = []
+    lines.append("=" * 60)
+    lines.append("📊 BÁO CÁO DOANH THU & DINH DƯỠNG")
+    lines.append("=" * 60)
+    lines.append(f"Số hóa đơn: {summary['invoices']:,}    Doanh thu: {summary['revenue']:,}đ")
+
+    lines.append("")
+    lines.append("📅 Theo ngày")
+    lines.append(f"{'Ngày':<12} {'HĐ':>6} {'Phần':>7} {'Doanh thu':>14} {'Calo':>12}")
+    for day, d in summary["by_day"].items():
+        lines.append(f"{day:<12} {d['invoices']:>6,} {d['items']:>7,} {d['revenue']:>13,}đ {d['calories']:>12,}")
+
+    lines.append("")
+    lines.append("🕐 Theo giờ")
+    for hour, h in summary["by_hour"].items():
+        lines.append(f"  {hour}h  {h['invoices']:>6,} HĐ  {h['revenue']:>13,}đ")
+
+    lines.append("")
+    lines.append("💳 Theo phương thức")
+    for method, m in summary["by_payment_method"].items():
+        lines.append(f"  {method:<12} {m['invoices']:>6,} HĐ  {m['revenue']:>13,}đ")
+
+    lines.append("")
+    lines.append("🍜 Theo món")
+    lines.append(f"{'Món':<22} {'Bán':>6} {'Detect':>7} {'+':>5} {'-':>5} {'Doanh thu':>14} {'Conf':>6}")
+    for key, s in summary["items"].items():
+        conf = f"{s['avg_conf']:.2f}" if s["avg_conf"] is not None else "-"
+        name = str(s["name"])[:21]
+        lines.append(
+            f"{name:<22} {s['charged_qty']:>6,} {s['detected_qty']:>7,} {s['added']:>5,} "
+            f"{s['removed']:>5,} {s['revenue']:>13,}đ {conf:>6}"
+        )
+
+    disc = summary["discrepancy"]
+    det = summary["detection"]
+    lines.append("")
+    lines.append("🔍 Detect vs tính tiền")
+    lines.append(f"  Detect: {disc['detected_qty']:,} phần, tính tiền: {disc['charged_qty']:,} phần "
+                 f"(+{disc['added']:,} / -{disc['removed']:,})")
+    lines.append(f"  Hóa đơn bị chỉnh: {disc['invoices_with_discrepancy']:,} ({disc['invoice_ratio']:.1%})")
+    avg_conf = f"{det['avg_conf']:.3f}" if det["avg_conf"] is not None else "-"
+    lines.append(f"  Detection log: {det['records']:,} lần, {det['detections']:,} món, conf TB {avg_conf}")
+    lines.append("=" * 60)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Báo cáo doanh thu / dinh dưỡng từ invoice store và detection log")
+    parser.add_argument("--invoices", default=config.INVOICE_STORE_FILE, help="File invoices.jsonl")
+    parser.add_argument("--detections", default=config.DETECTION_LOG_FILE,
+                        help="File detection log (.jsonl) hoặc detection_history.json cũ")
+    parser.add_argument("--food-data", default=config.FOOD_DATA_FILE, help="File food_36.json")
+    parser.add_argument("--since", help="Từ ngày (YYYY-MM-DD, bao gồm)")
+    parser.add_argument("--until", help="Đến ngày (YYYY-MM-DD, không bao gồm)")
+    parser.add_argument("--today", action="store_true", help="Chỉ ngày hôm nay")
+    parser.add_argument("--json", action="store_true", help="Xuất JSON thay vì text")
+    args = parser.parse_args(argv)
+
+    since, until = args.since, args.until
+    if args.today:
+        since, until = date.today().isoformat(), None
+
+    food_data = load_food_data(args.food_data)
+
+    start = time.perf_counter()
+    summary = build_report(args.invoices, args.detections, food_data, since, until)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(summary))
+        print(f"⏱️ {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,10 @@ Màn hình hiển thị kết quả detection với biểu đồ dinh dưỡng
 """
 from tkinter import *
 from tkinter import ttk, filedialog, messagebox
-import json
 import config
 import math
-from datetime import datetime
+from chart_cache import get_chart_cache
+from invoice_engine import get_invoice_engine
 import os
 
 class ResultScreen:
@@ -225,7 +225,8 @@ class ResultScreen:
                     food_info.get('protein', 0),
                     food_info.get('carbs', 0),
                     food_info.get('fat', 0),
-                    size=90
+                    size=90,
+                    food_key=self.normalize_food_key(detection['name'])
                 )
 
             for c in range(max_cols):
@@ -299,9 +300,9 @@ class ResultScreen:
         # Cập nhật width của scrollable_frame để khớp với canvas width
         self.canvas.itemconfig(self.canvas_window, width=event.width)
     
-    def draw_nutrition_chart(self, parent, protein, carbs, fat, size=200):
+    def draw_nutrition_chart(self, parent, protein, carbs, fat, size=200, food_key=None):
         """
-        Vẽ biểu đồ tròn dinh dưỡng
+        Vẽ biểu đồ tròn dinh dưỡng (lấy ảnh từ cache theo (food_key, size) nếu có PIL)
         
         Args:
             parent: Frame chứa biểu đồ
@@ -309,7 +310,14 @@ class ResultScreen:
             carbs: Lượng carbs (g)
             fat: Lượng chất béo (g)
             size: Kích thước biểu đồ (default 200px)
+            food_key: Key món ăn dùng làm khóa cache
         """
+        cache_key = food_key if food_key is not None else f"{protein}/{carbs}/{fat}"
+        photo = get_chart_cache("card").get_photo(cache_key, size, protein, carbs, fat)
+        if photo is not None:
+            Label(parent, image=photo, bg=config.COLORS['bg_medium'], bd=0).pack()
+            return
+        
         canvas = Canvas(parent, width=size, height=size, bg=config.COLORS['bg_medium'], highlightthickness=0)
         canvas.pack()
         
@@ -531,111 +539,14 @@ class ResultScreen:
         return methods.get(method, 'Không xác định')
     
     def generate_invoice(self, payment_method):
-        """Xuất hóa đơn và lưu vào file"""
-        # Tạo nội dung hóa đơn
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        invoice_content = self.create_invoice_content(payment_method, timestamp)
-        
-        # Tạo thư mục invoices nếu chưa có
-        invoice_dir = "invoices"
-        os.makedirs(invoice_dir, exist_ok=True)
-        
-        # Lưu hóa đơn dưới dạng text
-        invoice_file = os.path.join(invoice_dir, f"invoice_{timestamp}.txt")
-        with open(invoice_file, 'w', encoding='utf-8') as f:
-            f.write(invoice_content)
-        
-        # Cũng lưu thông tin vào JSON để lưu lịch sử
-        self.save_invoice_history(timestamp, payment_method)
-    
-    def create_invoice_content(self, payment_method, timestamp):
-        """Tạo nội dung hóa đơn"""
-        invoice_lines = []
-        
-        # Header
-        invoice_lines.append("=" * 50)
-        invoice_lines.append("        🍕 HÓA ĐƠN THANH TOÁN 🍕")
-        invoice_lines.append("=" * 50)
-        invoice_lines.append("")
-        
-        # Thông tin hóa đơn
-        date_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        invoice_lines.append(f"Ngày: {date_time}")
-        invoice_lines.append(f"Mã HĐ: INV_{timestamp}")
-        invoice_lines.append("")
-        
-        # Chi tiết các món ăn
-        invoice_lines.append("-" * 50)
-        invoice_lines.append(f"{'Tên Món':<30} {'Giá':>10} {'kcal':>8}")
-        invoice_lines.append("-" * 50)
-        
-        for detection in self.detections:
-            food_info = self.get_food_info(detection)
-            name = (food_info.get('name_vi') or detection['name'])[:28]
-            price = food_info.get('price', 0)
-            calories = food_info.get('calories', 0)
-            invoice_lines.append(f"{name:<30} {price:>9,}đ {calories:>7} kcal")
-        
-        invoice_lines.append("-" * 50)
-        
-        # Tổng kết
-        invoice_lines.append("")
-        invoice_lines.append("📋 TỔNG KẾT:")
-        invoice_lines.append(f"  • Số lượng: {len(self.detections)} món")
-        invoice_lines.append(f"  • Tổng calories: {self.total_calories:,} kcal")
-        invoice_lines.append("")
-        invoice_lines.append(f"💰 TỔNG TIỀN: {self.total_price:,} VND")
-        invoice_lines.append("")
-        
-        # Phương thức thanh toán
-        invoice_lines.append(f"Phương thức: {self.get_method_name(payment_method)}")
-        invoice_lines.append("")
-        
-        # Footer
-        invoice_lines.append("=" * 50)
-        invoice_lines.append("      Cảm ơn quý khách! Hẹn gặp lại 🎉")
-        invoice_lines.append("=" * 50)
-        
-        return "\n".join(invoice_lines)
-    
-    def save_invoice_history(self, timestamp, payment_method):
-        """Lưu thông tin hóa đơn vào file JSON"""
-        history_file = "invoice_history.json"
-        
-        invoice_record = {
-            "invoice_id": f"INV_{timestamp}",
-            "timestamp": timestamp,
-            "datetime": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-            "items": [
-                {
-                    "name": self.get_food_info(d).get('name_vi', d['name']),
-                    "price": self.get_food_info(d).get('price', 0),
-                    "calories": self.get_food_info(d).get('calories', 0),
-                    "confidence": d['confidence'],
-                }
-                for d in self.detections
-            ],
-            "total_items": len(self.detections),
-            "total_price": self.total_price,
-            "total_calories": self.total_calories,
-            "payment_method": self.get_method_name(payment_method)
-        }
-        
-        # Đọc lịch sử cũ
-        history = []
-        if os.path.exists(history_file):
-            try:
-                with open(history_file, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-            except:
-                history = []
-        
-        # Thêm hóa đơn mới
-        history.append(invoice_record)
-        
-        # Lưu lại
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+        """Ghi hóa đơn vào invoice store và xuất bản text vào thư mục invoices/"""
+        engine = get_invoice_engine()
+        invoice = engine.build_invoice(
+            None, self.detections, self.get_method_name(payment_method),
+            food_data=self.food_data, normalize_func=self.normalize_food_key
+        )
+        engine.save(invoice)
+        return engine.export(invoice, os.path.join("invoices", f"invoice_{invoice['invoice_id'][len('INV_'):]}.txt"))
     
     def close(self):
         """Đóng màn hình kết quả"""
@@ -0,0 +1,250 @@
+# session_images.py
+"""
+Ảnh của phiên upload, giữ trong giới hạn bộ nhớ.
+
+Trước đây mỗi ảnh upload giữ mảng gốc, ảnh đã vẽ box đủ độ phân giải và
+cả object kết quả của ultralytics (giữ lại ảnh gốc + tensor), nên vài
+trăm ảnh lớn tốn nhiều GB. SessionImageStore giữ mỗi ảnh dưới dạng:
+
+- preview: JPEG thu nhỏ (cạnh dài SESSION_PREVIEW_MAX_SIDE) trong bộ nhớ
+- detections: CompactDetections (vài mảng numpy nhỏ)
+- ảnh đã vẽ box: vẽ lại từ preview + detections khi hiển thị
+- ảnh gốc (cần cho detect): cache LRU trong ngân sách SESSION_IMAGE_BUDGET_MB;
+  ảnh bị đẩy ra được đọc lại từ file khi cần
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import config
+from image_utils import decode_image, load_image
+from metrics import get_metrics
+from remote_detector import RemoteResult
+
+logger = logging.getLogger(__name__)
+
+
+class CompactDetections:
+    """Detection của 1 ảnh dạng mảng: boxes (n, 4) float32, class_ids int16, confidences float32"""
+
+    __slots__ = ("boxes", "class_ids", "confidences", "names")
+
+    def __init__(self, boxes, class_ids, confidences, names):
+        self.boxes = boxes
+        self.class_ids = class_ids
+        self.confidences = confidences
+        self.names = names  # {class_id: name} của model, dùng chung giữa các ảnh
+
+    @classmethod
+    def from_detections(cls, detections, names):
+        """Từ list của extract_detections()"""
+        return cls(
+            np.array([det["box"] for det in detections], dtype=np.float32).reshape(-1, 4),
+            np.array([det["class_id"] for det in detections], dtype=np.int16),
+            np.array([det["confidence"] for det in detections], dtype=np.float32),
+            names,
+        )
+
+    def to_list(self, scale=1.0):
+        """Về dạng list của extract_detections() (box nhân với scale)"""
+        return [{
+            "name": self.names[int(cls_id)],
+            "class_id": int(cls_id),
+            "confidence": round(float(conf), 4),
+            "box": [round(float(v) * scale, 1) for v in box],
+        } for box, cls_id, conf in zip(self.boxes, self.class_ids, self.confidences)]
+
+    @property
+    def nbytes(self):
+        return self.boxes.nbytes + self.class_ids.nbytes + self.confidences.nbytes
+
+    def __len__(self):
+        return len(self.class_ids)
+
+
+class SessionImage:
+    """1 ảnh upload: đường dẫn, preview JPEG, detections (None nếu chưa detect)"""
+
+    __slots__ = ("key", "path", "shape", "preview", "preview_scale", "detections", "reloadable", "_store")
+
+    def __init__(self, store, key, path, shape, preview, preview_scale, reloadable):
+        self._store = store
+        self.key = key
+        self.path = path
+        self.shape = shape
+        self.preview = preview
+        self.preview_scale = preview_scale
+        self.detections = None
+        self.reloadable = reloadable
+
+    @property
+    def image(self):
+        """Ảnh gốc (BGR) để detect: lấy từ cache hoặc đọc lại từ file; None nếu không đọc được"""
+        return self._store.image(self)
+
+    @property
+    def is_detected(self):
+        return self.detections is not None
+
+
+class SessionImageStore:
+    """Danh sách ảnh của phiên (dùng như list) với ngân sách bộ nhớ + LRU cho ảnh gốc"""
+
+    def __init__(self, budget_mb=None, preview_side=None, jpeg_quality=None):
+        self.budget = int((budget_mb or config.SESSION_IMAGE_BUDGET_MB) * 1024 * 1024)
+        self.preview_side = preview_side or config.SESSION_PREVIEW_MAX_SIDE
+        self.jpeg_quality = jpeg_quality or config.SESSION_PREVIEW_JPEG_QUALITY
+        self._lock = threading.Lock()
+        self._entries = []
+        self._cache = OrderedDict()  # key -> ảnh gốc, cũ nhất trước
+        self._cache_bytes = 0
+        self._next_key = 0
+        self.evictions = 0
+        self.reloads = 0
+
+    # ---- list-like ----
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        return self._entries[index]
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+            self._cache.clear()
+            self._cache_bytes = 0
+        self._update_gauge()
+
+    # ---- thêm / cập nhật ----
+    def make_preview(self, image):
+        """
+        Preview JPEG thu nhỏ của ảnh (không đụng tới store, gọi được từ thread decode)
+
+        Returns:
+            (preview_bytes, scale): bytes JPEG (b"" nếu lỗi) và tỉ lệ preview / ảnh gốc
+        """
+        h, w = image.shape[:2]
+        scale = min(1.0, self.preview_side / max(h, w))
+        small = image if scale == 1.0 else cv2.resize(
+            image, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return (buf.tobytes() if ok else b""), scale
+
+    def add(self, path, image, preview=None):
+        """
+        Thêm ảnh đã decode, giữ ảnh gốc trong cache (trong ngân sách)
+
+        Args:
+            preview: (preview_bytes, scale) từ make_preview() đã tạo sẵn ngoài Tk thread;
+                None thì tạo tại đây
+        """
+        h, w = image.shape[:2]
+        preview, scale = preview or self.make_preview(image)
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            entry = SessionImage(self, key, path, (h, w), preview, scale, os.path.isfile(path))
+            self._entries.append(entry)
+            self._cache_put(key, image)
+            self._evict()
+        self._update_gauge()
+        return entry
+
+    def set_detections(self, entry, detections):
+        """Gán CompactDetections cho ảnh sau khi detect"""
+        entry.detections = detections
+        self._update_gauge()
+
+    # ---- đọc ----
+    def image(self, entry):
+        """Ảnh gốc của entry (cache hoặc đọc lại từ file)"""
+        with self._lock:
+            image = self._cache.get(entry.key)
+            if image is not None:
+                self._cache.move_to_end(entry.key)
+                return image
+        if not entry.reloadable:
+            return None
+        image = load_image(entry.path, config.DECODE_MAX_SIDE)
+        if image is None:
+            return None
+        if image.shape[:2] != entry.shape:
+            # Decode thu nhỏ khác lần đầu (đổi config): đưa về kích thước cũ để box khớp
+            image = cv2.resize(image, (entry.shape[1], entry.shape[0]))
+        with self._lock:
+            self.reloads += 1
+            if entry in self._entries:
+                self._cache_put(entry.key, image)
+                self._evict(keep=entry.key)
+        self._update_gauge()
+        return image
+
+    def view(self, entry):
+        """Ảnh để hiển thị: preview, vẽ box nếu đã detect (vẽ lại mỗi lần, không lưu)"""
+        image, _ = decode_image(entry.preview)
+        if image is None:
+            image = self.image(entry)
+            scale = 1.0
+        else:
+            scale = entry.preview_scale
+        if entry.detections is None or image is None:
+            return image
+        with get_metrics().timer("annotate"):
+            return RemoteResult(image, entry.detections.to_list(scale), entry.detections.names).plot()
+
+    # ---- bộ nhớ ----
+    def memory(self):
+        """Số byte đang dùng theo loại và ngân sách"""
+        with self._lock:
+            entries = list(self._entries)
+            cache_bytes = self._cache_bytes
+            cached = len(self._cache)
+        preview_bytes = sum(len(e.preview) for e in entries)
+        detection_bytes = sum(e.detections.nbytes for e in entries if e.detections is not None)
+        return {
+            "images": len(entries),
+            "cached_originals": cached,
+            "original_bytes": cache_bytes,
+            "preview_bytes": preview_bytes,
+            "detection_bytes": detection_bytes,
+            "total_bytes": cache_bytes + preview_bytes + detection_bytes,
+            "budget_bytes": self.budget,
+            "evictions": self.evictions,
+            "reloads": self.reloads,
+        }
+
+    def memory_text(self):
+        """Chuỗi ngắn cho thanh trạng thái"""
+        m = self.memory()
+        return (f"🧠 {m['total_bytes'] / 2**20:.0f}/{self.budget / 2**20:.0f} MB "
+                f"({m['cached_originals']}/{m['images']} ảnh gốc trong RAM)")
+
+    def _cache_put(self, key, image):
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self._cache_bytes -= old.nbytes
+        self._cache[key] = image
+        self._cache_bytes += image.nbytes
+
+    def _evict(self, keep=None):
+        """Đẩy ảnh gốc ít dùng nhất ra tới khi vừa ngân sách (chỉ ảnh đọc lại được từ file)"""
+        fixed = sum(len(e.preview) for e in self._entries)
+        reloadable = {e.key for e in self._entries if e.reloadable}
+        for key in list(self._cache):
+            if self._cache_bytes + fixed <= self.budget:
+                break
+            if key == keep or key not in reloadable:
+                continue
+            self._cache_bytes -= self._cache.pop(key).nbytes
+            self.evictions += 1
+
+    def _update_gauge(self):
+        get_metrics().set_gauge("session_image_bytes", self.memory()["total_bytes"])
@@ -0,0 +1,163 @@
+# ui_dispatcher.py
+"""
+Bộ điều phối cập nhật UI an toàn giữa các thread.
+
+Worker thread không đụng vào widget hay state của Tk mà chỉ post event
+vào queue. Một vòng pump duy nhất chạy trên Tk thread (root.after) lấy
+event ra theo từng frame, gộp các event cùng loại và áp dụng với một
+ngân sách thời gian giới hạn cho mỗi tick.
+"""
+import logging
+import queue
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Các loại event
+EVENT_PROGRESS = "progress"          # Text màn hình loading {"message", "progress"} - chỉ giữ bản mới nhất
+EVENT_STATUS = "status"              # Text thanh trạng thái - chỉ giữ bản mới nhất
+EVENT_HISTORY = "history"            # (detections, source) - gom lại, ghi lịch sử 1 lần mỗi tick
+EVENT_IMAGE_RESULT = "image_result"  # Kết quả detect của 1 ảnh
+EVENT_DETECTION_DONE = "detection_done"
+EVENT_DETECTION_ERROR = "detection_error"
+EVENT_CALL = "call"                  # (func, args) - gọi hàm bất kỳ trên Tk thread
+
+# Cách gộp event
+COALESCE_LATEST = "latest"   # Chỉ giữ payload cuối cùng (dict thì merge theo key)
+COALESCE_BATCH = "batch"     # Gộp mọi payload thành list, gọi handler 1 lần
+
+UIEvent = namedtuple("UIEvent", ["kind", "payload"])
+
+
+class UIDispatcher:
+    """Queue event từ worker + pump trên Tk thread"""
+
+    def __init__(self, root, interval_ms=16, budget_ms=8, max_events_per_tick=500):
+        """
+        Args:
+            root: Tk root
+            interval_ms: Chu kỳ pump (~1 frame)
+            budget_ms: Thời gian tối đa dành cho xử lý event mỗi tick
+            max_events_per_tick: Số event tối đa lấy ra khỏi queue mỗi tick
+        """
+        self.root = root
+        self.interval_ms = interval_ms
+        self.budget_ms = budget_ms
+        self.max_events_per_tick = max_events_per_tick
+        self._queue = queue.Queue()
+        self._handlers = {}
+        self._coalesce = {}
+        self._running = False
+        self._after_id = None
+        self.dispatched = 0
+        self.coalesced = 0
+
+    def register(self, kind, handler, coalesce=None):
+        """
+        Đăng ký handler cho một loại event.
+
+        Args:
+            kind: Loại event (EVENT_*)
+            handler: Hàm nhận payload (với COALESCE_BATCH là list payload)
+            coalesce: None, COALESCE_LATEST hoặc COALESCE_BATCH
+        """
+        self._handlers[kind] = handler
+        self._coalesce[kind] = coalesce
+
+    def post(self, kind, payload=None):
+        """Gửi event (an toàn khi gọi từ bất kỳ thread nào)"""
+        self._queue.put(UIEvent(kind, payload))
+
+    def call(self, func, *args):
+        """Gọi func(*args) trên Tk thread ở tick kế tiếp"""
+        self.post(EVENT_CALL, (func, args))
+
+    def queue_depth(self):
+        """Số event đang chờ xử lý"""
+        return self._queue.qsize()
+
+    def start(self):
+        """Bắt đầu vòng pump"""
+        if not self._running:
+            self._running = True
+            self._after_id = self.root.after(self.interval_ms, self._pump)
+
+    def stop(self):
+        """Dừng vòng pump"""
+        self._running = False
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def _collect(self):
+        """
+        Lấy event ra khỏi queue trong giới hạn số lượng / thời gian.
+
+        Returns:
+            (latest, batches, ordered): event gộp theo loại và event giữ thứ tự
+        """
+        deadline = time.perf_counter() + self.budget_ms / 1000.0
+        latest = {}
+        batches = {}
+        ordered = []
+        for _ in range(self.max_events_per_tick):
+            if time.perf_counter() > deadline:
+                break
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            mode = self._coalesce.get(event.kind)
+            if mode == COALESCE_LATEST:
+                if event.kind in latest:
+                    self.coalesced += 1
+                    prev = latest[event.kind]
+                    if isinstance(prev, dict) and isinstance(event.payload, dict):
+                        merged = dict(prev)
+                        merged.update(event.payload)
+                        latest[event.kind] = merged
+                        continue
+                latest[event.kind] = event.payload
+            elif mode == COALESCE_BATCH:
+                batches.setdefault(event.kind, []).append(event.payload)
+            else:
+                ordered.append(event)
+        return latest, batches, ordered
+
+    def _dispatch(self, kind, payload):
+        if kind == EVENT_CALL:
+            func, args = payload
+            func(*args)
+        else:
+            handler = self._handlers.get(kind)
+            if handler is None:
+                logger.warning("⚠️ Không có handler cho event %r", kind)
+                return
+            handler(payload)
+        self.dispatched += 1
+
+    def pump_once(self):
+        """Xử lý 1 tick: event gộp trước (progress/status/history), sau đó event theo thứ tự"""
+        latest, batches, ordered = self._collect()
+        for kind, payload in latest.items():
+            self._run(kind, payload)
+        for kind, payloads in batches.items():
+            self._run(kind, payloads)
+        for event in ordered:
+            self._run(event.kind, event.payload)
+
+    def _run(self, kind, payload):
+        try:
+            self._dispatch(kind, payload)
+        except Exception as e:
+            logger.exception("❌ Lỗi xử lý event %r: %s", kind, e)
+
+    def _pump(self):
+        if not self._running:
+            return
+        self.pump_once()
+        self._after_id = self.root.after(self.interval_ms, self._pump)
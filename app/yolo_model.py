@@ -1,52 +1,35 @@
 # models/yolo_model.py
 """
-Quản lý YOLOv8 model
+Quản lý YOLOv8 model cho GUI: lõi ở food_core.model, thêm đường dẫn mặc định
+từ config và hộp thoại lỗi Tk khi load thất bại.
 """
-from ultralytics import YOLO
-from tkinter import messagebox
 import config
+from food_core.model import YOLOModelManager as CoreModelManager, extract_detections
 
-class YOLOModelManager:
-    def __init__(self, model_path=None):
-        self.model_path = model_path or config.MODEL_PATH
-        self.model = None
-        self.load_model()
+__all__ = ["YOLOModelManager", "extract_detections"]
+
+
+class YOLOModelManager(CoreModelManager):
+    def __init__(self, model_path=None, show_errors=True, load=True):
+        """
+        Args:
+            model_path: Đường dẫn file model (mặc định config.MODEL_PATH)
+            show_errors: Hiện hộp thoại lỗi Tk khi load thất bại (False khi chạy headless
+                         hoặc khi load trên thread nền)
+            load: False để load sau bằng load_model()
+        """
+        self.show_errors = show_errors
+        super().__init__(model_path or config.MODEL_PATH, load=load, preallocate=config.ZERO_COPY_PREPROCESS,
+                         imgsz=config.MODEL_IMGSZ, max_batch=config.DETECT_MAX_BATCH)
     
     def load_model(self):
-        """Load YOLOv8 model"""
-        try:
-            self.model = YOLO(self.model_path)
-            print(f"✅ Model loaded: {self.model_path}")
+        """Load YOLOv8 model, báo lỗi bằng hộp thoại nếu thất bại"""
+        if super().load_model():
             return True
-        except Exception as e:
-            print(f" Lỗi load model: {e}")
+        if self.show_errors:
+            from tkinter import messagebox
             messagebox.showerror(
                 "Lỗi Model", 
-                f"Không thể load model:\n{e}\n\nĐảm bảo file model tồn tại tại:\n{self.model_path}"
+                f"Không thể load model:\n{self.load_error}\n\nĐảm bảo file model tồn tại tại:\n{self.model_path}"
             )
-            return False
-    
-    def detect(self, image, confidence=0.5):
-        """
-        Chạy detection trên ảnh
-        
-        Args:
-            image: Ảnh đầu vào (numpy array)
-            confidence: Ngưỡng confidence
-            
-        Returns:
-            results: Kết quả detection từ YOLO
-        """
-        if self.model is None:
-            return None
-        
-        try:
-            results = self.model(image, conf=confidence)
-            return results[0]
-        except Exception as e:
-            print(f"❌ Lỗi detection: {e}")
-            return None
-    
-    def is_loaded(self):
-        """Kiểm tra model đã được load chưa"""
-        return self.model is not None
\ No newline at end of file
+        return False